@@ -9,6 +9,7 @@ coverage erase
 
 coverage run ./scripts/run_tests.py ./tests/*/*.txt
 coverage run ./scripts/run_tests.py --use-debug ./tests/*/*.txt
+coverage run ./scripts/run_tests.py --use-closures ./tests/*/*.txt
 
 for SCRIPT_FILE in ./tests/*_test.py
 do
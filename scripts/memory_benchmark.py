@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+Reports memory used by compiled translations and by objects allocated during resolution.
+
+Usage: memory_benchmark.py [ENTITY_COUNT]
+"""
+
+import gc
+import os
+import sys
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path[0] = os.path.dirname(DIR)
+
+from yorbay.builder import build_from_standalone_source
+from yorbay import compiler
+
+ENTITY_TEMPLATE = """
+<entity{0}[plural($n)] {{
+    one: "{{{{ $n }}}} item in {{{{ brand }}}} ({0})",
+    *many: "{{{{ $n }}}} items in {{{{ brand.long }}}} ({0})"
+}}
+    title: "Title {{{{ $n * 2 + 1 }}}}"
+>
+"""
+
+HEADER = """
+<plural($n) { $n == 1 ? "one" : "many" }>
+<brand {*short: "Yorbay", long: "Yorbay framework"}>
+"""
+
+
+def get_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError):
+        return None
+
+
+def get_instance_size(obj):
+    size = sys.getsizeof(obj)
+    obj_dict = getattr(obj, '__dict__', None)
+    if obj_dict is not None:
+        size += sys.getsizeof(obj_dict)
+    return size
+
+
+def is_yorbay_object(obj):
+    return getattr(type(obj), '__module__', '').startswith('yorbay.')
+
+
+def measure_objects():
+    gc.collect()
+    count = size = 0
+    for obj in gc.get_objects():
+        if is_yorbay_object(obj):
+            count += 1
+            size += get_instance_size(obj)
+    return count, size
+
+
+def format_size(size):
+    return 'n/a' if size is None else '{0:.1f} MiB'.format(size / 1024.0 / 1024.0)
+
+
+def main():
+    entity_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    source = HEADER + ''.join(ENTITY_TEMPLATE.format(i) for i in xrange(entity_count))
+
+    rss_before = get_rss()
+    l20n = build_from_standalone_source(source)
+    gc.collect()
+    rss_after = get_rss()
+    count, size = measure_objects()
+
+    print 'Entities:                  {0}'.format(entity_count)
+    print 'Compiled objects:          {0}'.format(count)
+    print 'Size of compiled objects:  {0}'.format(format_size(size))
+    if rss_before is not None:
+        print 'Resident size increase:    {0}'.format(format_size(rss_after - rss_before))
+
+    env = l20n.make_env({'n': 5})
+    samples = [
+        ('L20nEnv', env),
+        ('BoundEntity', compiler.CompiledEntryAccess(l20n._entries, 'entity0').evaluate(compiler.ExprEnv(env, ()))),
+        ('BoundMacro', compiler.CompiledEntryAccess(l20n._entries, 'plural').evaluate(compiler.ExprEnv(env, ()))),
+        ('LazyHash', l20n._entries['brand']._content.evaluate(compiler.ExprEnv(env, ()))),
+    ]
+    print
+    print 'Size of objects allocated during resolution:'
+    for name, obj in samples:
+        print '  {0:<24} {1} bytes'.format(name + ':', get_instance_size(obj))
+
+    env = l20n.make_env({'n': 5})
+    gc.collect()
+    before = len(gc.get_objects())
+    for i in xrange(100):
+        env.resolve_entity('entity{0}'.format(i))
+    print 'Tracked objects after resolving 100 entities: {0}'.format(len(gc.get_objects()) - before)
+
+
+if __name__ == '__main__':
+    main()
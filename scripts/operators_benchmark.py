@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+"""
+Measures evaluation of arithmetic- and comparison-heavy expressions, like plural macros.
+
+Usage: operators_benchmark.py [REPEATS]
+"""
+
+import os
+import sys
+import timeit
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path[0] = os.path.dirname(DIR)
+
+from yorbay.builder import build_from_standalone_source
+from yorbay.compiler import get_type
+
+SOURCE = """
+<plural($n) {
+    $n % 10 == 1 && $n % 100 != 11 ? "one" :
+    $n % 10 >= 2 && $n % 10 <= 4 && ($n % 100 < 10 || $n % 100 >= 20) ? "few" :
+    "many"
+}>
+<items[plural($n)] {
+    one: "{{ $n }} item",
+    few: "{{ $n }} items",
+    *many: "{{ $n }} items"
+}>
+<sum "{{ $n + $n * 2 - $n / 4 }} {{ $name + '!' }}">
+"""
+
+VALUES = [None, True, 42, 42L, 4.2, 'str', u'unicode', object()]
+
+
+def measure(func, repeats):
+    return min(timeit.repeat(func, number=repeats, repeat=3)) / repeats * 1e6
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    print 'get_type for {0} values: {1:.2f} us'.format(
+        len(VALUES), measure(lambda: [get_type(value) for value in VALUES], repeats * 10))
+
+    for closures in (False, True):
+        l20n = build_from_standalone_source(SOURCE, closures=closures)
+        backend = 'closures' if closures else 'tree'
+
+        def resolve_items():
+            for n in xrange(25):
+                l20n.make_env({'n': n}).resolve_entity('items')
+
+        def resolve_sum():
+            l20n.make_env({'n': 12, 'name': u'Bob'}).resolve_entity('sum')
+
+        print '{0:<9} plural, 25 counts: {1:.2f} us'.format(backend, measure(resolve_items, repeats))
+        print '{0:<9} arithmetic:        {1:.2f} us'.format(backend, measure(resolve_sum, repeats))
+
+
+if __name__ == '__main__':
+    main()
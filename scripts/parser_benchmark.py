@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures parsing speed in tokens per second, on the given l20n files or on a generated catalog.
+
+Usage: parser_benchmark.py [FILE...]
+"""
+
+import codecs
+import os
+import sys
+import timeit
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path[0] = os.path.dirname(DIR)
+
+from yorbay.debug.parser import DebugParser, DebugTokenizer
+from yorbay.parser import Parser, Tokenizer
+
+ENTRIES_TEMPLATE = u"""
+/* Entries {0} */
+<plural{0}($n) {{ $n == 1 ? "one" : $n % 10 >= 2 && $n % 10 <= 4 ? "few" : "many" }}>
+<brand{0} {{*short: "Yorbay", long: "Yorbay framework"}}>
+<items{0}[plural{0}($n)] {{
+    one: "{{{{ $n }}}} item in {{{{ brand{0}.long }}}}",
+    few: "{{{{ $n }}}} items",
+    *many: "{{{{ $n }}}} items ({{{{ @hour }}}})"
+}}
+    title: "Zażółć gęślą jaźń {{{{ $n * 2 + 1 }}}}"
+>
+<plain{0} "Plain text of entity number {0}, without placeables">
+<paragraph{0} \"\"\"
+    Long paragraphs of translated text contain \\"escaped quotes\\", single {{braces}} and "quotes",
+    as well as escapes like \\u0105 or \\\\. They are placed on several lines, and they may
+    contain a placeable, like {{{{ brand{0} }}}}, followed by even more text to be scanned.
+\"\"\">
+"""
+
+
+class CountingTokenizer(Tokenizer):
+    def __init__(self, source):
+        super(CountingTokenizer, self).__init__(source)
+        self.count = 0
+
+    def next_token(self):
+        self.count += 1
+        return super(CountingTokenizer, self).next_token()
+
+    def next_text_token(self, delim):
+        self.count += 1
+        return super(CountingTokenizer, self).next_text_token(delim)
+
+
+def count_tokens(source):
+    tokenizer = CountingTokenizer(source)
+    Parser(tokenizer).parse_l20n()
+    return tokenizer.count
+
+
+def measure(func):
+    return min(timeit.repeat(func, number=1, repeat=3))
+
+
+def main():
+    if len(sys.argv) > 1:
+        sources = []
+        for path in sys.argv[1:]:
+            with codecs.open(path, encoding='UTF-8') as f:
+                sources.append((path, f.read()))
+    else:
+        sources = [('generated', u''.join(ENTRIES_TEMPLATE.format(i) for i in xrange(5000)))]
+
+    for name, source in sources:
+        tokens = count_tokens(source)
+        print '{0}: {1} characters, {2} tokens'.format(name, len(source), tokens)
+        elapsed = measure(lambda: Parser(Tokenizer(source)).parse_l20n())
+        print '  parser:       {0:.3f} s, {1:.0f} tokens/s'.format(elapsed, tokens / elapsed)
+        elapsed = measure(lambda: DebugParser(DebugTokenizer(source, name)).parse_l20n())
+        print '  debug parser: {0:.3f} s, {1:.0f} tokens/s'.format(elapsed, tokens / elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,15 +4,20 @@ import codecs
 import copy
 import json
 import os
+import shutil
 import sys
+import tempfile
 import traceback
 
 DIR = os.path.dirname(os.path.abspath(__file__))
 
 sys.path[:0] = [os.path.dirname(DIR), os.path.join(DIR, 'lib')]
 
-from yorbay.parser import parse_source, ParserError
-from yorbay.compiler import compile_syntax, link, ErrorWithSource
+from yorbay.builder import compile_source
+from yorbay.cache import DiskCache
+from yorbay.parser import EntryParser, parse_source, ParserError
+from yorbay.compiler import compile_lazily, compile_syntax, link, ErrorWithSource
+from yorbay.fused import compile_fused
 
 from yorbay_json import syntax_to_json
 
@@ -111,7 +116,15 @@ class BadSourceSection(Section):
     def run(self, env):
         try:
             print '{0} * running {1}...'.format(env.step(), self.name)
-            parse_source(self._source, debug=use_debug)
+            if use_lazy:
+                # Errors inside of entries are detected when they are parsed
+                entry_parser = EntryParser(self._source, debug=use_debug)
+                for skimmed in entry_parser.skim():
+                    entry_parser.parse_skimmed(skimmed)
+            elif not use_debug and not use_syntax_tree:
+                compile_fused(self._source)
+            else:
+                parse_source(self._source, debug=use_debug)
         except ParserError:
             pass
         else:
@@ -121,7 +134,7 @@ class BadSourceSection(Section):
 class SourceSection(Section):
     def __init__(self, name, source, syntax):
         super(SourceSection, self).__init__(name)
-        self._source = source
+        self.source = source
         self._syntax_name = syntax
 
     def run(self, env):
@@ -132,17 +145,30 @@ class SourceSection(Section):
                 expected_syntax = env.run_section(self._syntax_name, type=SyntaxSection)
 
             print '{0} * running {1}...'.format(env.step(), self.name)
-            syntax = parse_source(self._source, debug=use_debug)
+            syntax = parse_source(self.source, debug=use_debug)
             if expected_syntax is not None:
                 json_syntax = syntax_to_json(syntax)
                 if json_syntax != expected_syntax:
                     print format_json_diff(expected_syntax, json_syntax),
                     raise Exception('Section ' + self.name + ': source is invalid, got ' + repr(json_syntax) +
                                     ', should be ' + repr(expected_syntax))
+            if use_lazy:
+                check_skimmed(self.name, self.source, syntax)
             return syntax
         except ParserError:
             traceback.print_exc()
-            raise Exception('Section ' + str(self.name) + ': source not parsed: ' + self._source)
+            raise Exception('Section ' + str(self.name) + ': source not parsed: ' + self.source)
+
+
+def check_skimmed(name, source, syntax):
+    entry_parser = EntryParser(source, debug=use_debug)
+    expected = [(syntax_to_json(entry), offset) for entry, offset in zip(syntax.body, syntax.offsets)
+                if entry.__class__.__name__ != 'Comment']
+    actual = [(syntax_to_json(entry_parser.parse_skimmed(skimmed)), skimmed.start)
+              for skimmed in entry_parser.skim()]
+    if actual != expected:
+        raise Exception('Section ' + name + ': source is skimmed incorrectly, got ' + repr(actual) +
+                        ', should be ' + repr(expected))
 
 
 class SyntaxSection(Section):
@@ -213,7 +239,22 @@ class CheckSection(Section):
             context = env.run_section(self._context_name, type=ContextSection)
 
         print '{0} * running {1}...'.format(env.step(), self.name)
-        cstate, import_paths, out_import_cstates = compile_syntax(syntax, debug=use_debug)
+        if use_lazy:
+            entry_parser = EntryParser(env.get_section(self._syntax_name, type=SourceSection).source, debug=use_debug)
+            cstate, import_paths, out_import_cstates = compile_lazily(
+                entry_parser, debug=use_debug, closures=use_closures)
+        elif disk_cache is not None:
+            # Compiled twice, so that the second result is read from the cache
+            source = env.get_section(self._syntax_name, type=SourceSection).source
+            compile_source(source, '', use_debug, use_closures, False, disk_cache)
+            cstate, import_paths, out_import_cstates = compile_source(
+                source, '', use_debug, use_closures, False, disk_cache)
+        elif not use_debug and not use_syntax_tree:
+            source = env.get_section(self._syntax_name, type=SourceSection).source
+            cstate, import_paths, out_import_cstates = compile_fused(source, closures=use_closures)
+        else:
+            cstate, import_paths, out_import_cstates = compile_syntax(
+                syntax, debug=use_debug, closures=use_closures)
         if import_paths:
             raise Exception('Unexpected import paths')
         compiled_l20n = link(cstate)
@@ -484,22 +525,43 @@ def run_file(test_def, step_counter):
 
 
 use_debug = False
+use_closures = False
+use_lazy = False
+use_syntax_tree = False
+disk_cache = None
 
 
 def main():
+    global use_debug, use_closures, use_lazy, use_syntax_tree, disk_cache
+
     test_defs = sys.argv[1:]
-    if test_defs and test_defs[0] == '--use-debug':
-        global use_debug
-        use_debug = True
-        test_defs.pop(0)
-
-    if test_defs:
-        step_counter = StepCounter()
-        for test_def in test_defs:
-            print 'Opening test file {0}...'.format(test_def)
-            run_file(test_def, step_counter)
-    else:
-        print 'No input files'
+    cache_dir = None
+    while test_defs and test_defs[0] in (
+            '--use-debug', '--use-closures', '--use-lazy', '--use-syntax-tree', '--use-disk-cache'):
+        option = test_defs.pop(0)
+        if option == '--use-debug':
+            use_debug = True
+        elif option == '--use-closures':
+            use_closures = True
+        elif option == '--use-lazy':
+            use_lazy = True
+        elif option == '--use-syntax-tree':
+            use_syntax_tree = True
+        else:
+            cache_dir = tempfile.mkdtemp()
+            disk_cache = DiskCache(cache_dir)
+
+    try:
+        if test_defs:
+            step_counter = StepCounter()
+            for test_def in test_defs:
+                print 'Opening test file {0}...'.format(test_def)
+                run_file(test_def, step_counter)
+        else:
+            print 'No input files'
+    finally:
+        if cache_dir is not None:
+            shutil.rmtree(cache_dir)
 
 if __name__ == '__main__':
     main()
@@ -4,6 +4,14 @@ DIR="$( cd "$( dirname "$0" )" && pwd )"
 
 "$DIR/run_tests.py" "$DIR"/../tests/*/*.txt || exit $?
 "$DIR/run_tests.py" --use-debug "$DIR"/../tests/*/*.txt || exit $?
+"$DIR/run_tests.py" --use-closures "$DIR"/../tests/*/*.txt || exit $?
+"$DIR/run_tests.py" --use-syntax-tree "$DIR"/../tests/*/*.txt || exit $?
+"$DIR/run_tests.py" --use-syntax-tree --use-closures "$DIR"/../tests/*/*.txt || exit $?
+"$DIR/run_tests.py" --use-lazy "$DIR"/../tests/*/*.txt || exit $?
+"$DIR/run_tests.py" --use-lazy --use-closures "$DIR"/../tests/*/*.txt || exit $?
+"$DIR/run_tests.py" --use-disk-cache "$DIR"/../tests/*/*.txt || exit $?
+"$DIR/run_tests.py" --use-disk-cache --use-debug "$DIR"/../tests/*/*.txt || exit $?
+"$DIR/run_tests.py" --use-disk-cache --use-closures "$DIR"/../tests/*/*.txt || exit $?
 
 for SCRIPT_TEST in "$DIR"/../tests/*_test.py
 do
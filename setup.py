@@ -1,8 +1,15 @@
+import os.path
+import re
+
 from setuptools import setup, find_packages
 
+# yorbay/__init__.py is not imported, since it imports the whole package
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yorbay', '__init__.py')) as f:
+    version = re.search(r"^__version__ = '(.*)'$", f.read(), re.M).group(1)
+
 setup(
     name='yorbay',
-    version='0.1.dev1',
+    version=version,
     author='Krzysztof Rusek',
     author_email='savix5@gmail.com',
     description='Localization framework based on l20n file format',
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 
 DIR = os.path.dirname(os.path.abspath(__file__))
@@ -9,7 +11,8 @@ DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path[0] = os.path.dirname(DIR)
 
 from yorbay.builder import build_from_path, build_from_standalone_source
-from yorbay.compiler import CircularDependencyError
+from yorbay.cache import DiskCache
+from yorbay.compiler import CircularDependencyError, CompiledEntity, CompiledString
 from yorbay.loader import FsLoader, SimpleLoader, LoaderError
 
 
@@ -79,5 +82,52 @@ class TestCache(unittest.TestCase):
         self.build_success()
 
 
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.loader = DictLoader({
+            'main.l20n': 'import("other.l20n") <main "{{ other }} {{ plural(1) }}">',
+            'other.l20n': '<other "other"> <plural($n) { $n == 1 ? "one" : "many" }>',
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def build(self, **kwargs):
+        return build_from_path('main.l20n', loader=self.loader, cache_dir=self.dir, **kwargs)
+
+    def test_compiled_files_are_stored(self):
+        for kwargs in ({}, {'closures': True}, {}, {'debug': True}):
+            self.assertEqual(self.build(**kwargs).make_env().resolve_entity('main'), 'other one')
+        # Closures are compiled after loading, so they share entries with the tree compilation
+        self.assertEqual(len(os.listdir(self.dir)), 4)
+
+    def test_stored_files_are_used(self):
+        self.build()
+        for name in os.listdir(self.dir):
+            cache = DiskCache(self.dir)
+            key = name[:-len('.pickle')]
+            cstate = cache.get(key)
+            for entry in cstate.entries.values():
+                if isinstance(entry, CompiledEntity):
+                    entry._content = CompiledString('cached')
+            cache.set(key, cstate)
+        self.assertEqual(self.build().make_env().resolve_entity('main'), 'cached')
+
+    def test_corrupt_files_are_rebuilt(self):
+        self.build()
+        for name in os.listdir(self.dir):
+            with open(os.path.join(self.dir, name), 'wb') as f:
+                f.write(b'garbage')
+        self.assertEqual(self.build().make_env().resolve_entity('main'), 'other one')
+        self.assertEqual(self.build().make_env().resolve_entity('main'), 'other one')
+        for name in os.listdir(self.dir):
+            self.assertFalse(DiskCache(self.dir).get(name[:-len('.pickle')]) is None)
+
+    def test_lazy_builds_do_not_use_cache(self):
+        self.build(lazy=True)
+        self.assertEqual(os.listdir(self.dir), [])
+
+
 if __name__ == '__main__':
     unittest.main()
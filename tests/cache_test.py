@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import errno
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path[0] = os.path.dirname(DIR)
+
+from yorbay.cache import DiskCache, LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 100
+        self.cache = LRUCache(3, clock=lambda: self.now)
+
+    def test_get_and_set(self):
+        self.assertEqual(self.cache.get('a'), None)
+        self.assertEqual(self.cache.get('a', 'default'), 'default')
+        self.cache.set('a', 1)
+        self.cache.set('a', 2)
+        self.assertEqual(self.cache.get('a'), 2)
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.info(), (1, 2, 3, 1))
+
+    def test_least_recently_used_item_is_discarded(self):
+        for key in 'abc':
+            self.cache.set(key, key)
+        self.cache.get('a')
+        self.cache.set('d', 'd')
+        self.assertEqual([self.cache.get(key) for key in 'abcd'], ['a', None, 'c', 'd'])
+        self.cache.set('e', 'e')
+        self.assertEqual(self.cache.get('a'), None)
+
+    def test_ttl(self):
+        self.cache.set('a', 1, ttl=5)
+        self.cache.set('b', 2)
+        self.now += 4
+        self.assertEqual(self.cache.get('a'), 1)
+        self.now += 1
+        self.assertEqual(self.cache.get('a'), None)
+        self.assertEqual(self.cache.get('b'), 2)
+
+    def test_clear(self):
+        self.cache.set('a', 1)
+        self.cache.get('a')
+        self.cache.clear()
+        self.assertEqual(self.cache.get('a'), None)
+        self.assertEqual(self.cache.info(), (0, 1, 3, 0))
+
+    def test_invalid_size(self):
+        self.assertRaises(ValueError, LRUCache, 0)
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = DiskCache(os.path.join(self.dir, 'cache'))
+        self.key = self.cache.make_key('<hello "Hello">')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_get_and_set(self):
+        self.assertEqual(self.cache.get(self.key), None)
+        self.assertTrue(self.cache.set(self.key, {'a': [1, 2]}))
+        self.assertEqual(self.cache.get(self.key), {'a': [1, 2]})
+        self.assertEqual(os.listdir(os.path.join(self.dir, 'cache')), [self.key + '.pickle'])
+
+    def test_keys(self):
+        keys = [
+            self.key,
+            self.cache.make_key('<hello "Hi">'),
+            self.cache.make_key('<hello "Hello">', debug=True),
+            self.cache.make_key('<hello "Hello">', 'hello.l20n', debug=True),
+        ]
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertEqual(self.cache.make_key('<hello "Hello">', 'hello.l20n'), self.key)
+
+    def test_corrupt_entries_are_missing(self):
+        self.cache.set(self.key, 'value')
+        path = self.cache.get_path(self.key)
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        for corrupt in (data[:len(data) // 2], b'garbage', b''):
+            with open(path, 'wb') as f:
+                f.write(corrupt)
+            self.assertEqual(self.cache.get(self.key, 'default'), 'default')
+
+        self.cache.set(self.key, 'value')
+        self.assertEqual(self.cache.get(self.key), 'value')
+
+    def test_entries_stored_under_other_keys_are_missing(self):
+        other_key = self.cache.make_key('<other "Other">')
+        self.cache.set(other_key, 'other')
+        shutil.copy(self.cache.get_path(other_key), self.cache.get_path(self.key))
+        self.assertEqual(self.cache.get(self.key), None)
+
+    def test_unpicklable_values_are_not_stored(self):
+        self.assertFalse(self.cache.set(self.key, lambda: None))
+        self.assertEqual(self.cache.get(self.key), None)
+
+    def test_unwritable_directory(self):
+        with open(os.path.join(self.dir, 'file'), 'w'):
+            pass
+        cache = DiskCache(os.path.join(self.dir, 'file'))
+        self.assertFalse(cache.set(self.key, 'value'))
+        self.assertEqual(cache.get(self.key), None)
+
+    def test_failed_removal_of_temporary_file(self):
+        # Entry cannot replace a directory, and its temporary file cannot be removed either
+        os.makedirs(os.path.join(self.cache.get_path(self.key), 'dir'))
+
+        def remove(path):
+            raise OSError(errno.EACCES, 'Permission denied', path)
+
+        original_remove = os.remove
+        os.remove = remove
+        try:
+            self.assertFalse(self.cache.set(self.key, 'value'))
+        finally:
+            os.remove = original_remove
+        self.assertEqual(self.cache.get(self.key), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path[0] = os.path.dirname(DIR)
+
+from yorbay.builder import build_from_standalone_source
+from yorbay.closures import CompiledClosure
+from yorbay.compiler import ErrorWithSource
+from yorbay.context import Context
+from yorbay.globals import Global
+
+
+class MyGlobal(Global):
+    def __init__(self, value):
+        self._value = value
+
+    def get(self):
+        return self._value
+
+
+SOURCE = """
+<plural($n) {
+    $n == 1 ? "one" :
+    $n % 10 >= 2 && $n % 10 <= 4 && ($n % 100 < 10 || $n % 100 >= 20) ? "few" :
+    "many"
+}>
+<factorial($n, $acc) { $n == 0 ? $acc : factorial($n - 1, $acc * $n) }>
+<notMacro "text">
+
+<brand {*short: "Yorbay", long: "Yorbay framework"}>
+<items[plural($n)] {
+    one: "{{ $n }} item in {{ brand }}",
+    few: "{{ $n }} items in {{ brand.long }}",
+    *many: "{{ $n }} items in {{ brand::title }}"
+}>
+<nested[$a, $b] {
+    x: {x: "xx", *y: "xy"},
+    *y: {x: "yx", y: "yy"}
+}>
+<arithmetic "{{ 7 / 2 }} {{ -$n + 2 * 3 }} {{ +$n % 3 }} {{ factorial($n, 1) }}">
+<comparison "{{ $n > 1 && !($n <= 0) || $n == 'x' ? 'yes' : 'no' }}">
+<concat "{{ $a + $b }}">
+<withGlobal "{{ @my }}">
+<withAttrs "value"
+    title: "Title of {{ brand }}"
+    computed: "{{ withAttrs::[$a] }}"
+>
+<withIndexedAttr
+    attr[$a]: {x: "{{ $missing }}", *y: "y"}
+>
+<badIndex["{{ $missing }}"] {*x: "x"}>
+<noDefault[$a] {x: "x"}>
+<callNotMacro "{{ notMacro() }}">
+<attrOfString "{{ ('a')::b }}">
+<propOfVar "{{ $obj.key }}">
+<boolPlaceable "{{ 1 == 1 }}">
+<nullPlaceable "{{ withoutContent }}">
+<withoutContent attr: "">
+<badOperands "{{ 1 + 'a' }}">
+<badNumber "{{ 'a' - 1 }}">
+<badBool "{{ 1 && 1 == 1 }}">
+<divByZero "{{ 1 / ($n - $n) }}">
+<nestedComplex "a{{ 'b{{ $missing }}c' }}d">
+<constantIndex["long"] {short: "{{ brand }}", long: "{{ 'Yorbay' + ' ' + 'framework' }}"}>
+<constantError "{{ (1 == 1 || 1) && 'x' }}">
+<template "Hi {{ $a }}, {{ 25 }} {{ $b }}" title: "{{ $a }}">
+"""
+
+QUERIES = [
+    ('items', {'n': 1}), ('items', {'n': 3}), ('items', {'n': 5}), ('items', {}),
+    ('nested', {'a': 'x', 'b': 'x'}), ('nested', {'a': 'x', 'b': 'z'}), ('nested', {'a': 'z', 'b': 'y'}),
+    ('nested', {'a': 1, 'b': 'y'}),
+    ('arithmetic', {'n': 5}), ('arithmetic', {'n': 2.5}), ('arithmetic', {'n': 'x'}),
+    ('comparison', {'n': 2}), ('comparison', {'n': 0}), ('comparison', {'n': 'x'}),
+    ('concat', {'a': 'x', 'b': 'y'}), ('concat', {'a': 1, 'b': 2}), ('concat', {'a': 1, 'b': 'y'}),
+    ('withGlobal', {}),
+    ('withAttrs', {}), ('withAttrs::title', {}), ('withAttrs::computed', {'a': 'title'}),
+    ('withAttrs::computed', {'a': 'nope'}), ('withAttrs::nope', {}),
+    ('withIndexedAttr::attr', {'a': 'x'}), ('withIndexedAttr::attr', {'a': 'y'}),
+    ('badIndex', {}), ('noDefault', {'a': 'x'}), ('noDefault', {'a': 'z'}),
+    ('callNotMacro', {}), ('attrOfString', {}), ('propOfVar', {'obj': {'key': 'value'}}), ('propOfVar', {'obj': 1}),
+    ('boolPlaceable', {}), ('nullPlaceable', {}), ('withoutContent', {}),
+    ('badOperands', {}), ('badNumber', {}), ('badBool', {}), ('divByZero', {'n': 1}),
+    ('nestedComplex', {}), ('constantIndex', {}), ('constantError', {}),
+    ('template', {'a': 'x', 'b': 2.0}), ('template', {'a': 'x'}), ('template::title', {'a': True}),
+    ('plural', {}), ('noSuchEntity', {}),
+]
+
+
+def resolve(l20n, query, vars):
+    env = l20n.make_env(vars, {'my': MyGlobal('global value')})
+    try:
+        if '::' in query:
+            entity_name, attr_name = query.split('::')
+            return 'value', env.resolve_attribute(entity_name, attr_name)
+        else:
+            return 'value', env.resolve_entity(query)
+    except ErrorWithSource as e:
+        return 'error', type(e.cause), str(e.cause), e.source
+    except StandardError as e:
+        return 'error', type(e), str(e)
+
+
+class TestClosureBackend(unittest.TestCase):
+    def setUp(self):
+        self.tree = build_from_standalone_source(SOURCE)
+        self.closures = build_from_standalone_source(SOURCE, closures=True)
+
+    def test_entries_are_compiled(self):
+        self.assertTrue(isinstance(self.closures._entries['items']._content, CompiledClosure))
+        self.assertTrue(isinstance(self.closures._entries['plural']._expr, CompiledClosure))
+
+    def test_direct_queries_are_preserved(self):
+        self.assertEqual(self.closures.direct_queries, self.tree.direct_queries)
+        self.assertEqual(self.closures.template_queries, self.tree.template_queries)
+
+    def test_same_dependencies_as_tree_backend(self):
+        for query, vars in QUERIES:
+            if query in self.tree.direct_queries:
+                continue
+            try:
+                expected = self.tree.dependencies(query)
+            except NameError:
+                self.assertRaises(NameError, self.closures.dependencies, query)
+            else:
+                self.assertEqual(self.closures.dependencies(query), expected, msg=query)
+
+    def test_same_results_as_tree_backend(self):
+        for query, vars in QUERIES:
+            self.assertEqual(
+                resolve(self.closures, query, vars),
+                resolve(self.tree, query, vars),
+                msg='{0} with {1}'.format(query, vars)
+            )
+
+    def test_lazy_compilation(self):
+        lazy = build_from_standalone_source(SOURCE, closures=True, lazy=True)
+        for query, vars in QUERIES:
+            self.assertEqual(resolve(lazy, query, vars), resolve(self.tree, query, vars),
+                             msg='{0} with {1}'.format(query, vars))
+        self.assertTrue(isinstance(lazy._entries['items']._content, CompiledClosure))
+
+    def test_closures_are_ignored_in_debug_mode(self):
+        l20n = build_from_standalone_source(SOURCE, debug=True, closures=True)
+        self.assertFalse(isinstance(l20n._entries['items']._content, CompiledClosure))
+
+
+class TestContextWithClosures(unittest.TestCase):
+    def test_from_string(self):
+        tr = Context.from_string('<hello "Hello, {{ $name }}!">', closures=True)
+        self.assertEqual(tr('hello', name='world'), 'Hello, world!')
+        self.assertEqual(tr('hello'), 'Hello, {{ $name }}!')
+
+
+if __name__ == '__main__':
+    unittest.main()
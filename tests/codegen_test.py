@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import imp
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path[0] = os.path.dirname(DIR)
+
+from yorbay.builder import build_from_path
+from yorbay.closures import CompiledClosure
+from yorbay.codegen import CodegenError, FORMAT_VERSION, generate_module_source, load_generated_module, write_module
+from yorbay.context import Context
+from yorbay.loader import FsLoader, SimpleLoader, LoaderError
+
+
+class DictLoader(SimpleLoader):
+    def __init__(self, files):
+        super(DictLoader, self).__init__()
+        self.files = files
+
+    def load_source(self, path):
+        try:
+            return self.files[path]
+        except KeyError:
+            raise LoaderError('Not found: {0}'.format(path))
+
+
+FILES = {
+    'main.l20n': u'''
+        import("helper.l20n")
+        import("plural.l20n")
+        <value "from main">
+        <main "{{ helper }} / {{ value }}">
+        <items[plural($n)] {
+            one: "one item",
+            *many: "{{ $n }} items — {{ value }}"
+        }>
+        <unicode "zaż\\u00f3łć">
+        <broken "{{ $missing }}">
+    ''',
+    'helper.l20n': '''
+        import("plural.l20n")
+        <value "from helper">
+        <helper "{{ value }}">
+    ''',
+    'plural.l20n': '''
+        <plural($n) { $n == 1 ? "one" : "many" }>
+    ''',
+}
+
+
+def import_source(name, source):
+    module = imp.new_module(name)
+    exec compile(source, name, 'exec') in module.__dict__
+    return module
+
+
+class TestGeneratedModule(unittest.TestCase):
+    def setUp(self):
+        self.loader = DictLoader(FILES)
+        self.source = generate_module_source('main.l20n', self.loader)
+        # Python 2 clears globals of garbage collected modules, so the module has to be kept alive
+        self.module = import_source('generated', self.source)
+        self.catalog = load_generated_module(self.module)
+        self.expected = build_from_path('main.l20n', self.loader)
+
+    def test_entries_are_compiled_to_functions(self):
+        self.assertTrue(isinstance(self.catalog._entries['main']._content, CompiledClosure))
+
+    def test_direct_queries(self):
+        self.assertEqual(self.catalog.direct_queries, self.expected.direct_queries)
+        self.assertEqual(self.catalog.template_queries, self.expected.template_queries)
+        self.assertEqual(self.catalog.template_queries['broken'], ((u'', u''), (u'missing',)))
+        self.assertEqual(self.catalog.direct_queries['unicode'], u'zaż\xf3łć')
+
+    def test_same_results_as_built_catalog(self):
+        for entity, vars in [('main', {}), ('items', {'n': 1}), ('items', {'n': 5}), ('unicode', {})]:
+            self.assertEqual(
+                self.catalog.make_env(vars).resolve_entity(entity),
+                self.expected.make_env(vars).resolve_entity(entity)
+            )
+
+    def test_dependencies(self):
+        for query in ['main', 'items', 'broken']:
+            self.assertEqual(self.catalog.dependencies(query), self.expected.dependencies(query))
+
+    def test_imported_modules_have_independent_scopes(self):
+        self.assertEqual(self.catalog.make_env().resolve_entity('main'), 'from helper / from main')
+
+    def test_context(self):
+        tr = Context(self.catalog)
+        self.assertEqual(tr('items', n=3), u'3 items — from main')
+        self.assertEqual(tr('broken'), '{{ $missing }}')
+
+    def test_format_version_is_checked(self):
+        module = import_source('generated', self.source)
+        module.format_version = FORMAT_VERSION + 1
+        self.assertRaises(CodegenError, load_generated_module, module)
+
+
+class TestWriteModule(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        sys.path.insert(0, self.tmpdir)
+
+    def tearDown(self):
+        sys.path.remove(self.tmpdir)
+        sys.modules.pop('yorbay_generated_numbers', None)
+        shutil.rmtree(self.tmpdir)
+
+    def test_importable_module(self):
+        write_module('numbers.l20n', os.path.join(self.tmpdir, 'yorbay_generated_numbers.py'),
+                     loader=FsLoader(os.path.join(DIR, 'samples')))
+        tr = Context.from_generated_module('yorbay_generated_numbers')
+        self.assertEqual(tr('thousand'), '1000')
+
+
+if __name__ == '__main__':
+    unittest.main()
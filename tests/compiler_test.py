@@ -9,7 +9,9 @@ DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path[0] = os.path.dirname(DIR)
 
 from yorbay.builder import build_from_path, build_from_standalone_source
-from yorbay.compiler import ErrorWithSource
+from yorbay import closures, compiler
+from yorbay.compiler import ErrorWithSource, CompiledComplexString, CompiledError, CompiledString
+from yorbay.debug import compiler as debug_compiler
 from yorbay.loader import SimpleLoader, LoaderError
 
 
@@ -127,5 +129,242 @@ class TestErrorSource(unittest.TestCase):
         self.assertTrue(str(error).endswith(str(error.cause)))
 
 
+class TestConstantFolding(unittest.TestCase):
+    def setUp(self):
+        self.l20n = build_from_standalone_source("""
+            <concat "{{ 'a' + 'b' }}">
+            <arithmetic "{{ 2 * 3 + 1 }}/{{ 7 / 2 }}">
+            <conditional "{{ 1 == 1 ? 'yes' : $noSuchVar }}">
+            <logical "{{ 1 != 1 && $noSuchVar ? 'yes' : 'no' }}">
+            <indexed["b"] {a: "A", b: "B"}>
+            <indexedDefault["c"] {*a: "A", b: "B"}>
+            <indexedComputed["{{ 'a' + 'b' }}"] {ab: "AB", *c: "C"}>
+            <notFolded "{{ $var + 'b' }}">
+            <typeError "{{ 1 + 'a' }}">
+            <divisionByZero "{{ 1 / 0 }}">
+        """)
+
+    def test_constant_expressions_become_direct_queries(self):
+        self.assertEqual(self.l20n.direct_queries, {
+            'concat': 'ab',
+            'arithmetic': '7/3.5',
+            'conditional': 'yes',
+            'logical': 'no',
+            'indexed': 'B',
+            'indexedDefault': 'A',
+            'indexedComputed': 'AB',
+        })
+        self.assertTrue(isinstance(self.l20n._entries['concat']._content, CompiledString))
+        self.assertTrue(isinstance(self.l20n._entries['notFolded']._content, CompiledComplexString))
+
+    def test_errors_are_raised_lazily(self):
+        self.assertEqual(self.l20n._entries['typeError']._content._content[0].__class__, CompiledError)
+        env = self.l20n.make_env()
+        for entity_name, error_class in [('typeError', TypeError), ('divisionByZero', ZeroDivisionError)]:
+            try:
+                env.resolve_entity(entity_name)
+            except ErrorWithSource as e:
+                self.assertTrue(isinstance(e.cause, error_class), msg=type(e.cause))
+                self.assertEqual(e.source, self.l20n._entries[entity_name]._content._source)
+            else:
+                self.fail()
+
+
+class TestMemoization(unittest.TestCase):
+    def setUp(self):
+        self.env = string_to_env("""
+            <plural($n) { $n == 1 ? "one" : "many" }>
+            <fib($n) { $n < 2 ? $n : fib($n - 1) + fib($n - 2) }>
+            <name "{{ $name }}">
+            <items[plural($n)] {
+                one: "{{ name }} has {{ $n }} item ({{ plural($n) }})",
+                *many: "{{ name }} has {{ $n }} items ({{ plural($n) }}, {{ name }})"
+            }>
+            <fibs "{{ fib(20) }}">
+            <boolArg "{{ plural(1) }} {{ plural(1 == 1) }}">
+        """)
+        self.env.vars.update(n=2, name='Alice')
+
+    def test_entities_and_macro_calls_are_evaluated_once(self):
+        self.assertEqual(self.env.resolve_entity('items'), 'Alice has 2 items (many, Alice)')
+        # items, name, plural(2)
+        self.assertEqual(self.env.memo_misses, 3)
+        self.assertEqual(self.env.memo_hits, 2)
+
+        self.assertEqual(self.env.resolve_entity('items'), 'Alice has 2 items (many, Alice)')
+        self.assertEqual(self.env.memo_misses, 3)
+        self.assertEqual(self.env.memo_hits, 3)
+
+    def test_recursive_macro(self):
+        self.assertEqual(self.env.resolve_entity('fibs'), '6765')
+        self.assertEqual(self.env.memo_misses, 22)
+
+    def test_argument_types_are_distinguished(self):
+        self.assertRaises(ErrorWithSource, self.env.resolve_entity, 'boolArg')
+        self.assertEqual(self.env.memo_hits, 0)
+
+
+class TestDependencies(unittest.TestCase):
+    def setUp(self):
+        self.l20n = build_from_standalone_source("""
+            <plural($n) { $n == 1 ? "one" : "many" }>
+            <brand "{{ $brand }}" title: "{{ @os }}">
+            <items[plural($n)] {
+                one: "{{ $n }} item",
+                *many: "{{ $n }} items in {{ brand }}"
+            }
+                attr: "{{ $other }}"
+            >
+            <loop "{{ loop }}{{ $x }}">
+            <static "static">
+        """)
+
+    def test_transitive_dependencies(self):
+        deps = self.l20n.dependencies('items')
+        self.assertEqual(deps.variables, frozenset(['n', 'brand']))
+        self.assertEqual(deps.globals, frozenset(['os']))
+        self.assertEqual(deps.entities, frozenset(['brand']))
+        self.assertEqual(deps.macros, frozenset(['plural']))
+
+    def test_attribute_dependencies(self):
+        deps = self.l20n.dependencies('items::attr')
+        self.assertEqual(deps.variables, frozenset(['other']))
+        self.assertEqual(deps.entities, frozenset())
+
+    def test_cycles(self):
+        deps = self.l20n.dependencies('loop')
+        self.assertEqual(deps.variables, frozenset(['x']))
+        self.assertEqual(deps.entities, frozenset(['loop']))
+
+    def test_no_dependencies(self):
+        self.assertEqual(self.l20n.dependencies('static'), (frozenset(),) * 4)
+
+    def test_undefined(self):
+        self.assertRaises(NameError, self.l20n.dependencies, 'noSuchEntity')
+        self.assertRaises(NameError, self.l20n.dependencies, 'plural')
+        self.assertRaises(NameError, self.l20n.dependencies, 'items::noSuchAttr')
+
+
+class TestBinding(unittest.TestCase):
+    def setUp(self):
+        self.l20n = build_from_standalone_source("""
+            <brand {*short: "Yorbay", long: "Yorbay framework"}>
+            <twice "{{ brand }} {{ brand }}">
+            <plural($n) { $n == 1 ? "one" : "many" }>
+        """)
+
+    def test_entries_are_bound_once_per_env(self):
+        env = self.l20n.make_env()
+        access = compiler.CompiledEntryAccess(self.l20n._entries, 'brand')
+        self.assertTrue(access.evaluate(env.entity_env) is access.evaluate(env.entity_env))
+        other_env = self.l20n.make_env()
+        self.assertFalse(access.evaluate(env.entity_env) is access.evaluate(other_env.entity_env))
+
+    def test_resolved_hash_does_not_create_lazy_hash(self):
+        env = self.l20n.make_env()
+        content = self.l20n._entries['brand']._content
+        self.assertEqual(content.evaluate_resolved(env.entity_env), 'Yorbay')
+        self.assertTrue(isinstance(content.evaluate(env.entity_env), compiler.LazyHash))
+        self.assertEqual(content.evaluate(env.entity_env)['long'], 'Yorbay framework')
+        self.assertEqual(env.resolve_entity('twice'), 'Yorbay Yorbay')
+
+
+class TestLazyCompilation(unittest.TestCase):
+    SOURCE = """
+        <plural($n) { $n == 1 ? "one" : "many" }>
+        <count($n) { $n > 0 ? count($n - 1) : "done" }>
+        <items[plural($n)] {one: "{{ $n }} item", *many: "{{ $n }} items"} title: "Items" sub: "{{ brand }}">
+        <brand "Yorbay">
+        <unused "{{ $x + 1 }}">
+        <loop "{{ count(3) }}">
+    """
+
+    def setUp(self):
+        self.l20n = build_from_standalone_source(self.SOURCE, lazy=True)
+        self.entries = self.l20n._entries
+
+    def test_entries_are_compiled_on_first_use(self):
+        for name in ('plural', 'items', 'unused'):
+            self.assertTrue(isinstance(self.entries[name], compiler.LazyEntry))
+            self.assertTrue(self.entries[name]._compiled is None)
+
+        env = self.l20n.make_env({'n': 1})
+        self.assertEqual(env.resolve_entity('items'), '1 item')
+        self.assertEqual(env.resolve_attribute('items', 'sub'), 'Yorbay')
+        for name in ('plural', 'items'):
+            self.assertFalse(self.entries[name]._compiled is None)
+        self.assertTrue(self.entries['unused']._compiled is None)
+
+    def test_plain_entities_are_compiled_right_away(self):
+        self.assertTrue(type(self.entries['brand']) is compiler.CompiledEntity)
+        self.assertEqual(self.l20n.direct_queries, {'brand': 'Yorbay'})
+
+    def test_tail_macros(self):
+        self.assertEqual(self.l20n.make_env().resolve_entity('loop'), 'done')
+        self.assertTrue(isinstance(self.entries['count'].get_compiled(), compiler.CompiledTailMacro))
+
+    def test_entries_may_be_inspected(self):
+        self.assertEqual(self.l20n.dependencies('items').macros, frozenset(['plural']))
+        self.assertEqual(sorted(self.entries['items']._attrs), ['sub', 'title'])
+        self.assertEqual(self.entries['plural']._arg_names, ['n'])
+
+    def test_same_results_as_eager_compilation(self):
+        eager = build_from_standalone_source(self.SOURCE)
+        for debug in (False, True):
+            lazy = build_from_standalone_source(self.SOURCE, debug=debug, lazy=True)
+            for name, vars in [('items', {'n': 1}), ('items', {'n': 2}), ('items', {}), ('unused', {'x': 'a'}),
+                               ('loop', {})]:
+                self.assertEqual(self.resolve(lazy, name, vars), self.resolve(eager, name, vars))
+
+    def test_imports(self):
+        l20n = build_from_path('main.l20n', loader=DictLoader({
+            'main.l20n': '''
+                import("helper.l20n")
+                <value "from main">
+                <main "{{ helper }} / {{ value }}">
+            ''',
+            'helper.l20n': '''
+                <value "from helper">
+                <helper "{{ value }}">
+            '''
+        }), lazy=True)
+        self.assertEqual(l20n.make_env().resolve_entity('main'), 'from helper / from main')
+
+    def resolve(self, l20n, name, vars):
+        try:
+            return l20n.make_env(vars).resolve_entity(name)
+        except ErrorWithSource as e:
+            return type(e.cause), e.source
+        except StandardError as e:
+            return type(e), str(e)
+
+
+class TestTypes(unittest.TestCase):
+    def test_subclasses_of_primitive_types(self):
+        class Name(unicode):
+            pass
+
+        self.assertTrue(compiler.get_type(Name(u'x')) is compiler.STRING)
+        self.assertTrue(compiler.get_type(True) is compiler.BOOL)
+
+    def test_object_classes_are_not_cached(self):
+        size = len(compiler._type_table)
+        for _ in xrange(10):
+            obj = type(str('Object'), (object,), {})()
+            self.assertTrue(compiler.get_type(obj) is compiler.OBJECT)
+        self.assertEqual(len(compiler._type_table), size)
+
+
+class TestSlots(unittest.TestCase):
+    def test_runtime_classes_have_no_instance_dict(self):
+        bases = (compiler.CompiledExpr, compiler.CompiledEntry, compiler.Resolvable, compiler.BoundMacro,
+                 compiler.L20nEnv, compiler.ExprEnv, debug_compiler.DebugHook)
+        for module in [compiler, closures, debug_compiler]:
+            for obj in vars(module).itervalues():
+                if isinstance(obj, type) and issubclass(obj, bases):
+                    for cls in obj.__mro__[:-1]:
+                        self.assertTrue('__slots__' in vars(cls), msg='{0} in {1}'.format(cls, obj))
+
+
 if __name__ == '__main__':
     unittest.main()
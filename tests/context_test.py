@@ -1,17 +1,20 @@
 #!/usr/bin/env python
 
 from collections import defaultdict
+import gc
 import os
 import sys
 import unittest
+import weakref
 from StringIO import StringIO
 
 DIR = os.path.dirname(os.path.abspath(__file__))
 
 sys.path[0] = os.path.dirname(DIR)
 
+from yorbay.builder import build_from_standalone_source
 from yorbay.context import Context
-from yorbay.globals import Global
+from yorbay.globals import CONSTANT, PER_REQUEST, Global, every
 from yorbay.loader import LoaderError
 
 
@@ -35,6 +38,15 @@ class MyGlobal(Global):
         return self._value
 
 
+class CountingGlobal(Global):
+    def __init__(self):
+        self.calls = 0
+
+    def get(self):
+        self.calls += 1
+        return self.calls
+
+
 def raise_my_error(*args, **kwargs):
     raise MyError()
 
@@ -123,6 +135,249 @@ class TestContext(unittest.TestCase):
         self.assertRaises(MyError, self.context, 'accessObjKeyProp', obj=defaultdict(raise_my_error))
 
 
+class TestTemplateQueries(unittest.TestCase):
+    def setUp(self):
+        self.errors = []
+        self.context = Context.from_string("""
+            <hello "Hello {{ $name }}, you have {{ $n }} items{{ 5 }}" title: "{{ $name }}">
+            <notTemplate "{{ $name }} {{ brand }}">
+            <brand "Yorbay">
+        """, error_hook=lambda *args: self.errors.append(args))
+
+    def test_template_queries(self):
+        queries = self.context._get_l20n().template_queries
+        self.assertEqual(queries['hello'], (('Hello ', ', you have ', ' items5'), ('name', 'n')))
+        self.assertEqual(queries['hello::title'], (('', ''), ('name',)))
+        self.assertFalse('notTemplate' in queries)
+
+    def test_rendering(self):
+        self.context['name'] = 'Bob'
+        self.assertEqual(self.context('hello', n=3), 'Hello Bob, you have 3 items5')
+        self.assertEqual(self.context('hello', n=2.0), 'Hello Bob, you have 2 items5')
+        self.assertEqual(self.context('hello', n=2.5, name=u'Al'), u'Hello Al, you have 2.5 items5')
+        self.assertEqual(self.context('hello::title'), 'Bob')
+        self.assertEqual(self.context.resolve_many(['hello'], n=1), {'hello': 'Hello Bob, you have 1 items5'})
+        self.assertEqual(self.errors, [])
+
+    def test_errors(self):
+        for vars in [{}, {'name': 'Bob'}, {'name': 'Bob', 'n': True}, {'name': 'Bob', 'n': None}]:
+            del self.errors[:]
+            self.assertEqual(self.context('hello', **vars), 'Hello {{ $name }}, you have {{ $n }} items{{ 5 }}')
+            self.assertEqual(len(self.errors), 1)
+
+    def test_non_ascii_byte_strings(self):
+        self.assertEqual(self.context('hello', name=b'caf\xc3\xa9', n=1), 'hello')
+        self.assertEqual(self.context.prepare('hello')(name=b'caf\xc3\xa9', n=1), 'hello')
+        self.assertEqual(self.context.resolve_many(['hello'], name=b'caf\xc3\xa9', n=1), {'hello': 'hello'})
+        self.assertEqual([error[0] for error in self.errors], [UnicodeDecodeError] * 3)
+        self.assertEqual(self.context('hello', name=b'cafe', n=1), 'Hello cafe, you have 1 items5')
+
+
+class TestSpecialize(unittest.TestCase):
+    def setUp(self):
+        self.context = Context.from_string("""
+            <brand "{{ $brand }}">
+            <hello "{{ $greeting }}, {{ brand }} on {{ @os }}">
+        """, globals={'os': MyGlobal('linux')})
+        self.context['brand'] = 'Yorbay'
+        self.context.specialize('brand')
+
+    def test_constant_vars_are_folded(self):
+        self.assertEqual(self.context('brand'), 'Yorbay')
+        self.assertEqual(self.context('hello', greeting='Hi'), 'Hi, Yorbay on linux')
+        self.assertEqual(self.context._select_l20n({}).direct_queries['brand'], 'Yorbay')
+
+    def test_setting_variable_invalidates_specialization(self):
+        self.assertEqual(self.context('brand'), 'Yorbay')
+        self.context['brand'] = 'Other'
+        self.assertEqual(self.context('brand'), 'Other')
+        del self.context['brand']
+        self.assertEqual(self.context('brand'), '{{ $brand }}')
+
+    def test_overriding_variable_uses_original(self):
+        self.assertEqual(self.context('brand', brand='Other'), 'Other')
+        self.assertEqual(self.context.resolve_many(['brand'], brand='Other'), {'brand': 'Other'})
+        self.assertEqual(self.context.render_column('brand', brand=['A', 'B']), ['A', 'B'])
+
+    def test_only_constant_globals_are_folded(self):
+        self.assertFalse('hello' in self.context._select_l20n({}).template_queries)
+
+        glob = MyGlobal('linux')
+        glob.volatility = CONSTANT
+        self.context = Context(self.context._get_l20n(), globals={'os': glob})
+        self.context['brand'] = 'Yorbay'
+        self.context.specialize('brand')
+        self.assertEqual(self.context._select_l20n({}).template_queries['hello'],
+                         (('', ', Yorbay on linux'), ('greeting',)))
+
+
+class TestGlobalVolatility(unittest.TestCase):
+    def setUp(self):
+        self.counter = CountingGlobal()
+        self.context = Context.from_string("""
+            <counter "{{ @counter }}">
+        """, globals={'counter': self.counter})
+
+    def test_per_call(self):
+        self.assertEqual([self.context('counter') for i in xrange(3)], ['1', '2', '3'])
+
+    def test_per_request(self):
+        self.counter.volatility = PER_REQUEST
+        self.context = Context(self.context._get_l20n(), globals={'counter': self.counter})
+        with self.context.request():
+            self.assertEqual([self.context('counter') for i in xrange(3)], ['1', '1', '1'])
+        with self.context.request():
+            self.assertEqual(self.context('counter'), '2')
+        self.assertEqual([self.context('counter') for i in xrange(2)], ['3', '4'])
+
+    def test_constant(self):
+        self.counter.volatility = CONSTANT
+        self.context = Context(self.context._get_l20n(), globals={'counter': self.counter})
+        self.assertEqual([self.context('counter') for i in xrange(3)], ['1', '1', '1'])
+        with self.context.request():
+            self.assertEqual(self.context('counter'), '1')
+
+
+class TestPrepare(unittest.TestCase):
+    def setUp(self):
+        self.errors = []
+        self.catalogs = {
+            'en': build_from_standalone_source("""
+                <simple "Simple">
+                <hello "Hello, {{ $name }}">
+                <items[$n == 1 ? "one" : "many"] {one: "One item", many: "{{ $n }} items"} title: "Items">
+            """),
+            'pl': build_from_standalone_source("""
+                <simple "Prosty">
+                <hello "Witaj, {{ $name }}">
+                <items[$n == 1 ? "one" : "many"] {one: "Jeden element", many: "{{ $n }} elementy"}>
+            """),
+        }
+        self.lang = 'en'
+        self.context = Context(lambda: self.catalogs[self.lang], error_hook=lambda *args: self.errors.append(args))
+
+    def test_results_are_the_same_as_for_call(self):
+        for query, vars in [('simple', {}), ('hello', {'name': 'Bob'}), ('hello', {'name': None}),
+                            ('items', {'n': 1}), ('items', {'n': 5}), ('items::title', {}),
+                            ('items::nope', {}), ('nope', {})]:
+            del self.errors[:]
+            expected = self.context(query, **vars)
+            expected_errors = len(self.errors)
+            del self.errors[:]
+            prepared = self.context.prepare(query)
+            self.assertEqual(prepared(**vars), expected)
+            self.assertEqual(prepared(**vars), expected)
+            self.assertEqual(len(self.errors), 2 * expected_errors)
+
+    def test_translations_change(self):
+        items, hello = self.context.prepare('items'), self.context.prepare('hello')
+        self.assertEqual(items(n=1), 'One item')
+        self.assertEqual(hello(name='Bob'), 'Hello, Bob')
+        self.lang = 'pl'
+        self.assertEqual(items(n=1), 'Jeden element')
+        self.assertEqual(hello(name='Bob'), 'Witaj, Bob')
+        self.lang = 'en'
+        self.assertEqual(items(n=3), '3 items')
+
+    def test_specialized_translations(self):
+        hello = self.context.prepare('hello')
+        self.context['name'] = 'Alice'
+        self.context.specialize('name')
+        self.assertEqual(hello(), 'Hello, Alice')
+        self.context['name'] = 'Carol'
+        self.assertEqual(hello(), 'Hello, Carol')
+        self.assertEqual(hello(name='Dave'), 'Hello, Dave')
+
+
+class TestResolveMany(unittest.TestCase):
+    def setUp(self):
+        self.counter = CountingGlobal()
+        self.errors = []
+        self.context = Context.from_string("""
+            <plural($n) { $n == 1 ? "one" : "many" }>
+            <items[plural($n)] {one: "{{ $n }} item", *many: "{{ $n }} items"}>
+            <count "{{ @counter }}/{{ items }}" title: "{{ $n }}">
+            <other "{{ @counter }}">
+            <static "static">
+            <broken "{{ $missing }}">
+        """, extra_globals=dict(counter=self.counter), error_hook=lambda *args: self.errors.append(args))
+        self.context['n'] = 1
+
+    def test_resolve_many(self):
+        values = self.context.resolve_many(
+            ['items', 'count', 'count::title', 'other', 'static', 'broken', 'noSuchEntity'], n=3)
+        self.assertEqual(values, {
+            'items': '3 items',
+            'count': '1/3 items',
+            'count::title': '3',
+            'other': '1',
+            'static': 'static',
+            'broken': '{{ $missing }}',
+            'noSuchEntity': 'noSuchEntity',
+        })
+        self.assertEqual(self.counter.calls, 1)
+        self.assertEqual(len(self.errors), 2)
+
+    def test_context_variables(self):
+        self.assertEqual(self.context.resolve_many(['items']), {'items': '1 item'})
+
+
+class TestRenderColumn(unittest.TestCase):
+    SOURCE = """
+        <plural($n) { $n == 1 ? "one" : "many" }>
+        <greeting "Hello, {{ $name }}!">
+        <items[plural($n)] {
+            one: "{{ greeting }} You have {{ $n }} item in {{ $place }}.",
+            *many: "{{ greeting }} You have {{ $n }} items in {{ $place }}."
+        }>
+        <half "{{ $n / 2 }}">
+        <compared "{{ greeting == 'Hello, Bob!' ? 'bob' : $name }}">
+        <static "static" attr: "{{ $name }}">
+        <broken "{{ $missing }}">
+    """
+
+    NAMES = ['Alice', 'Bob', 'Carol', 'Bob', 7, 2.5, None, True, '\x00', ['list'], b'caf\xc3\xa9']
+    NUMBERS = [1, 2, 1, 1.0, 3, True, 1, 2, 1, 5, 1]
+    PLACES = ['home'] * 5 + ['work'] * 6
+
+    def setUp(self):
+        self.errors = []
+        self.context = Context.from_string(self.SOURCE, error_hook=lambda *args: self.errors.append(args))
+        self.context['place'] = 'room'
+
+    def check(self, query, **columns):
+        del self.errors[:]
+        expected = [
+            self.context(query, **dict((name, values[i]) for name, values in columns.iteritems()))
+            for i in xrange(len(self.NAMES))
+        ]
+        expected_errors = len(self.errors)
+        del self.errors[:]
+        self.assertEqual(self.context.render_column(query, **columns), expected)
+        self.assertEqual(len(self.errors), expected_errors)
+
+    def test_same_results_as_call(self):
+        for query in ['greeting', 'items', 'half', 'compared', 'static', 'static::attr', 'broken', 'noSuchEntity']:
+            self.check(query, name=self.NAMES, n=self.NUMBERS)
+            self.check(query, name=self.NAMES, n=self.NUMBERS, place=self.PLACES)
+
+    def test_rows_are_grouped(self):
+        evaluations = []
+        make_env = self.context._get_l20n().make_env
+
+        def counting_make_env(*args):
+            evaluations.append(args)
+            return make_env(*args)
+
+        self.context._get_l20n().make_env = counting_make_env
+        self.context.render_column('items', name=['Alice', 'Bob'] * 50, n=[1, 2, 3, 4] * 25)
+        # One evaluation for n == 1 and one for each other value
+        self.assertEqual(len(evaluations), 4)
+
+    def test_columns_must_have_equal_length(self):
+        self.assertRaises(ValueError, self.context.render_column, 'greeting', name=['a'], n=[1, 2])
+
+
 class TestFromFile(unittest.TestCase):
     def test_load_by_path(self):
         tr = Context.from_file(os.path.join(DIR, 'samples', 'numbers.l20n'))
@@ -161,6 +416,16 @@ class TestErrorHook(unittest.TestCase):
         self.assertTrue(tr('a'), '{{ $missing }}')
         self.assertTrue(isinstance(self.error, NameError))
 
+    def test_error_hook_on_syntax_error_in_lazy_entry(self):
+        errors = []
+        tr = Context.from_string('<b "x {{ $x + }}">\n<c "see {{ b }}">', lazy=True,
+                                 error_hook=lambda exc_type, exc_value, traceback: errors.append(exc_value))
+        for _ in xrange(2):
+            self.assertEqual(tr('b', x=1), 'b')
+            self.assertEqual(tr('c', x=1), 'see {{ b }}')
+        self.assertEqual([type(error).__name__ for error in errors], ['LazySyntaxError'] * 4)
+        self.assertEqual(errors[0].pos.line, 0)
+
     def test_raise_error_hook(self):
         tr = Context.from_file(os.path.join(DIR, 'samples', 'numbers.l20n'), error_hook=self.raise_error)
         self.assertRaises(NameError, tr, 'noSuchEntity')
@@ -215,5 +480,91 @@ class TestGlobals(unittest.TestCase):
         self.assertTrue(context('my'), 'someval')
 
 
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.errors = []
+        globals = {}
+        for name, volatility in (('counter', None), ('request', PER_REQUEST), ('timed', every(10)),
+                                 ('constant', CONSTANT)):
+            globals[name] = CountingGlobal()
+            if volatility is not None:
+                globals[name].volatility = volatility
+        self.context = Context.from_string("""
+            <plural($n) { $n == 1 ? "one" : "many" }>
+            <items[plural($n)] {one: "{{ $n }} item", *many: "{{ $n }} items"}>
+            <counter "{{ @counter }}">
+            <request "{{ @request }}">
+            <timed "{{ @timed }} {{ @constant }}">
+            <constant "{{ @constant }}">
+            <prop "{{ $obj.key }}">
+            <broken "{{ $missing }}">
+        """, extra_globals=globals, error_hook=lambda *args: self.errors.append(args), cache_size=2, cache_ttl=60)
+        self.context._result_cache._clock = lambda: self.now
+        self.context._global_cache._clock = lambda: self.now
+
+    def test_cache_is_disabled_by_default(self):
+        self.assertEqual(Context.from_string('<a "{{ $a }}">').cache_info(), None)
+
+    def test_results_are_cached(self):
+        self.assertEqual(self.context('items', n=1), '1 item')
+        self.assertEqual(self.context('items', n=1, unused='x'), '1 item')
+        self.assertEqual(self.context('items', n=True), 'items')
+        self.assertEqual(self.context('items', n=2), '2 items')
+        self.assertEqual(self.context.cache_info(), (1, 3, 2, 2))
+
+    def test_least_recently_used_results_are_evicted(self):
+        for n in [1, 2, 1, 3, 1, 2]:
+            self.context('items', n=n)
+        self.assertEqual(self.context.cache_info(), (2, 4, 2, 2))
+
+    def test_results_depending_on_globals_fetched_per_call_are_not_cached(self):
+        self.assertEqual(self.context('counter'), '1')
+        self.assertEqual(self.context('counter'), '2')
+        for expected in ('1', '2'):
+            with self.context.request():
+                self.assertEqual(self.context('request'), expected)
+                self.assertEqual(self.context('request'), expected)
+        self.assertEqual(self.context.cache_info().currsize, 0)
+
+    def test_results_depending_on_globals_expire_with_their_periods(self):
+        self.now = 5
+        self.assertEqual(self.context('timed'), '1 1')
+        self.now = 9
+        self.assertEqual(self.context('timed'), '1 1')
+        self.now = 10
+        self.assertEqual(self.context('timed'), '2 1')
+
+    def test_results_depending_on_constant_globals_do_not_expire(self):
+        self.assertEqual(self.context('constant'), '1')
+        self.now = 1000
+        self.assertEqual(self.context('constant'), '1')
+        self.assertEqual(self.context.cache_info().hits, 1)
+
+    def test_uncacheable_variables_and_errors(self):
+        for i in range(2):
+            self.assertEqual(self.context('prop', obj={'key': 'value'}), 'value')
+            self.assertEqual(self.context('broken'), '{{ $missing }}')
+        self.assertEqual(len(self.errors), 2)
+        self.assertEqual(self.context.cache_info().hits, 0)
+
+    def test_specialized_translations_are_not_kept(self):
+        self.context.specialize('n')
+        refs = []
+        for n in xrange(20):
+            self.context['n'] = n
+            self.assertEqual(self.context('items'), '{0} items'.format(n) if n != 1 else '1 item')
+            refs.append(weakref.ref(self.context._select_l20n({})))
+        gc.collect()
+        # Only translations referenced by cached results are alive
+        self.assertTrue(len([ref for ref in refs if ref() is not None]) <= 3)
+        self.assertTrue(len(self.context._cache_specs) <= 3)
+
+    def test_cache_clear(self):
+        self.context('items', n=1)
+        self.context.cache_clear()
+        self.assertEqual(self.context.cache_info(), (0, 0, 2, 0))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import codecs
+import glob
+import os
+import sys
+import unittest
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path[0] = os.path.dirname(DIR)
+
+from yorbay.compiler import compile_syntax
+from yorbay.fused import compile_fused
+from yorbay.parser import ParserError, parse_source
+
+SOURCE = u"""
+/* Comment */
+import("other.l20n")
+<brand "Yorbay">
+<_local "Zażółć gęślą jaźń">
+<plural($n) { $n == 1 ? "one" : $n % 10 >= 2 && $n % 10 <= 4 ? "few" : "many" }>
+<fac($n, $acc) { $n <= 1 ? $acc : (fac)($n - 1, $acc * $n) }>
+<loop($n) { $n ? ~($n - 1) : 1 == 1 ? loop(0) : "never" }>
+<items[plural($n), @hour > 12] {
+    one: {am: "{{ $n }} item", *pm: "{{ $n }} item in {{ brand }}"},
+    *many: "{{ $n }} items"
+}
+    title[~::_short]: {*a: "A {{ 1 + 2 }}{{ "b" }}", b: "B"}
+    _short: "short"
+>
+<folded "{{ true || missing }} {{ 2 < 1 && missing }} {{ -(1) }} {{ !0 }} {{ 1 / 0 }}">
+<access "{{ brand.x }} {{ brand['x'] }} {{ items::title }} {{ (items)::['title'] }} {{ {a: 'b'}.a }}">
+<attrs title: "Title" desc: 'Description'>
+"""
+
+
+def dump(obj, path):
+    # Tree of classes and attributes of compiled objects, in which entries are referred to by name
+    if isinstance(obj, (list, tuple)):
+        return [dump(item, path) for item in obj]
+    if isinstance(obj, dict):
+        if path == '_entries':
+            return 'ENTRIES'
+        return dict((key, dump(value, key)) for key, value in obj.iteritems())
+    if not hasattr(obj, '__slots__'):
+        return obj
+
+    attrs = {}
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, '__slots__', ()):
+            if hasattr(obj, slot):
+                attrs[slot] = dump(getattr(obj, slot), slot)
+    return type(obj).__name__, attrs
+
+
+class TestCompileFused(unittest.TestCase):
+    def check_same_result(self, source, closures=False):
+        expected = compile_syntax(parse_source(source), closures=closures)[0]
+        actual = compile_fused(source, closures=closures)[0]
+        self.assertEqual(actual.import_uris, expected.import_uris)
+        self.assertEqual(dump(actual.entries, ''), dump(expected.entries, ''))
+
+    def test_same_result_as_syntax_tree(self):
+        self.check_same_result(SOURCE)
+
+    def test_same_result_for_samples(self):
+        for path in glob.glob(os.path.join(DIR, 'samples', '*.l20n')):
+            with codecs.open(path, encoding='UTF-8') as f:
+                self.check_same_result(f.read())
+
+    def test_closures(self):
+        cstate = compile_fused(SOURCE, closures=True)[0]
+        self.assertEqual(sorted(cstate.entries), sorted(compile_syntax(parse_source(SOURCE))[0].entries))
+
+    def test_tail_calls(self):
+        entries = compile_fused(SOURCE)[0].entries
+        self.assertEqual(type(entries['fac']).__name__, 'CompiledTailMacro')
+        self.assertEqual(type(entries['loop']).__name__, 'CompiledTailMacro')
+        self.assertEqual(type(entries['plural']).__name__, 'CompiledMacro')
+
+    def test_errors(self):
+        for source in ('<a "{{ 1 }}', '<_m($a) { 1 }>', 'import("{{ a }}")', '<a "{{ $b::c }}">', '<a>'):
+            self.assertRaises(ParserError, compile_fused, source)
+
+
+if __name__ == '__main__':
+    unittest.main()
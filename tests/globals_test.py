@@ -10,7 +10,25 @@ DIR = os.path.dirname(os.path.abspath(__file__))
 
 sys.path[0] = os.path.dirname(DIR)
 
-from yorbay.globals import HourGlobal, OsGlobal
+from yorbay.globals import CONSTANT, PER_CALL, PER_REQUEST, Global, GlobalCache, HourGlobal, OsGlobal, every
+
+
+class CountingGlobal(Global):
+    def __init__(self, volatility):
+        self.volatility = volatility
+        self.calls = 0
+
+    def get(self):
+        self.calls += 1
+        return self.calls
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
 
 
 class TestHour(unittest.TestCase):
@@ -39,6 +57,9 @@ class TestOs(unittest.TestCase):
         for system in ('Java', ''):
             self.assertEqual(self.get(mocked_system=system), 'unknown')
 
+    def test_os_is_constant(self):
+        self.assertTrue(OsGlobal.volatility is CONSTANT)
+
     def get(self, mocked_system):
         system = platform.system
         platform.system = lambda: mocked_system
@@ -48,5 +69,56 @@ class TestOs(unittest.TestCase):
             platform.system = system
 
 
+class TestGlobalCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = GlobalCache(self.clock)
+
+    def get(self, volatility, count):
+        glob = self.cache.wrap({'glob': CountingGlobal(volatility)})['glob']
+        return [glob.get() for i in xrange(count)]
+
+    def test_per_call_globals_are_not_wrapped(self):
+        glob = CountingGlobal(PER_CALL)
+        self.assertTrue(self.cache.wrap({'glob': glob})['glob'] is glob)
+        self.assertEqual(self.get(PER_CALL, 3), [1, 2, 3])
+
+    def test_globals_without_volatility_are_not_wrapped(self):
+        glob = object()
+        self.assertTrue(self.cache.wrap({'glob': glob})['glob'] is glob)
+
+    def test_constant(self):
+        glob = self.cache.wrap({'glob': CountingGlobal(CONSTANT)})['glob']
+        self.assertEqual(glob.get(), 1)
+        self.clock.now = 1e9
+        self.assertEqual(glob.get(), 1)
+        self.assertTrue(glob.volatility is CONSTANT)
+
+    def test_every(self):
+        glob = self.cache.wrap({'glob': CountingGlobal(every(60))})['glob']
+        self.clock.now = 59.5
+        self.assertEqual([glob.get(), glob.get()], [1, 1])
+        self.clock.now = 60.0
+        self.assertEqual([glob.get(), glob.get()], [2, 2])
+        self.clock.now = 119.9
+        self.assertEqual(glob.get(), 2)
+
+    def test_every_requires_positive_period(self):
+        self.assertRaises(ValueError, every, 0)
+
+    def test_per_request(self):
+        glob = self.cache.wrap({'glob': CountingGlobal(PER_REQUEST)})['glob']
+        self.assertEqual([glob.get(), glob.get()], [1, 2])
+        with self.cache.request():
+            self.assertEqual([glob.get(), glob.get()], [3, 3])
+            with self.cache.request():
+                self.assertEqual(glob.get(), 4)
+            self.assertEqual(glob.get(), 3)
+        self.assertEqual(glob.get(), 5)
+
+    def test_hour_is_cached_per_minute(self):
+        self.assertEqual(HourGlobal.volatility.period, 60)
+
+
 if __name__ == '__main__':
     unittest.main()
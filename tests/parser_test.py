@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+import io
+import os
+import sys
+import unittest
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path[0] = os.path.dirname(DIR)
+
+from yorbay.compiler import compile_entries, link
+from yorbay.parser import EntryParser, ParserError, iter_parse_source, parse_source
+from yorbay.syntax import Origin, Position
+
+SOURCE = u'''/* comment */
+import("other.l20n")
+<first "First">
+
+  <second($n) { $n + 1 }>
+<third[$n] {a: "{{ $x }}", *b: "B"}
+    attr: "\\u0105">
+'''
+
+
+class TestEntryOffsets(unittest.TestCase):
+    def test_offsets_point_to_entries(self):
+        syntax = parse_source(SOURCE)
+        self.assertEqual([SOURCE[offset:offset + 7] for offset in syntax.offsets],
+                         [u'/* comm', u'import(', u'<first ', u'<second', u'<third['])
+
+
+class TestEntryParser(unittest.TestCase):
+    def test_entries_are_parsed_at_offsets(self):
+        syntax = parse_source(SOURCE)
+        parser = EntryParser(SOURCE)
+        second = parser.parse(syntax.offsets[3])
+        self.assertEqual(second.id.name, 'second')
+        self.assertEqual([arg.id.name for arg in second.args], ['n'])
+        third = parser.parse(syntax.offsets[4])
+        self.assertEqual(third.attrs[0].value.content, u'\u0105')
+
+    def test_positions_are_the_same_as_in_whole_source(self):
+        syntax = parse_source(SOURCE, path='test.l20n', debug=True)
+        parser = EntryParser(SOURCE, 'test.l20n', debug=True)
+        for entry, offset in zip(syntax.body, syntax.offsets)[2:]:
+            parsed = parser.parse(offset)
+            self.assertEqual(parsed.pos[:2], entry.pos[:2])
+            self.assertEqual(parsed.id.pos[:2], entry.id.pos[:2])
+            self.assertEqual(parsed.pos.origin.path, 'test.l20n')
+
+    def test_origin_is_shared(self):
+        syntax = parse_source(SOURCE, debug=True)
+        parser = EntryParser(SOURCE, debug=True)
+        self.assertTrue(parser.parse(syntax.offsets[2]).pos.origin is parser.parse(syntax.offsets[3]).pos.origin)
+
+
+class TestSkim(unittest.TestCase):
+    def skim(self, source):
+        return [(entry.type, entry.name, source[entry.start:entry.end].rstrip(), entry.value)
+                for entry in EntryParser(source).skim()]
+
+    def test_entries_are_found(self):
+        self.assertEqual([entry[:2] for entry in self.skim(SOURCE)],
+                         [('import', None), ('entity', 'first'), ('macro', 'second'), ('entity', 'third')])
+
+    def test_starts_are_the_same_as_offsets(self):
+        syntax = parse_source(SOURCE)
+        self.assertEqual([entry.start for entry in EntryParser(SOURCE).skim()], syntax.offsets[1:])
+
+    def test_values_of_simple_entities(self):
+        self.assertEqual(self.skim(u'''<a "x"> <b 'y'> <c "\\n"> <d "{{ $x }}"> <e "x" title: "y">'''), [
+            ('entity', 'a', u'<a "x">', u'x'),
+            ('entity', 'b', u"<b 'y'>", u'y'),
+            ('entity', 'c', u'<c "\\n">', None),
+            ('entity', 'd', u'<d "{{ $x }}">', None),
+            ('entity', 'e', u'<e "x" title: "y">', None),
+        ])
+
+    def test_values_of_byte_sources_are_unicode(self):
+        value = EntryParser(b'<a "x">').skim()[0].value
+        self.assertEqual(value, u'x')
+        self.assertTrue(isinstance(value, unicode))
+
+    def test_delimiters_in_strings_and_expressions(self):
+        sources = [
+            u'''<a "{{ '}}>' }}">''',
+            u'''<b """ "> "" """>''',
+            u'''<c "{{ {k: "}>"}.k }}">''',
+            u'''<d($n) { $n > 1 ? "{{ $n }}>" : "}" }>''',
+            u'''<e[$n > 1, x[1]] {a: {b: "}"}}>''',
+        ]
+        self.assertEqual([entry[2] for entry in self.skim(' '.join(sources))], sources)
+
+    def test_errors_are_detected_at_boundaries(self):
+        for source in (u'<a "x"', u'<a "x"> /* comment', u'<a "x"> b', u'< a "x">'):
+            self.assertRaises(ParserError, EntryParser(source).skim)
+
+    def test_errors_inside_of_entries_are_not_detected(self):
+        parser = EntryParser(u'<a "x" + "y"> <b "z">')
+        self.assertEqual([entry.name for entry in parser.skim()], ['a', 'b'])
+        self.assertRaises(ParserError, parser.parse, 0)
+
+    def test_positions_of_errors(self):
+        parser = EntryParser(u'<a "x">\n\n<b "{{ 1 + }}">')
+        try:
+            parser.parse(parser.skim()[1].start)
+        except ParserError as e:
+            self.assertEqual(e.pos[:2], (2, 11))
+        else:
+            self.fail('ParserError not raised')
+
+
+class TestStrings(unittest.TestCase):
+    def parse_value(self, source):
+        return parse_source(source).body[0].value
+
+    def test_segments_are_complete(self):
+        value = self.parse_value(u'<a "x {y} \\"z\\" \\u0105\\\\ \'q\' {{ $v }} w\\{{">')
+        self.assertEqual([item.content for item in value.content[::2]], [u'x {y} "z" \u0105\\ \'q\' ', u' w{{'])
+
+    def test_triple_quoted_strings(self):
+        self.assertEqual(self.parse_value(u'<a """x "y" ""z""" >').content, u'x "y" ""z')
+        self.assertEqual(self.parse_value(u"<a ''''x''y'''>").content, u"'x''y")
+
+    def test_byte_string_sources(self):
+        self.assertEqual(type(self.parse_value(b'<a "x">').content), unicode)
+
+    def test_invalid_escapes(self):
+        for source, column in ((u'<a "xy \\u01">', 7), (u'<a "x\\ud800\\u0105">', 11), (u'<a "x\\', 5)):
+            try:
+                parse_source(source)
+            except ParserError as e:
+                self.assertEqual(e.pos[:2], (0, column), msg=source)
+            else:
+                self.fail('ParserError not raised for {0!r}'.format(source))
+
+
+class TestPosition(unittest.TestCase):
+    def test_line_and_column_of_offset(self):
+        origin = Origin(u'ab\ncd\n\nef', 'test.l20n')
+        positions = [Position.at_offset(offset, origin) for offset in (0, 2, 3, 4, 5, 6, 7, 9)]
+        self.assertEqual([(pos.line, pos.column) for pos in positions],
+                         [(0, 0), (0, 2), (1, 0), (1, 1), (1, 2), (2, 0), (3, 0), (3, 2)])
+        self.assertEqual(origin.lines[positions[-1].line], u'ef')
+
+    def test_position_behaves_like_tuple(self):
+        origin = Origin(u'ab\ncd', '')
+        pos = Position.at_offset(4, origin)
+        self.assertEqual(pos, Position(1, 1, origin))
+        self.assertNotEqual(pos, Position(1, 2, origin))
+        self.assertEqual(tuple(pos), (1, 1, origin))
+        self.assertEqual(pos[:2], (1, 1))
+
+    def test_errors_outside_of_debug_mode(self):
+        try:
+            parse_source(u'<a "x">\r\n<b "y">\n  <c ]>')
+        except ParserError as e:
+            self.assertEqual(e.pos[:2], (2, 5))
+            self.assertEqual(str(e), 'Line 3: Expected identifier, but got "]" instead')
+        else:
+            self.fail('ParserError not raised')
+
+
+
+class TestCompactSyntax(unittest.TestCase):
+    def test_names_are_interned(self):
+        names = {}
+        first = parse_source(u'<a "{{ b }}"> <b {b: "{{ $c }}"}>', names=names).body
+        second = parse_source(u'<c "{{ @b }} {{ b.c }}">', names=names).body
+        self.assertTrue(first[0].value.content[0].name is first[1].id.name)
+        self.assertTrue(first[1].value.content[0].key.name is first[1].id.name)
+        self.assertTrue(second[0].value.content[0].id.name is first[1].id.name)
+        self.assertTrue(second[0].value.content[2].property.name is first[1].value.content[0].value.content[0].id.name)
+
+    def test_complex_strings_refer_to_source(self):
+        source = u'<a "x {{ $y }} z">'
+        value = parse_source(source).body[0].value
+        self.assertTrue(value.excerpt.source is source)
+        self.assertEqual(value.source, u'x {{ $y }} z')
+
+    def test_nodes_have_no_dicts(self):
+        entity = parse_source(u'<a[$i] {b: "{{ 1 + ~.b }}"}>', debug=True).body[0]
+        for node in (entity, entity.id, entity.index[0], entity.value, entity.value.content[0].value):
+            self.assertFalse(hasattr(node, '__dict__'), msg=type(node).__name__)
+            self.assertEqual(node.pos.line, 0)
+
+
+
+class TestIterParseSource(unittest.TestCase):
+    source = SOURCE + u'''<fourth """a {{ first }}
+ b""" title: 'Title'>
+/* closing comment */ <fifth "{{ 1>=3 ? 'x' : 'y' }}">'''
+
+    def test_entries_of_string(self):
+        self.assertEqual([type(entry).__name__ for entry in iter_parse_source(self.source)],
+                         [type(entry).__name__ for entry in parse_source(self.source).body])
+
+    def test_entries_of_file_read_in_chunks(self):
+        expected = link(compile_entries(parse_source(self.source).body)[0]).make_env({'n': u'a', 'x': 2})
+        for chunk_size in (1, 2, 3, 7, 64, 4096):
+            entries = iter_parse_source(io.StringIO(self.source), chunk_size=chunk_size)
+            env = link(compile_entries(entries)[0]).make_env({'n': u'a', 'x': 2})
+            for name in ('first', 'third', 'fourth'):
+                self.assertEqual(env.resolve_entity(name), expected.resolve_entity(name), msg=chunk_size)
+            self.assertEqual(env.resolve_attribute('fourth', 'title'), u'Title')
+            self.assertEqual(env.resolve_entity('fifth'), u'y')
+
+    def test_errors_in_file_read_in_chunks(self):
+        source = u'<a "x">\n/* c */ <b\n  "y"> <c {a: "1",\n  b: 2}>'
+        for chunk_size in (1, 2, 3, 7, 100):
+            try:
+                list(iter_parse_source(io.StringIO(source), chunk_size=chunk_size))
+            except ParserError as e:
+                self.assertEqual(e.pos[:2], (3, 5))
+            else:
+                self.fail('ParserError not raised')
+
+    def test_errors_are_raised_without_reading_further(self):
+        class Source(io.StringIO):
+            reads = 0
+
+            def read(self, size):
+                self.reads += 1
+                return super(Source, self).read(size)
+
+        source = Source(u'<a "x"> <b $> <c "y">' + u'\n<d "z">' * 1000)
+        self.assertRaises(ParserError, list, iter_parse_source(source, chunk_size=64))
+        self.assertEqual(source.reads, 1)
+
+    def test_tokens_split_between_chunks(self):
+        # Entry is invalid, but the part of the source read first ends with a valid one
+        source = u'<a "x">= 1'
+        try:
+            list(iter_parse_source(io.StringIO(source), chunk_size=7))
+        except ParserError as e:
+            self.assertEqual(str(e), 'Line 1: Expected white space after entity value')
+        else:
+            self.fail('ParserError not raised')
+
+
+if __name__ == '__main__':
+    unittest.main()
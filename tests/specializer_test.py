@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path[0] = os.path.dirname(DIR)
+
+from yorbay.builder import build_from_standalone_source
+from yorbay.compiler import CompiledError, CompiledString, ErrorWithSource
+from yorbay.globals import CONSTANT, Global, every
+from yorbay.specializer import specialize
+
+
+class MyGlobal(Global):
+    def __init__(self, value, volatility):
+        self._value = value
+        self.volatility = volatility
+
+    def get(self):
+        return self._value
+
+
+SOURCE = """
+<brand "{{ $brand }}">
+<os {win: "Windows", *other: "Unix"}>
+<hello "Welcome to {{ brand }} on {{ os[@os] }}">
+<greeting "{{ $brand == 'Yorbay' ? 'Hi' : 'Hello' }}, {{ $name }}!">
+<kind[$brand] {Yorbay: "ours", *other: "theirs"}>
+<inMacro "{{ twice($count) }}">
+<twice($n) { $n * $mult }>
+<hour "{{ @hour }}">
+<recursive "{{ recursive }}">
+<broken "{{ $brand - 1 }}">
+<overridden "{{ $mutable.key }}">
+"""
+
+VARS = {'brand': 'Yorbay', 'mult': 2, 'mutable': {'key': 'value'}}
+GLOBALS = {'os': MyGlobal('win', CONSTANT), 'hour': MyGlobal(12, every(60))}
+
+
+def resolve(l20n, query, vars):
+    try:
+        return l20n.make_env(vars, GLOBALS).resolve_entity(query)
+    except ErrorWithSource as e:
+        return type(e.cause), e.source
+
+
+class TestSpecialize(unittest.TestCase):
+    def setUp(self):
+        self.l20n = build_from_standalone_source(SOURCE)
+        self.specialized = specialize(self.l20n, VARS, GLOBALS)
+
+    def test_constant_entities_become_direct_queries(self):
+        self.assertEqual(self.specialized.direct_queries['brand'], 'Yorbay')
+        self.assertEqual(self.specialized.direct_queries['hello'], 'Welcome to Yorbay on Windows')
+        self.assertEqual(self.specialized.direct_queries['kind'], 'ours')
+        self.assertFalse('hello' in self.l20n.direct_queries)
+
+    def test_partially_constant_entities_become_templates(self):
+        self.assertEqual(self.specialized.template_queries['greeting'], (('Hi, ', '!'), ('name',)))
+
+    def test_non_constant_globals_are_not_folded(self):
+        self.assertFalse('hour' in self.specialized.direct_queries)
+        self.assertFalse(isinstance(self.specialized._entries['hour']._content, CompiledString))
+
+    def test_errors_are_raised_lazily(self):
+        self.assertTrue(isinstance(self.specialized._entries['broken']._content._content[0], CompiledError))
+        self.assertEqual(resolve(self.specialized, 'broken', {}), (TypeError, '{{ $brand - 1 }}'))
+
+    def test_results_are_the_same(self):
+        for query in ('brand', 'hello', 'greeting', 'kind', 'inMacro', 'hour', 'broken', 'overridden'):
+            vars = dict(VARS, name='Bob', count=3)
+            self.assertEqual(resolve(self.specialized, query, vars), resolve(self.l20n, query, vars))
+
+    def test_recursive_entities(self):
+        self.assertEqual(resolve(self.specialized, 'recursive', {}), resolve(self.l20n, 'recursive', {}))
+
+    def test_original_is_not_modified(self):
+        self.assertEqual(resolve(self.l20n, 'brand', {'brand': 'Other'}), 'Other')
+        self.assertEqual(resolve(self.l20n, 'hello', {'brand': 'Other'}), 'Welcome to Other on Windows')
+
+    def test_closures(self):
+        l20n = build_from_standalone_source(SOURCE, closures=True)
+        specialized = specialize(l20n, VARS, GLOBALS)
+        self.assertEqual(specialized.direct_queries, l20n.direct_queries)
+        self.assertEqual(resolve(specialized, 'greeting', dict(VARS, name='Bob')), 'Hi, Bob!')
+
+    def test_debug(self):
+        l20n = build_from_standalone_source(SOURCE, debug=True)
+        specialized = specialize(l20n, VARS, GLOBALS)
+        self.assertEqual(resolve(specialized, 'greeting', dict(VARS, name='Bob')), 'Hi, Bob!')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path[0] = os.path.dirname(DIR)
+
+from yorbay.builder import build_from_standalone_source
+from yorbay.context import Context
+from yorbay.specializer import specialize
+from yorbay.stringtable import StringTable, StringTableError, TableEntity, use_string_table, write_string_table
+
+SOURCE = u"""
+<brand "Yorbay">
+<hello "Zażółć gęślą jaźń">
+<welcome "Welcome to {{ brand }}, {{ $name }}">
+<tabs {*short: "Tabs", long: "Browser tabs"}>
+<menu "Menu" title: "Main menu">
+"""
+
+
+class TestStringTable(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'table')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, strings):
+        write_string_table(self.path, strings)
+        return StringTable(self.path)
+
+    def test_lookup(self):
+        strings = dict((u'key{0}'.format(i), u'value ą {0}'.format(i)) for i in xrange(100))
+        strings[u'ęmpty'] = u''
+        table = self.write(strings)
+        for key, value in strings.iteritems():
+            self.assertEqual(table[key], value)
+            self.assertTrue(key in table)
+        self.assertEqual(table.get(u'missing'), None)
+        self.assertEqual(table.get(u'missing', u'default'), u'default')
+        self.assertFalse(u'missing' in table)
+        self.assertRaises(KeyError, lambda: table[u'missing'])
+        self.assertEqual(len(table), len(strings))
+        self.assertEqual(dict(table.iteritems()), strings)
+        self.assertEqual(dict(table), strings)
+        table.close()
+
+    def test_empty_table(self):
+        table = self.write({})
+        self.assertEqual(len(table), 0)
+        self.assertEqual(table.get(u'key'), None)
+        self.assertEqual(list(table), [])
+
+    def test_file_is_replaced(self):
+        old = self.write({u'key': u'old'})
+        new = self.write({u'key': u'new'})
+        self.assertEqual(old[u'key'], u'old')
+        self.assertEqual(new[u'key'], u'new')
+        self.assertEqual(os.listdir(self.dir), ['table'])
+
+    def test_invalid_files(self):
+        header = b'YSTB\x01\x00\x00\x00'
+        for data in (b'', b'YSTB', b'garbage' * 10, b'YSTB\x02\x00\x00\x00' + b'\x00' * 8,
+                     header + b'\x00' * 8, header + b'\x03\x00\x00\x00' + b'\x00' * 64,
+                     header + b'\x04\x00\x00\x00' + b'\x00' * 64):
+            with open(self.path, 'wb') as f:
+                f.write(data)
+            self.assertRaises(StringTableError, StringTable, self.path)
+
+    def test_corrupted_slots(self):
+        self.write({u'key': u'value'})
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:-2])
+        table = StringTable(self.path)
+        self.assertRaises(StringTableError, table.get, u'key')
+        self.assertRaises(StringTableError, list, table.iteritems())
+
+
+class TestUseStringTable(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'table')
+        self.l20n = build_from_standalone_source(SOURCE)
+        write_string_table(self.path, self.l20n.direct_queries)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_direct_queries_are_served_from_table(self):
+        table = StringTable(self.path)
+        l20n = use_string_table(self.l20n, table)
+        self.assertTrue(l20n.direct_queries is table)
+        self.assertTrue(isinstance(l20n._entries['hello'], TableEntity))
+        self.assertFalse(isinstance(l20n._entries['menu'], TableEntity))
+        self.assertFalse(isinstance(l20n._entries['tabs'], TableEntity))
+
+        tr = Context(l20n)
+        self.assertEqual(tr('hello'), u'Zażółć gęślą jaźń')
+        self.assertEqual(tr('welcome', name='Bob'), u'Welcome to Yorbay, Bob')
+        self.assertEqual(tr('tabs'), u'Tabs')
+        self.assertEqual(tr('menu'), u'Menu')
+        self.assertEqual(tr('menu::title'), u'Main menu')
+        self.assertEqual(tr.prepare('brand')(), u'Yorbay')
+
+    def test_specialize(self):
+        table = StringTable(self.path)
+        l20n = specialize(use_string_table(self.l20n, table), vars={'name': 'Bob'})
+        self.assertEqual(Context(l20n)('welcome', name='Bob'), u'Welcome to Yorbay, Bob')
+
+        # Specialized strings are layered over the table, which is not copied
+        queries = l20n.direct_queries
+        self.assertTrue(queries._base is table)
+        self.assertEqual(queries.get('welcome'), u'Welcome to Yorbay, Bob')
+        self.assertEqual(queries.get('hello'), u'Zażółć gęślą jaźń')
+        self.assertEqual(queries.get('missing'), None)
+        self.assertEqual(len(queries), len(table) + 1)
+        self.assertEqual(dict(queries.iteritems()), dict(table.iteritems(), welcome=u'Welcome to Yorbay, Bob'))
+
+    def test_mismatched_table(self):
+        for strings in ({}, dict(self.l20n.direct_queries, brand=u'Other'), dict(self.l20n.direct_queries, x=u'x')):
+            write_string_table(self.path, strings)
+            self.assertRaises(StringTableError, use_string_table, self.l20n, StringTable(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
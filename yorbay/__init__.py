@@ -1,3 +1,5 @@
 from __future__ import unicode_literals
 
-from .context import Context
+__version__ = '0.1.dev1'
+
+from .context import Context  # noqa: __version__ is needed by submodules imported here
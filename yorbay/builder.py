@@ -1,15 +1,43 @@
 from __future__ import unicode_literals
 
-from .compiler import compile_syntax, link
+from .cache import DiskCache
+from .compiler import compile_lazily, compile_syntax, link
 from .exceptions import BuildError
+from .fused import compile_fused
 from .loader import FsLoader
-from .parser import parse_source
+from .parser import EntryParser, parse_source
 
 
 class BuilderError(BuildError):
     pass
 
 
+def _compile_whole_source(source, path, debug, closures, names):
+    if debug:
+        # Debug mode needs positions of syntax nodes, so the syntax tree is built first
+        return compile_syntax(parse_source(source, path=path, debug=True, names=names), debug=True)
+    return compile_fused(source, closures=closures, names=names)
+
+
+def compile_source(source, path, debug, closures, lazy, disk_cache=None, names=None):
+    if lazy:
+        # Skimming is cheap, and lazy entries cannot be pickled anyway
+        return compile_lazily(EntryParser(source, path, debug), debug=debug, closures=closures)
+    if disk_cache is None:
+        return _compile_whole_source(source, path, debug, closures, names)
+
+    key = disk_cache.make_key(source, path, debug)
+    cstate = disk_cache.get(key)
+    if cstate is None:
+        # Closures are compiled after storing, as they cannot be pickled
+        cstate, _, _ = _compile_whole_source(source, path, debug, False, names)
+        disk_cache.set(key, cstate)
+    if closures and not debug:
+        from .closures import compile_closures
+        compile_closures(cstate)
+    return cstate, cstate.import_uris, cstate.import_cstates
+
+
 class Goal(object):
     def __init__(self, path):
         self.path = path
@@ -19,7 +47,7 @@ class Goal(object):
 
 
 class Builder(object):
-    def __init__(self, loader=None, cache=None, debug=False):
+    def __init__(self, loader=None, cache=None, debug=False, closures=False, lazy=False, cache_dir=None):
         if loader is None:
             loader = FsLoader()
 
@@ -28,6 +56,11 @@ class Builder(object):
         self._cstate_cache = cache
         self._goal_cache = {}
         self._debug = debug
+        self._closures = closures
+        self._lazy = lazy
+        self._disk_cache = None if cache_dir is None else DiskCache(cache_dir)
+        # Names of entries, variables and globals are interned across all files of a build
+        self._names = {}
 
     def get_goal(self, path):
         return self._get_goal(self._loader.prepare_path(path))
@@ -74,30 +107,30 @@ class Builder(object):
         if source is None:
             source = self._loader.load_source(goal.path)
 
-        goal.cstate, import_paths, goal.out_import_cstates = compile_syntax(
-            parse_source(source, path=self._loader.format_path(goal.path), debug=self._debug),
-            debug=self._debug
-        )
+        path = self._loader.format_path(goal.path)
+        goal.cstate, import_paths, goal.out_import_cstates = compile_source(
+            source, path, self._debug, self._closures, self._lazy, self._disk_cache, self._names)
         goal.import_goals = [self._get_goal(self._loader.prepare_import_path(goal.path, ipath))
                              for ipath in import_paths]
 
 
-def build_from_source(source, path='', loader=None, cache=None, debug=False):
-    with Builder(loader, cache, debug) as builder:
+def build_from_source(source, path='', loader=None, cache=None, debug=False, closures=False, lazy=False,
+                      cache_dir=None):
+    with Builder(loader, cache, debug, closures, lazy, cache_dir) as builder:
         goal = builder.get_anonymous_goal(source, path)
 
     return link(goal.cstate)
 
 
-def build_from_path(path, loader=None, cache=None, debug=False):
-    with Builder(loader, cache, debug) as builder:
+def build_from_path(path, loader=None, cache=None, debug=False, closures=False, lazy=False, cache_dir=None):
+    with Builder(loader, cache, debug, closures, lazy, cache_dir) as builder:
         goal = builder.get_goal(path)
 
     return link(goal.cstate)
 
 
-def build_from_standalone_source(source, path='', debug=False):
-    cstate, import_paths, _ = compile_syntax(parse_source(source, path=path, debug=debug), debug=debug)
+def build_from_standalone_source(source, path='', debug=False, closures=False, lazy=False):
+    cstate, import_paths, _ = compile_source(source, path, debug, closures, lazy)
     if import_paths:
         raise BuilderError('Encountered imports in standalone build')
     return link(cstate)
@@ -0,0 +1,162 @@
+from __future__ import unicode_literals
+
+from collections import namedtuple
+import cPickle
+import errno
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from . import __version__
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
+# Version of the format of DiskCache entries. It has to be increased whenever compiled classes change,
+# as entries written by older code could be unpickled incorrectly.
+DISK_CACHE_FORMAT_VERSION = 1
+
+# Indexes of fields in the links of the LRU list
+_PREV, _NEXT, _KEY, _VALUE, _EXPIRES = range(5)
+
+
+class LRUCache(object):
+    """
+    Mapping of limited size, which discards least recently used items first. Each item may
+    additionally be given a time to live, after which it is not returned anymore.
+
+    Items are kept in a circular doubly linked list (OrderedDict is not available in Python 2.6),
+    most recently used ones at the end.
+    """
+
+    def __init__(self, maxsize=1024, clock=time.time):
+        if maxsize <= 0:
+            raise ValueError('Cache size must be positive, got {0!r}'.format(maxsize))
+        self._maxsize = maxsize
+        self._clock = clock
+        self._links = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None, None]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            link = self._links.get(key)
+            if link is None or (link[_EXPIRES] is not None and link[_EXPIRES] <= self._clock()):
+                self.misses += 1
+                return default
+
+            self._unlink(link)
+            self._append(link)
+            self.hits += 1
+            return link[_VALUE]
+
+    def set(self, key, value, ttl=None):
+        expires = None if ttl is None else self._clock() + ttl
+        with self._lock:
+            link = self._links.get(key)
+            if link is not None:
+                self._unlink(link)
+            elif len(self._links) >= self._maxsize:
+                oldest = self._root[_NEXT]
+                self._unlink(oldest)
+                del self._links[oldest[_KEY]]
+
+            link = [None, None, key, value, expires]
+            self._append(link)
+            self._links[key] = link
+
+    def clear(self):
+        with self._lock:
+            self._links.clear()
+            self._root[:] = [self._root, self._root, None, None, None]
+            self.hits = self.misses = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self._maxsize, len(self._links))
+
+    def __len__(self):
+        return len(self._links)
+
+    def _unlink(self, link):
+        link[_PREV][_NEXT] = link[_NEXT]
+        link[_NEXT][_PREV] = link[_PREV]
+
+    def _append(self, link):
+        last = self._root[_PREV]
+        link[_PREV] = last
+        link[_NEXT] = self._root
+        last[_NEXT] = self._root[_PREV] = link
+
+
+class DiskCache(object):
+    """
+    Directory of pickled compiled translations, keyed by hashes of their sources (see make_key).
+    Entries which cannot be read are treated as missing, so that they are rebuilt and overwritten.
+
+    Entries are written to temporary files renamed to their final names afterwards, so that processes
+    sharing the directory never read partially written entries. Only trusted directories may be used,
+    as entries are unpickled.
+    """
+
+    def __init__(self, directory):
+        self._directory = directory
+
+    def make_key(self, source, path='', debug=False):
+        # Paths are recorded in debug positions, so they are a part of keys in debug mode only
+        digest = hashlib.sha1()
+        for part in (__version__, unicode(DISK_CACHE_FORMAT_VERSION), 'debug' if debug else '',
+                     path if debug else '', source):
+            part = part.encode('UTF-8')
+            digest.update(b'{0}:'.format(len(part)))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self._directory, key + '.pickle')
+
+    def get(self, key, default=None):
+        try:
+            with open(self.get_path(key), 'rb') as f:
+                stored_key, value = cPickle.load(f)
+        except Exception:
+            # Missing, truncated or otherwise corrupt entry
+            return default
+        return value if stored_key == key else default
+
+    def set(self, key, value):
+        """
+        Store the given value. Return False if it could not be stored, e.g. because it cannot be pickled
+        or the directory is not writable.
+        """
+        try:
+            data = cPickle.dumps((key, value), 2)
+        except (cPickle.PicklingError, TypeError, RuntimeError):  # RuntimeError: recursion too deep
+            return False
+
+        try:
+            if not os.path.isdir(self._directory):
+                try:
+                    os.makedirs(self._directory)
+                except OSError as e:
+                    if e.errno != errno.EEXIST:  # directory may be created by another process meanwhile
+                        raise
+            fd, tmp_path = tempfile.mkstemp(prefix=key + '.', suffix='.tmp', dir=self._directory)
+        except EnvironmentError:
+            return False
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, self.get_path(key))
+        except EnvironmentError:
+            # On Windows, rename fails if another process has already stored the entry
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        return True
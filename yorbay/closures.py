@@ -0,0 +1,618 @@
+from __future__ import division, unicode_literals
+
+import sys
+
+from .compiler import (
+    NULL, BOOL, NUMBER, STRING, OBJECT, get_type, format_number, ErrorWithSource, Handlers, Resolvable,
+    BoundEntity, BoundMacro, LazyHash, HashError, Tail,
+    CompiledEntity, CompiledMacro, CompiledTailMacro, CompiledExpr, CompiledNumber, CompiledNull, CompiledString,
+    CompiledBoolean, CompiledError,
+    CompiledConditional, CompiledEquals, CompiledNotEqual, CompiledLessThan, CompiledLessEqual, CompiledGreaterThan,
+    CompiledGreaterEqual, CompiledAdd, CompiledSubtract, CompiledMultiply, CompiledDivide, CompiledModulo,
+    CompiledAnd, CompiledOr, CompiledNot, CompiledNegative, CompiledPositive, CompiledEntryAccess,
+    CompiledVariableAccess, CompiledLocalAccess, CompiledGlobalAccess, CompiledComplexString, CompiledCall,
+    CompiledTailCall, CompiledPropertyAccess, CompiledAttributeAccess, CompiledHash, DependencyCollector
+)
+
+# Any primitive type - the exact type is known only at runtime
+PRIMITIVE = object()
+
+_number_classes = frozenset((int, long, float))
+_comparable_classes = frozenset((int, long, float, str, unicode))
+_primitive_classes = frozenset((int, long, float, str, unicode, bool, type(None)))
+
+
+# Runtime support for generated code. Each function mirrors a single CompiledExpr.evaluate_* method,
+# including the exact exception types and messages, but starts with a cheap check for the common case.
+
+def resolve(val):
+    if val.__class__ in _primitive_classes:
+        return val
+
+    while isinstance(val, Resolvable):
+        val = val.resolve_once()
+
+    if get_type(val) is OBJECT:
+        raise TypeError('Required primitive type, got {0}'.format(type(val)))
+
+    return val
+
+
+def to_bool(val):
+    if val is True or val is False:
+        return val
+    val = resolve(val)
+    if get_type(val) is not BOOL:
+        raise TypeError('Required boolean, got {0}'.format(type(val)))
+    return val
+
+
+def to_number(val):
+    if val.__class__ in _number_classes:
+        return val
+    val = resolve(val)
+    if get_type(val) is not NUMBER:
+        raise TypeError('Required number, got {0}'.format(type(val)))
+    return val
+
+
+def to_string(val):
+    if val.__class__ is unicode:
+        return val
+    val = resolve(val)
+    if get_type(val) is not STRING:
+        raise TypeError('Required string, got {0}'.format(type(val)))
+    return val
+
+
+def to_placeable(val):
+    val_class = val.__class__
+    if val_class is unicode:
+        return val
+    if val_class is int:
+        return str(val)
+    val = resolve(val)
+    val_type = get_type(val)
+    if val_type is NUMBER:
+        return format_number(val)
+    elif val_type is not STRING:
+        raise TypeError('Required number or string, got {0}'.format(type(val)))
+    return val
+
+
+def check_comparable(left, right):
+    left_type, right_type = get_type(left), get_type(right)
+    if left_type is not right_type or (left_type is not NUMBER and left_type is not STRING):
+        raise TypeError('Required either numbers or strings, got {0} and {1}'.format(type(left), type(right)))
+
+
+def equals(left, right):
+    if left.__class__ is not right.__class__ or left.__class__ not in _comparable_classes:
+        check_comparable(left, right)
+    return left == right
+
+
+def not_equals(left, right):
+    if left.__class__ is not right.__class__ or left.__class__ not in _comparable_classes:
+        check_comparable(left, right)
+    return left != right
+
+
+def add(left, right):
+    if left.__class__ is not right.__class__ or left.__class__ not in _comparable_classes:
+        check_comparable(left, right)
+    return left + right
+
+
+def get_variable(env, name):
+    try:
+        return env.parent.vars[name]
+    except KeyError:
+        raise NameError('Variable "{0}" is not defined'.format(name))
+
+
+def get_global(env, name):
+    lenv = env.parent
+    try:
+        return lenv.accessed_globals[name]
+    except KeyError:
+        try:
+            glob = lenv.globals[name]
+        except KeyError:
+            raise NameError('Global "{0}" is not defined'.format(name))
+        glob = glob.get()
+        lenv.accessed_globals[name] = glob
+        return glob
+
+
+def get_entry(entries, name, env):
+    try:
+        return env.parent.bind(entries[name])
+    except KeyError:
+        raise NameError('Entry "{0}" is not defined'.format(name))
+
+
+def check_macro(callee):
+    if not isinstance(callee, BoundMacro):
+        raise TypeError('Required macro, got {0}'.format(type(callee)))
+    return callee
+
+
+def tail_call(env, args):
+    env.locals = args
+    return Tail
+
+
+def get_attribute(entity, name):
+    if not isinstance(entity, BoundEntity):
+        raise TypeError('Required entity, got {0}'.format(type(entity)))
+    return entity.get_attribute(name)
+
+
+class CompiledClosure(CompiledExpr):
+    """
+    Expression compiled into Python functions. Functions are stored as instance attributes,
+    so that calling them does not involve any method binding.
+    """
+
+    __slots__ = ('evaluate', 'evaluate_resolved', '_direct_string', '_dependencies', '_template')
+
+    def __init__(self, evaluate, evaluate_resolved=None, direct_string=None, dependencies=None, template=None):
+        self.evaluate = evaluate
+        if evaluate_resolved is None:
+            # Slot hides the inherited method, so it has to be bound explicitly
+            evaluate_resolved = CompiledExpr.evaluate_resolved.__get__(self, CompiledClosure)
+        self.evaluate_resolved = evaluate_resolved
+        self._direct_string = direct_string
+        # Expression tree is not available anymore, so direct dependencies are precomputed
+        # as a (variable names, global names, entries, entry names) tuple
+        self._dependencies = dependencies
+        self._template = template
+
+    def get_direct_string(self):
+        return self._direct_string
+
+    def get_template(self):
+        return self._template
+
+    def collect_dependencies(self, collector):
+        if self._dependencies is None:
+            return
+        variables, globals, entries, entry_names = self._dependencies
+        for name in variables:
+            collector.add_variable(name)
+        for name in globals:
+            collector.add_global(name)
+        for name in entry_names:
+            collector.add_entry(entries, name)
+
+
+class DirectDependencyCollector(DependencyCollector):
+    # Does not follow referenced entries, only records their names
+    def __init__(self):
+        super(DirectDependencyCollector, self).__init__()
+        self.entry_names = set()
+
+    def add_entry(self, entries, name):
+        self.entry_names.add(name)
+
+
+VALUE = 'value'
+RESOLVED = 'resolved'
+BOOLEAN = 'bool'
+NUMERIC = 'number'
+TEXT = 'string'
+PLACEABLE = 'placeable'
+
+_mode_converters = {
+    RESOLVED: 'resolve',
+    BOOLEAN: 'to_bool',
+    NUMERIC: 'to_number',
+    TEXT: 'to_string',
+    PLACEABLE: 'to_placeable',
+}
+
+_mode_types = {
+    BOOLEAN: BOOL,
+    NUMERIC: NUMBER,
+    TEXT: STRING,
+}
+
+runtime_names = (
+    'sys', 'resolve', 'to_bool', 'to_number', 'to_string', 'to_placeable', 'equals', 'not_equals', 'add',
+    'get_variable', 'get_global', 'get_entry', 'check_macro', 'tail_call', 'get_attribute', 'format_number',
+    'ErrorWithSource', 'HashError', 'LazyHash', 'CompiledClosure', 'CompiledEntity', 'CompiledMacro',
+    'CompiledTailMacro', 'CompiledString', 'CompiledNumber', 'CompiledNull', 'CompiledBoolean', 'CompiledError',
+)
+
+
+def get_runtime_namespace():
+    module_globals = globals()
+    return dict((name, module_globals[name]) for name in runtime_names)
+
+
+def join_args(items):
+    if len(items) == 1:
+        return '({0},)'.format(items[0])
+    return '({0})'.format(', '.join(items))
+
+
+class ClosureCompiler(object):
+    """
+    Translates compiled entries into Python source code.
+
+    Every entity content, attribute and macro body becomes one generated function (plus helper functions
+    for complex strings and hashes, which need statements). Sub-expressions are inlined as Python expressions,
+    and type checks are omitted wherever the type of an operand is known at compile time.
+
+    Generated code refers to the entry mapping used for name lookups as scope_name, and stores compiled entries
+    in a dict named entries_name.
+    """
+
+    def __init__(self, prefix='_', scope_name='_scope', entries_name='_entries'):
+        self._prefix = prefix
+        self._scope_name = scope_name
+        self._entries_name = entries_name
+        self._lines = []
+        self._counter = 0
+        self._functions = {}
+        self._defined = set()
+
+    def get_source(self):
+        return '\n'.join(self._lines) + '\n'
+
+    def new_name(self):
+        self._counter += 1
+        return '{0}{1}'.format(self._prefix, self._counter)
+
+    def add_entries(self, entries):
+        for name in sorted(entries):
+            self.add_entry(name, entries[name])
+
+    def add_entry(self, name, entry):
+        if type(entry) is CompiledEntity:
+            attrs = ', '.join('{0!r}: {1}'.format(attr_name, self.make_node(attr))
+                              for attr_name, attr in sorted(entry._attrs.iteritems()))
+            value = 'CompiledEntity({0!r}, {1}, {{{2}}})'.format(name, self.make_node(entry._content), attrs)
+        elif type(entry) in (CompiledMacro, CompiledTailMacro):
+            value = '{0}({1!r}, {2!r}, {3})'.format(
+                type(entry).__name__, name, entry._arg_names, self.make_node(entry._expr, resolved=False))
+        else:
+            raise AssertionError('Cannot compile entry: {0!r}'.format(entry))
+
+        self._lines.append('{0}[{1!r}] = {2}'.format(self._entries_name, name, value))
+
+    def make_node(self, node, resolved=True):
+        if type(node) is CompiledString:
+            return 'CompiledString({0!r})'.format(node._value)
+        if type(node) is CompiledNumber:
+            return 'CompiledNumber({0!r})'.format(node._value)
+        if type(node) is CompiledNull:
+            return 'CompiledNull()'
+        if type(node) is CompiledBoolean:
+            return 'CompiledBoolean({0!r})'.format(node._value)
+        if type(node) is CompiledError:
+            return self.make_error(node)
+
+        args = [
+            self.get_function(node, VALUE),
+            self.get_function(node, RESOLVED) if resolved else 'None',
+            repr(node.get_direct_string()),
+            self.make_dependencies(node),
+            repr(node.get_template()),
+        ]
+        while args[-1] == 'None':
+            args.pop()
+        return 'CompiledClosure({0})'.format(', '.join(args))
+
+    def make_dependencies(self, node):
+        collector = DirectDependencyCollector()
+        node.collect_dependencies(collector)
+        if not (collector.variables or collector.globals or collector.entry_names):
+            return 'None'
+        # All entries are looked up in a single scope, see compile_entry_access
+        return '({0!r}, {1!r}, {2}, {3!r})'.format(
+            tuple(sorted(collector.variables)), tuple(sorted(collector.globals)), self._scope_name,
+            tuple(sorted(collector.entry_names)))
+
+    def get_function(self, node, mode):
+        key = id(node), mode
+        try:
+            return self._functions[key][0]
+        except KeyError:
+            pass
+
+        code = self.compile(node, mode)
+        if code.endswith('(env)') and code[:-5] in self._defined:
+            # Expression is a call to another generated function - there is no need to wrap it
+            name = code[:-5]
+        else:
+            name = self.new_name()
+            self.define_function(name, 'return ' + code)
+        # node is stored only to keep id(node) unique
+        self._functions[key] = name, node
+        return name
+
+    def define_function(self, name, *body):
+        self._defined.add(name)
+        self._lines.append('def {0}(env):'.format(name))
+        self._lines.extend('    ' + line for line in body)
+
+    def define_constant(self, value):
+        name = self.new_name()
+        self._lines.append('{0} = {1}'.format(name, value))
+        return name
+
+    def make_error(self, node):
+        # Only built-in exceptions may be raised by folded expressions, so the class is always
+        # accessible by its name
+        assert node._error_class.__module__ == 'exceptions', node._error_class
+        return 'CompiledError({0}, {1!r})'.format(node._error_class.__name__, node._error_args)
+
+    # Expression handlers. Each handler returns a Python expression in the requested mode.
+
+    handlers = Handlers()
+
+    def compile(self, node, mode):
+        handler = self.handlers.select(node)
+        if handler is None:
+            raise AssertionError('Cannot compile node: {0!r}'.format(node))
+        return handler(node, mode)
+
+    def convert(self, code, code_type, mode):
+        if mode is VALUE:
+            return code
+        if mode is RESOLVED:
+            return code if code_type is not None else 'resolve({0})'.format(code)
+        if mode is PLACEABLE:
+            if code_type is STRING:
+                return code
+            if code_type is NUMBER:
+                return 'format_number({0})'.format(code)
+        elif code_type is _mode_types[mode]:
+            return code
+        return '{0}({1})'.format(_mode_converters[mode], code)
+
+    @handlers.register(CompiledNumber)
+    def compile_number(self, node, mode):
+        if mode is PLACEABLE:
+            return repr(format_number(node._value))
+        return self.convert(repr(node._value), NUMBER, mode)
+
+    @handlers.register(CompiledString)
+    def compile_string(self, node, mode):
+        return self.convert(repr(node._value), STRING, mode)
+
+    @handlers.register(CompiledNull)
+    def compile_null(self, node, mode):
+        return self.convert('None', NULL, mode)
+
+    @handlers.register(CompiledBoolean)
+    def compile_boolean(self, node, mode):
+        return self.convert(repr(node._value), BOOL, mode)
+
+    @handlers.register(CompiledError)
+    def compile_error(self, node, mode):
+        # Evaluation always raises, so no conversion is needed
+        return '{0}.evaluate(env)'.format(self.define_constant(self.make_error(node)))
+
+    @handlers.register(CompiledConditional)
+    def compile_conditional(self, node, mode):
+        return '({0} if {1} else {2})'.format(
+            self.compile(node._consequent, mode),
+            self.compile(node._test, BOOLEAN),
+            self.compile(node._alternate, mode)
+        )
+
+    comparison_operators = {
+        'CompiledLessThan': '<',
+        'CompiledLessEqual': '<=',
+        'CompiledGreaterThan': '>',
+        'CompiledGreaterEqual': '>=',
+    }
+
+    @handlers.register(CompiledLessThan)
+    @handlers.register(CompiledLessEqual)
+    @handlers.register(CompiledGreaterThan)
+    @handlers.register(CompiledGreaterEqual)
+    def compile_comparison(self, node, mode):
+        code = '({0} {1} {2})'.format(
+            self.compile(node._left, NUMERIC),
+            self.comparison_operators[type(node).__name__],
+            self.compile(node._right, NUMERIC)
+        )
+        return self.convert(code, BOOL, mode)
+
+    arithmetic_operators = {
+        'CompiledSubtract': '-',
+        'CompiledMultiply': '*',
+        'CompiledDivide': '/',
+        'CompiledModulo': '%',
+    }
+
+    @handlers.register(CompiledSubtract)
+    @handlers.register(CompiledMultiply)
+    @handlers.register(CompiledDivide)
+    @handlers.register(CompiledModulo)
+    def compile_arithmetic(self, node, mode):
+        code = '({0} {1} {2})'.format(
+            self.compile(node._left, NUMERIC),
+            self.arithmetic_operators[type(node).__name__],
+            self.compile(node._right, NUMERIC)
+        )
+        return self.convert(code, NUMBER, mode)
+
+    checked_binary_functions = {
+        'CompiledEquals': ('equals', BOOL),
+        'CompiledNotEqual': ('not_equals', BOOL),
+        'CompiledAdd': ('add', PRIMITIVE),
+    }
+
+    @handlers.register(CompiledEquals)
+    @handlers.register(CompiledNotEqual)
+    @handlers.register(CompiledAdd)
+    def compile_checked_binary(self, node, mode):
+        func, code_type = self.checked_binary_functions[type(node).__name__]
+        code = '{0}({1}, {2})'.format(func, self.compile(node._left, RESOLVED), self.compile(node._right, RESOLVED))
+        return self.convert(code, code_type, mode)
+
+    logical_operators = {
+        'CompiledAnd': 'and',
+        'CompiledOr': 'or',
+    }
+
+    @handlers.register(CompiledAnd)
+    @handlers.register(CompiledOr)
+    def compile_logical(self, node, mode):
+        code = '({0} {1} {2})'.format(
+            self.compile(node._left, BOOLEAN),
+            self.logical_operators[type(node).__name__],
+            self.compile(node._right, BOOLEAN)
+        )
+        return self.convert(code, BOOL, mode)
+
+    @handlers.register(CompiledNot)
+    def compile_not(self, node, mode):
+        return self.convert('(not {0})'.format(self.compile(node._arg, BOOLEAN)), BOOL, mode)
+
+    @handlers.register(CompiledNegative)
+    def compile_negative(self, node, mode):
+        return self.convert('(-{0})'.format(self.compile(node._arg, NUMERIC)), NUMBER, mode)
+
+    @handlers.register(CompiledPositive)
+    def compile_positive(self, node, mode):
+        return self.convert(self.compile(node._arg, NUMERIC), NUMBER, mode)
+
+    @handlers.register(CompiledEntryAccess)
+    def compile_entry_access(self, node, mode):
+        return self.convert('get_entry({0}, {1!r}, env)'.format(self._scope_name, node._name), None, mode)
+
+    @handlers.register(CompiledVariableAccess)
+    def compile_variable_access(self, node, mode):
+        return self.convert('get_variable(env, {0!r})'.format(node._name), None, mode)
+
+    @handlers.register(CompiledLocalAccess)
+    def compile_local_access(self, node, mode):
+        return self.convert('env.locals[{0}]'.format(node._index), None, mode)
+
+    @handlers.register(CompiledGlobalAccess)
+    def compile_global_access(self, node, mode):
+        return self.convert('get_global(env, {0!r})'.format(node._name), None, mode)
+
+    @handlers.register(CompiledComplexString)
+    def compile_complex_string(self, node, mode):
+        if mode is PLACEABLE:
+            # Errors are annotated with source only by the outermost complex string
+            return self.compile_placeables(node)
+
+        key = id(node), TEXT
+        try:
+            name = self._functions[key][0]
+        except KeyError:
+            name = self.new_name()
+            source = self.define_constant(repr(node._source))
+            self.define_function(
+                name,
+                'try:',
+                '    return ' + self.compile_placeables(node),
+                'except ErrorWithSource as e:',
+                '    raise ErrorWithSource(e.cause, {0}), None, sys.exc_info()[2]'.format(source),
+                'except StandardError as e:',
+                '    raise ErrorWithSource(e, {0}), None, sys.exc_info()[2]'.format(source),
+            )
+            self._functions[key] = name, node
+        return self.convert(name + '(env)', STRING, mode)
+
+    def compile_placeables(self, node):
+        items = [self.compile(item, PLACEABLE) for item in node._content]
+        return items[0] if len(items) == 1 else "''.join({0})".format(join_args(items))
+
+    @handlers.register(CompiledCall)
+    def compile_call(self, node, mode):
+        code = 'check_macro({0}).invoke([{1}])'.format(
+            self.compile(node._callee, VALUE),
+            ', '.join(self.compile(arg, VALUE) for arg in node._args)
+        )
+        return self.convert(code, None, mode)
+
+    @handlers.register(CompiledTailCall)
+    def compile_tail_call(self, node, mode):
+        assert mode is VALUE
+        return 'tail_call(env, [{0}])'.format(', '.join(self.compile(arg, VALUE) for arg in node._args))
+
+    @handlers.register(CompiledPropertyAccess)
+    def compile_property_access(self, node, mode):
+        code = '{0}[{1}]'.format(self.compile(node._expr, VALUE), self.compile(node._prop, TEXT))
+        return self.convert(code, None, mode)
+
+    @handlers.register(CompiledAttributeAccess)
+    def compile_attribute_access(self, node, mode):
+        code = 'get_attribute({0}, {1})'.format(self.compile(node._expr, VALUE), self.compile(node._attr, TEXT))
+        return self.convert(code, None, mode)
+
+    @handlers.register(CompiledHash)
+    def compile_hash(self, node, mode):
+        if mode is VALUE:
+            # The hash may be indexed by the caller, so it has to stay lazy
+            items = self.define_constant('{{{0}}}'.format(', '.join(
+                '{0!r}: {1}'.format(key, self.make_node(value)) for key, value in sorted(node._items.iteritems())
+            )))
+            index_item = 'None' if node._index_item is None else self.make_node(node._index_item)
+            default = 'None' if node._default is None else self.make_node(node._default)
+            return 'LazyHash(env, {0}, {1}, {2})'.format(items, index_item, default)
+
+        # Hash is resolved right away, which means that the selected item is computed
+        # directly in the requested mode, without creating LazyHash
+        body = []
+        if node._index_item is not None:
+            items = self.define_constant('{{{0}}}'.format(', '.join(
+                '{0!r}: {1}'.format(key, self.get_function(value, mode))
+                for key, value in sorted(node._items.iteritems())
+            )))
+            body.extend([
+                'try:',
+                '    key = ' + self.compile(node._index_item, TEXT),
+                'except ErrorWithSource as e:',
+                '    raise e.cause, None, sys.exc_info()[2]',
+                'func = {0}.get(key)'.format(items),
+                'if func is not None:',
+                '    return func(env)',
+            ])
+        if node._default is not None:
+            body.append('return ' + self.compile(node._default, mode))
+        elif node._index_item is not None:
+            body.append("raise HashError('Hash key lookup failed. Tried: {0}'.format(key))")
+        else:
+            body.append("raise HashError('Hash has no default item assigned')")
+
+        name = self.new_name()
+        self.define_function(name, *body)
+        return name + '(env)'
+
+
+def compile_entries(entries, scope):
+    """
+    Return a dict of closure-compiled counterparts of the given entries, looking up names in scope.
+    """
+    compiler = ClosureCompiler()
+    compiler.add_entries(entries)
+
+    namespace = get_runtime_namespace()
+    namespace.update(_scope=scope, _entries={})
+    flags = division.compiler_flag | unicode_literals.compiler_flag
+    code = compile(compiler.get_source(), '<yorbay closures>', 'exec', flags, True)
+    exec code in namespace
+    return namespace['_entries']
+
+
+def compile_closures(cstate):
+    """
+    Replace entries of the given compiler state with their closure-compiled counterparts.
+    """
+    compiled = compile_entries(cstate.entries, cstate.collected_entries)
+    cstate.entries.clear()
+    cstate.entries.update(compiled)
+
+
+def compile_closure_entry(entry, scope):
+    return compile_entries({entry._name: entry}, scope)[entry._name]
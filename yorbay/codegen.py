@@ -0,0 +1,127 @@
+from __future__ import unicode_literals
+
+import codecs
+import sys
+
+from .builder import Builder
+from .closures import ClosureCompiler, runtime_names
+from .compiler import link
+from .exceptions import BuildError
+
+# Version of the generated module format. Modules generated with a different version
+# are rejected by load_generated_module, as they may rely on outdated runtime helpers.
+FORMAT_VERSION = 3
+
+
+class CodegenError(BuildError):
+    pass
+
+
+def iter_cstates(cstate):
+    """
+    Yield compiler states of the import graph rooted at cstate. Imported states are always yielded
+    before the states importing them.
+    """
+    visited = set()
+    stack = [(cstate, iter(cstate.import_cstates))]
+    visited.add(id(cstate))
+    while stack:
+        current, imports = stack[-1]
+        for icstate in imports:
+            if id(icstate) not in visited:
+                visited.add(id(icstate))
+                stack.append((icstate, iter(icstate.import_cstates)))
+                break
+        else:
+            stack.pop()
+            yield current
+
+
+def generate_module_source(path, loader=None, cache=None):
+    """
+    Generate the source code of a Python module holding compiled translations of the l20n file
+    found under the given path, together with all of its imports.
+
+    The generated module defines a "catalog" attribute containing CompiledL20n instance ready to be passed
+    to Context constructor.
+    """
+    with Builder(loader, cache) as builder:
+        goal = builder.get_goal(path)
+    l20n = link(goal.cstate)
+
+    lines = [
+        '# Generated by yorbay. Do not edit.',
+        'from __future__ import division, unicode_literals',
+        '',
+        'import sys',
+        '',
+        'from yorbay.closures import {0}'.format(', '.join(name for name in runtime_names if name != 'sys')),
+        'from yorbay.compiler import CompiledL20n',
+        '',
+        'format_version = {0!r}'.format(FORMAT_VERSION),
+    ]
+
+    scope_names = {}
+    for index, cstate in enumerate(iter_cstates(goal.cstate)):
+        prefix = '_s{0}_'.format(index)
+        scope_name, entries_name = prefix + 'scope', prefix + 'entries'
+        scope_names[id(cstate)] = scope_name
+
+        compiler = ClosureCompiler(prefix, scope_name, entries_name)
+        compiler.add_entries(cstate.entries)
+
+        lines.extend(['', '{0} = {{}}'.format(scope_name), '{0} = {{}}'.format(entries_name)])
+        lines.append(compiler.get_source())
+        # Mirror CompilerState.collect: imported entries are overridden by local ones
+        lines.extend('{0}.update({1})'.format(scope_name, scope_names[id(icstate)])
+                     for icstate in cstate.import_cstates)
+        lines.append('{0}.update({1})'.format(scope_name, entries_name))
+
+    lines.extend([
+        '',
+        'direct_queries = {{{0}}}'.format(', '.join(
+            '{0!r}: {1!r}'.format(query, value) for query, value in sorted(l20n.direct_queries.iteritems())
+        )),
+        'template_queries = {{{0}}}'.format(', '.join(
+            '{0!r}: {1!r}'.format(query, value) for query, value in sorted(l20n.template_queries.iteritems())
+        )),
+        '',
+        'catalog = CompiledL20n({0}, direct_queries, template_queries)'.format(scope_names[id(goal.cstate)]),
+    ])
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_module(path, output_path, loader=None):
+    source = generate_module_source(path, loader)
+    with codecs.open(output_path, 'w', encoding='UTF-8') as f:
+        f.write('# coding=utf-8\n')
+        f.write(source)
+
+
+def load_generated_module(module):
+    """
+    Return compiled translations from a module created by write_module. Module may be given either
+    as a module object or as a fully qualified module name.
+    """
+    if isinstance(module, basestring):
+        __import__(module)
+        module = sys.modules[module]
+
+    version = getattr(module, 'format_version', None)
+    if version != FORMAT_VERSION:
+        raise CodegenError('Module {0} was generated with format version {1}, but version {2} is required'.format(
+            module.__name__, version, FORMAT_VERSION))
+
+    return module.catalog
+
+
+def main():
+    if len(sys.argv) != 3:
+        sys.stderr.write('Usage: python -m yorbay.codegen INPUT.l20n OUTPUT.py\n')
+        sys.exit(2)
+    write_module(sys.argv[1], sys.argv[2])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+from __future__ import unicode_literals
+
+import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .compiler import (
+    Handlers, DependencyCollector, CompiledEntity, CompiledComplexString, CompiledConditional, CompiledHash,
+    CompiledEntryAccess, CompiledVariableAccess, format_number
+)
+from .debug.compiler import DebugCompiledExpr, DebugCompiledEntryAccess, DebugCompiledVariableAccess
+
+_key_classes = frozenset((int, long, float, str, unicode, bool, type(None)))
+_number_classes = frozenset((int, long, float))
+_string_classes = frozenset((str, unicode))
+
+_marker_re = re.compile('\x00([0-9]+)\x00')
+
+
+class ColumnAnalyzer(object):
+    """
+    Divides variables used by an expression into control variables, which may affect the evaluation
+    in any way, and text variables, which are only inserted into the output as placeables.
+
+    Results for text variables may be computed by evaluating the expression once with markers in place
+    of their values, and substituting the markers afterwards. Nodes without a dedicated handler are
+    analyzed conservatively - all variables they depend on become control variables.
+    """
+
+    def __init__(self):
+        self.control = set()
+        self.text = set()
+        self._visited = set()
+
+    def get_text_variables(self):
+        return self.text - self.control
+
+    handlers = Handlers()
+
+    def visit(self, node, text):
+        handler = self.handlers.select(node)
+        if handler is not None:
+            handler(node, text)
+        else:
+            collector = DependencyCollector()
+            node.collect_dependencies(collector)
+            self.control.update(collector.variables)
+
+    @handlers.register(CompiledVariableAccess)
+    @handlers.register(DebugCompiledVariableAccess)
+    def visit_variable_access(self, node, text):
+        (self.text if text else self.control).add(node._name)
+
+    @handlers.register(CompiledComplexString)
+    def visit_complex_string(self, node, text):
+        for item in node._content:
+            self.visit(item, text)
+
+    @handlers.register(CompiledConditional)
+    def visit_conditional(self, node, text):
+        self.visit(node._test, False)
+        self.visit(node._consequent, text)
+        self.visit(node._alternate, text)
+
+    @handlers.register(CompiledHash)
+    def visit_hash(self, node, text):
+        if node._index_item is not None:
+            self.visit(node._index_item, False)
+        for item in node._items.itervalues():
+            self.visit(item, text)
+
+    @handlers.register(CompiledEntryAccess)
+    @handlers.register(DebugCompiledEntryAccess)
+    def visit_entry_access(self, node, text):
+        entry = node._entries.get(node._name)
+        if entry is None or (id(entry), text) in self._visited:
+            return
+        self._visited.add((id(entry), text))
+
+        if isinstance(entry, CompiledEntity):
+            # Attributes are accessed only with attribute expressions, which are analyzed conservatively
+            self.visit(entry._content, text)
+        else:
+            collector = DependencyCollector()
+            entry.collect_dependencies(collector)
+            self.control.update(collector.variables)
+
+    @handlers.register(DebugCompiledExpr)
+    def visit_debug_expr(self, node, text):
+        self.visit(node._expr, text)
+
+
+def analyze_query(l20n, query):
+    """
+    Return control variables and text variables of the given query (see ColumnAnalyzer),
+    or None if the query cannot be analyzed.
+    """
+    entity_name, _, attr_name = query.partition('::')
+    entity = l20n._entries.get(entity_name)
+    if not isinstance(entity, CompiledEntity) or (attr_name and attr_name not in entity._attrs):
+        return None
+
+    analyzer = ColumnAnalyzer()
+    analyzer.visit(entity._attrs[attr_name] if attr_name else entity._content, True)
+    return analyzer.control, analyzer.get_text_variables()
+
+
+def to_list(column):
+    if numpy is not None and isinstance(column, numpy.ndarray):
+        return column.tolist()
+    return list(column)
+
+
+def group_rows(columns, row_count):
+    """
+    Group indexes of rows by the values in the given columns. Return a list of (values, indexes) pairs.
+    Rows with values that cannot be grouped safely (e.g. mutable objects) are returned as groups
+    without values.
+    """
+    if not columns:
+        return [((), range(row_count))]
+
+    if (numpy is not None and len(columns) == 1 and isinstance(columns[0], numpy.ndarray) and
+            columns[0].dtype.kind in 'iuf'):
+        keys, inverse = numpy.unique(columns[0], return_inverse=True)
+        order = numpy.argsort(inverse, kind='mergesort')
+        bounds = numpy.cumsum(numpy.bincount(inverse))[:-1]
+        return [((key,), indexes.tolist()) for key, indexes in zip(keys.tolist(), numpy.split(order, bounds))]
+
+    columns = [to_list(column) for column in columns]
+    groups = {}
+    ungrouped = []
+    for index in xrange(row_count):
+        values = tuple(column[index] for column in columns)
+        # Value classes are a part of the key, since e.g. 1 and True are equal
+        for value in values:
+            if value.__class__ not in _key_classes:
+                ungrouped.append((None, [index]))
+                break
+        else:
+            key = tuple(value.__class__ for value in values), values
+            groups.setdefault(key, (values, []))[1].append(index)
+    return groups.values() + ungrouped
+
+
+def make_marker(index):
+    return '\x00{0}\x00'.format(index)
+
+
+def split_template(template, marker_count):
+    """
+    Split the result of an evaluation with markers into a list of literal strings interleaved with
+    marker indexes. Return None if template contains anything that looks like an unknown marker.
+    """
+    parts = _marker_re.split(template)
+    for i in xrange(1, len(parts), 2):
+        parts[i] = int(parts[i])
+        if parts[i] >= marker_count:
+            return None
+    if '\x00' in ''.join(parts[::2]):
+        return None
+    return parts
+
+
+def fill_template(parts, values):
+    """
+    Substitute markers in the template split by split_template with values formatted like placeables.
+    Return None if any of the values cannot be a placeable, or is a byte string which is not ASCII.
+    """
+    texts = []
+    for value in values:
+        value_class = value.__class__
+        if value_class in _string_classes:
+            texts.append(value)
+        elif value_class in _number_classes:
+            texts.append(format_number(value))
+        else:
+            return None
+
+    buf = list(parts)
+    for i in xrange(1, len(buf), 2):
+        buf[i] = texts[buf[i]]
+    try:
+        return ''.join(buf)
+    except UnicodeDecodeError:
+        return None
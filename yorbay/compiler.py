@@ -1,6 +1,8 @@
 from __future__ import division, unicode_literals
 
 import sys
+import threading
+from collections import namedtuple
 
 from .exceptions import BuildError
 from . import syntax
@@ -13,25 +15,54 @@ OBJECT = object()
 
 
 class TailType(object):
-    pass
+    __slots__ = ()
 
 Tail = TailType()
 
 
-def get_type(val):
+# Types of values by their exact classes. Other classes are classified by classify_type, which adds
+# subclasses of primitive types to the table. Object classes are not added, as there may be any number of them.
+_type_table = {
+    type(None): NULL,
+    bool: BOOL,
+    int: NUMBER,
+    long: NUMBER,
+    float: NUMBER,
+    str: STRING,
+    unicode: STRING,
+    dict: OBJECT,
+}
+_lookup_type = _type_table.get
+
+
+def classify_type(val):
     # Caution: compiler expects that val[str] raises TypeError if get_type(val) is not OBJECT.
     # If this assumption ever becomes false, the compiler should check if get_type(val is OBJECT
     # prior to calling val[str].
 
     if val is None:
-        return NULL
-    if isinstance(val, bool):
-        return BOOL
-    if isinstance(val, basestring):
-        return STRING
-    if isinstance(val, (int, long, float)):
-        return NUMBER
-    return OBJECT
+        val_type = NULL
+    elif isinstance(val, bool):
+        val_type = BOOL
+    elif isinstance(val, basestring):
+        val_type = STRING
+    elif isinstance(val, (int, long, float)):
+        val_type = NUMBER
+    else:
+        return OBJECT
+    _type_table[val.__class__] = val_type
+    return val_type
+
+
+def get_type(val):
+    return _lookup_type(val.__class__) or classify_type(val)
+
+
+def format_number(value):
+    value = str(value)
+    if value.endswith('.0'):
+        value = value[:-2]
+    return value
 
 
 class ErrorWithSource(Exception):
@@ -43,12 +74,49 @@ class ErrorWithSource(Exception):
         return str(self.cause)
 
 
+_memo_arg_classes = frozenset((int, long, float, str, unicode, bool, type(None)))
+_missing = object()
+
+
+def make_memo_key(macro, args):
+    # Only calls with primitive arguments are memoized. Argument classes are part of the key,
+    # since e.g. 1 and True are equal, but macro results for them differ.
+    classes = tuple([arg.__class__ for arg in args])
+    for cls in classes:
+        if cls not in _memo_arg_classes:
+            return None
+    return macro, tuple(args), classes
+
+
 class L20nEnv(object):
+    """
+    Environment of a single resolution. Variables and globals do not change during its lifetime,
+    so values of entities and results of macro calls are memoized in the memo dict. memo_hits and
+    memo_misses count how many evaluations were skipped and performed, respectively.
+
+    Entries are bound at most once per environment, and all entities share a single expression
+    environment (entity_env), since entities have no local variables.
+    """
+
+    __slots__ = ('_entries', 'vars', 'globals', 'accessed_globals', 'memo', 'memo_hits', 'memo_misses',
+                 '_bound', 'entity_env')
+
     def __init__(self, entries, vars, globals):
         self._entries = entries
         self.vars = vars
         self.globals = globals
         self.accessed_globals = {}
+        self.memo = {}
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self._bound = {}
+        self.entity_env = ExprEnv(self, ())
+
+    def bind(self, entry):
+        bound = self._bound.get(entry)
+        if bound is None:
+            bound = self._bound[entry] = entry.bind(self)
+        return bound
 
     def _get_entity(self, entity_name):
         try:
@@ -57,8 +125,10 @@ class L20nEnv(object):
             raise NameError('Entity "{0}" is not defined'.format(entity_name))
 
         if isinstance(entry, CompiledEntity):
-            return entry.bind(self)
+            return self.bind(entry)
         else:
+            if isinstance(entry, LazyEntry):
+                entry = entry.get_compiled()
             raise TypeError('Not an entity: {0}'.format(type(entry)))
 
     def resolve_entity(self, entity_name):
@@ -76,10 +146,76 @@ class ExprEnv(object):
         self.locals = locals
 
 
+Dependencies = namedtuple('Dependencies', 'variables globals entities macros')
+
+
+class DependencyCollector(object):
+    """
+    Collects names of variables, globals, entities and macros used by expressions. Referenced
+    entries are followed, so the result is transitive.
+    """
+
+    def __init__(self):
+        self.variables = set()
+        self.globals = set()
+        self.entities = set()
+        self.macros = set()
+        self._visited = set()
+
+    def add_variable(self, name):
+        self.variables.add(name)
+
+    def add_global(self, name):
+        self.globals.add(name)
+
+    def add_entry(self, entries, name):
+        entry = entries.get(name)
+        if entry is None or id(entry) in self._visited:
+            return
+        self._visited.add(id(entry))
+        entry.collect_dependencies(self)
+
+    def get_dependencies(self):
+        return Dependencies(
+            frozenset(self.variables), frozenset(self.globals), frozenset(self.entities), frozenset(self.macros))
+
+
 class CompiledL20n(object):
-    def __init__(self, entries, direct_queries):
+    def __init__(self, entries, direct_queries, template_queries=None):
         self._entries = entries
         self.direct_queries = direct_queries
+        # Queries whose values are complex strings with only variables as placeables, mapped to
+        # their templates (see CompiledComplexString.get_template)
+        self.template_queries = {} if template_queries is None else template_queries
+        self._dependencies = {}
+
+    def dependencies(self, query):
+        """
+        Return Dependencies of the given entity or attribute ("entity::attr" query). Entities and macros
+        referenced by the query are analyzed as a whole, so the result may contain names that are not used
+        by every resolution of the query, but never misses a name that is.
+        """
+        try:
+            return self._dependencies[query]
+        except KeyError:
+            pass
+
+        entity_name, _, attr_name = query.partition('::')
+        entity = self._entries.get(entity_name)
+        if not isinstance(entity, CompiledEntity):
+            raise NameError('Entity "{0}" is not defined'.format(entity_name))
+        if attr_name:
+            try:
+                expr = entity._attrs[attr_name]
+            except KeyError:
+                raise NameError('Attribute "{0}" is not defined'.format(attr_name))
+        else:
+            expr = entity._content
+
+        collector = DependencyCollector()
+        expr.collect_dependencies(collector)
+        deps = self._dependencies[query] = collector.get_dependencies()
+        return deps
 
     def make_env(self, vars=None, globals=None):
         if vars is None:
@@ -90,25 +226,45 @@ class CompiledL20n(object):
 
 
 class Resolvable(object):
+    __slots__ = ()
+
     def resolve_once(self):
         raise NotImplementedError
 
 
 class CompiledEntry(object):
+    __slots__ = ()
+
     def bind(self, lenv):
         raise NotImplementedError
 
     def populate_direct_queries(self, queries):
         raise NotImplementedError
 
+    def populate_template_queries(self, queries):
+        raise NotImplementedError
+
+    def collect_dependencies(self, collector):
+        raise NotImplementedError
+
 
 class BoundEntity(Resolvable):
+    __slots__ = ('_entity', '_env')
+
     def __init__(self, entity, lenv):
         self._entity = entity
-        self._env = ExprEnv(lenv, ())
+        self._env = lenv.entity_env
 
     def resolve(self):
-        return self._entity._content.evaluate_resolved(self._env)
+        lenv = self._env.parent
+        value = lenv.memo.get(self._entity, _missing)
+        if value is _missing:
+            value = self._entity._content.evaluate_resolved(self._env)
+            lenv.memo[self._entity] = value
+            lenv.memo_misses += 1
+        else:
+            lenv.memo_hits += 1
+        return value
 
     resolve_once = resolve
 
@@ -120,7 +276,16 @@ class BoundEntity(Resolvable):
             attr = self._entity._attrs[name]
         except KeyError:
             raise NameError('Attribute "{0}" is not defined'.format(name))
-        return attr.evaluate(self._env)
+
+        lenv = self._env.parent
+        value = lenv.memo.get(attr, _missing)
+        if value is _missing:
+            value = attr.evaluate(self._env)
+            lenv.memo[attr] = value
+            lenv.memo_misses += 1
+        else:
+            lenv.memo_hits += 1
+        return value
 
     def resolve_attribute(self, name):
         try:
@@ -131,6 +296,8 @@ class BoundEntity(Resolvable):
 
 
 class CompiledEntity(CompiledEntry):
+    __slots__ = ('_name', '_content', '_attrs')
+
     def __init__(self, name, content, attrs):
         self._name = name
         self._content = content
@@ -148,19 +315,53 @@ class CompiledEntity(CompiledEntry):
             if direct_string is not None:
                 queries['{0}::{1}'.format(self._name, attr_name)] = direct_string
 
+    def populate_template_queries(self, queries):
+        template = self._content.get_template()
+        if template is not None:
+            queries[self._name] = template
+        for attr_name, attr_expr in self._attrs.iteritems():
+            template = attr_expr.get_template()
+            if template is not None:
+                queries['{0}::{1}'.format(self._name, attr_name)] = template
+
+    def collect_dependencies(self, collector):
+        collector.entities.add(self._name)
+        self._content.collect_dependencies(collector)
+        for attr_expr in self._attrs.itervalues():
+            attr_expr.collect_dependencies(collector)
+
 
 class BoundMacro(object):
+    __slots__ = ('_macro', '_lenv')
+
     def __init__(self, macro, lenv):
         self._macro = macro
         self._lenv = lenv
 
     def invoke(self, args):
+        key = make_memo_key(self._macro, args)
+        if key is None:
+            return self.invoke_uncached(args)
+
+        lenv = self._lenv
+        value = lenv.memo.get(key, _missing)
+        if value is _missing:
+            value = self.invoke_uncached(args)
+            lenv.memo[key] = value
+            lenv.memo_misses += 1
+        else:
+            lenv.memo_hits += 1
+        return value
+
+    def invoke_uncached(self, args):
         if len(args) != len(self._macro._arg_names):
             raise TypeError('Required {0} argument(s), got {1}'.format(len(self._macro._arg_names), len(args)))
         return self._macro._expr.evaluate(ExprEnv(self._lenv, args))
 
 
 class CompiledMacro(CompiledEntry):
+    __slots__ = ('_name', '_arg_names', '_expr')
+
     def __init__(self, name, arg_names, expr):
         self._name = name
         self._arg_names = arg_names
@@ -172,9 +373,18 @@ class CompiledMacro(CompiledEntry):
     def populate_direct_queries(self, queries):
         pass
 
+    def populate_template_queries(self, queries):
+        pass
+
+    def collect_dependencies(self, collector):
+        collector.macros.add(self._name)
+        self._expr.collect_dependencies(collector)
+
 
 class BoundTailMacro(BoundMacro):
-    def invoke(self, args):
+    __slots__ = ()
+
+    def invoke_uncached(self, args):
         if len(args) != len(self._macro._arg_names):
             raise TypeError('Required {0} argument(s), got {1}'.format(len(self._macro._arg_names), len(args)))
         env = ExprEnv(self._lenv, args)
@@ -189,50 +399,113 @@ class BoundTailMacro(BoundMacro):
 
 
 class CompiledTailMacro(CompiledMacro):
+    __slots__ = ()
+
     def bind(self, lenv):
         return BoundTailMacro(self, lenv)
 
 
+class LazyEntry(object):
+    """
+    Mixin of entries compiled on first use. Subclasses keep the offset of the entry in its source
+    and a function compiling the entry found there. Attributes of the compiled entry are exposed,
+    so that lazy entries may be inspected just like the compiled ones. If compilation fails, its error
+    is raised on every use of the entry.
+    """
+
+    __slots__ = ()
+
+    # Compilers are not thread-safe, and entries are compiled rarely, so a single lock is enough
+    _compile_lock = threading.Lock()
+
+    def __init__(self, name, offset, compile):
+        self._name = name
+        self._offset = offset
+        self._compile = compile
+        self._compiled = None
+        self._error = None
+
+    def get_compiled(self):
+        compiled = self._compiled
+        if compiled is None:
+            with self._compile_lock:
+                if self._compiled is None and self._error is None:
+                    try:
+                        self._compiled = self._compile(self._offset)
+                    except CompilerError as e:
+                        self._error = e
+                    self._compile = None
+                if self._error is not None:
+                    raise self._error
+                compiled = self._compiled
+        return compiled
+
+    def bind(self, lenv):
+        return self.get_compiled().bind(lenv)
+
+    def populate_direct_queries(self, queries):
+        pass
+
+    def populate_template_queries(self, queries):
+        pass
+
+    def collect_dependencies(self, collector):
+        self.get_compiled().collect_dependencies(collector)
+
+
+class LazyEntity(LazyEntry, CompiledEntity):
+    __slots__ = ('_offset', '_compile', '_compiled', '_error')
+
+    _content = property(lambda self: self.get_compiled()._content)
+    _attrs = property(lambda self: self.get_compiled()._attrs)
+
+
+class LazyMacro(LazyEntry, CompiledMacro):
+    __slots__ = ('_offset', '_compile', '_compiled', '_error')
+
+    _arg_names = property(lambda self: self.get_compiled()._arg_names)
+    _expr = property(lambda self: self.get_compiled()._expr)
+
+
 class CompiledExpr(object):
+    __slots__ = ()
+
     def evaluate(self, env):
         raise NotImplementedError
 
     def evaluate_resolved(self, env):
         val = self.evaluate(env)
 
-        while isinstance(val, Resolvable):
+        while (_lookup_type(val.__class__) or classify_type(val)) is OBJECT:
+            if not isinstance(val, Resolvable):
+                raise TypeError('Required primitive type, got {0}'.format(type(val)))
             val = val.resolve_once()
 
-        if get_type(val) is OBJECT:
-            raise TypeError('Required primitive type, got {0}'.format(type(val)))
-
         return val
 
     def evaluate_bool(self, env):
         val = self.evaluate_resolved(env)
-        if get_type(val) is not BOOL:
+        if val.__class__ is not bool:
             raise TypeError('Required boolean, got {0}'.format(type(val)))
         return val
 
     def evaluate_string(self, env):
         val = self.evaluate_resolved(env)
-        if get_type(val) is not STRING:
+        if (_lookup_type(val.__class__) or classify_type(val)) is not STRING:
             raise TypeError('Required string, got {0}'.format(type(val)))
         return val
 
     def evaluate_number(self, env):
         val = self.evaluate_resolved(env)
-        if get_type(val) is not NUMBER:
+        if (_lookup_type(val.__class__) or classify_type(val)) is not NUMBER:
             raise TypeError('Required number, got {0}'.format(type(val)))
         return val
 
     def evaluate_placeable(self, env, buf):
         value = self.evaluate_resolved(env)
-        value_type = get_type(value)
+        value_type = _lookup_type(value.__class__) or classify_type(value)
         if value_type is NUMBER:
-            value = str(value)
-            if value.endswith('.0'):
-                value = value[:-2]
+            value = format_number(value)
         elif value_type is not STRING:
             raise TypeError('Required number or string, got {0}'.format(type(value)))
         buf.append(value)
@@ -240,13 +513,26 @@ class CompiledExpr(object):
     def get_direct_string(self):
         return None
 
+    def get_template(self):
+        return None
+
+    def collect_dependencies(self, collector):
+        pass
+
 
 class CompiledConditional(CompiledExpr):
+    __slots__ = ('_test', '_consequent', '_alternate')
+
     def __init__(self, test, consequent, alternate):
         self._test = test
         self._consequent = consequent
         self._alternate = alternate
 
+    def collect_dependencies(self, collector):
+        self._test.collect_dependencies(collector)
+        self._consequent.collect_dependencies(collector)
+        self._alternate.collect_dependencies(collector)
+
     def evaluate(self, env):
         return self._consequent.evaluate(env) if self._test.evaluate_bool(env) else self._alternate.evaluate(env)
 
@@ -258,11 +544,15 @@ class CompiledConditional(CompiledExpr):
 
 
 class CompiledLiteral(CompiledExpr):
+    __slots__ = ('_value',)
+
     def __init__(self, value):
         self._value = value
 
 
 class CompiledNumber(CompiledLiteral):
+    __slots__ = ()
+
     def evaluate(self, env):
         return self._value
 
@@ -270,11 +560,15 @@ class CompiledNumber(CompiledLiteral):
 
 
 class CompiledNull(CompiledExpr):
+    __slots__ = ()
+
     def evaluate(self, env):
         return None
 
 
 class CompiledString(CompiledLiteral):
+    __slots__ = ()
+
     def evaluate(self, env):
         return self._value
 
@@ -287,16 +581,67 @@ class CompiledString(CompiledLiteral):
         return self._value
 
 
+class CompiledBoolean(CompiledLiteral):
+    __slots__ = ()
+
+    def evaluate(self, env):
+        return self._value
+
+    evaluate_bool = evaluate
+
+
+class CompiledError(CompiledExpr):
+    # Result of constant folding of an expression that always fails. The error is raised
+    # only when the expression is evaluated, just as it would be without folding.
+
+    __slots__ = ('_error_class', '_error_args')
+
+    def __init__(self, error_class, error_args):
+        self._error_class = error_class
+        self._error_args = error_args
+
+    def evaluate(self, env):
+        raise self._error_class(*self._error_args)
+
+
+def make_literal(value):
+    value_type = get_type(value)
+    if value_type is BOOL:
+        return CompiledBoolean(value)
+    if value_type is NUMBER:
+        return CompiledNumber(value)
+    if value_type is STRING:
+        return CompiledString(value)
+    raise AssertionError('Not a literal value: {0!r}'.format(value))
+
+
+def evaluate_constant(expr):
+    # All operands of expr must be literals, so environment is not needed for evaluation
+    try:
+        return make_literal(expr.evaluate(None))
+    except StandardError as e:
+        return CompiledError(type(e), e.args)
+
+
 class CompiledBinary(CompiledExpr):
+    __slots__ = ('_left', '_right')
+
     def __init__(self, left, right):
         self._left = left
         self._right = right
 
+    def collect_dependencies(self, collector):
+        self._left.collect_dependencies(collector)
+        self._right.collect_dependencies(collector)
+
 
 class CompiledEquals(CompiledBinary):
+    __slots__ = ()
+
     def evaluate(self, env):
         left, right = self._left.evaluate_resolved(env), self._right.evaluate_resolved(env)
-        left_type, right_type = get_type(left), get_type(right)
+        left_type = _lookup_type(left.__class__) or classify_type(left)
+        right_type = _lookup_type(right.__class__) or classify_type(right)
         if left_type is not right_type or (left_type is not NUMBER and left_type is not STRING):
             raise TypeError('Required either numbers or strings, got {0} and {1}'.format(type(left), type(right)))
         return left == right
@@ -305,9 +650,12 @@ class CompiledEquals(CompiledBinary):
 
 
 class CompiledNotEqual(CompiledBinary):
+    __slots__ = ()
+
     def evaluate(self, env):
         left, right = self._left.evaluate_resolved(env), self._right.evaluate_resolved(env)
-        left_type, right_type = get_type(left), get_type(right)
+        left_type = _lookup_type(left.__class__) or classify_type(left)
+        right_type = _lookup_type(right.__class__) or classify_type(right)
         if left_type is not right_type or (left_type is not NUMBER and left_type is not STRING):
             raise TypeError('Required either numbers or strings, got {0} and {1}'.format(type(left), type(right)))
         return left != right
@@ -316,6 +664,8 @@ class CompiledNotEqual(CompiledBinary):
 
 
 class CompiledLessThan(CompiledBinary):
+    __slots__ = ()
+
     def evaluate(self, env):
         return self._left.evaluate_number(env) < self._right.evaluate_number(env)
 
@@ -323,6 +673,8 @@ class CompiledLessThan(CompiledBinary):
 
 
 class CompiledLessEqual(CompiledBinary):
+    __slots__ = ()
+
     def evaluate(self, env):
         return self._left.evaluate_number(env) <= self._right.evaluate_number(env)
 
@@ -330,6 +682,8 @@ class CompiledLessEqual(CompiledBinary):
 
 
 class CompiledGreaterThan(CompiledBinary):
+    __slots__ = ()
+
     def evaluate(self, env):
         return self._left.evaluate_number(env) > self._right.evaluate_number(env)
 
@@ -337,6 +691,8 @@ class CompiledGreaterThan(CompiledBinary):
 
 
 class CompiledGreaterEqual(CompiledBinary):
+    __slots__ = ()
+
     def evaluate(self, env):
         return self._left.evaluate_number(env) >= self._right.evaluate_number(env)
 
@@ -344,15 +700,20 @@ class CompiledGreaterEqual(CompiledBinary):
 
 
 class CompiledAdd(CompiledBinary):
+    __slots__ = ()
+
     def evaluate(self, env):
         left, right = self._left.evaluate_resolved(env), self._right.evaluate_resolved(env)
-        left_type, right_type = get_type(left), get_type(right)
+        left_type = _lookup_type(left.__class__) or classify_type(left)
+        right_type = _lookup_type(right.__class__) or classify_type(right)
         if left_type is not right_type or (left_type is not NUMBER and left_type is not STRING):
             raise TypeError('Required either numbers or strings, got {0} and {1}'.format(type(left), type(right)))
         return left + right
 
 
 class CompiledSubtract(CompiledBinary):
+    __slots__ = ()
+
     def evaluate(self, env):
         return self._left.evaluate_number(env) - self._right.evaluate_number(env)
 
@@ -360,6 +721,8 @@ class CompiledSubtract(CompiledBinary):
 
 
 class CompiledMultiply(CompiledBinary):
+    __slots__ = ()
+
     def evaluate(self, env):
         return self._left.evaluate_number(env) * self._right.evaluate_number(env)
 
@@ -367,6 +730,8 @@ class CompiledMultiply(CompiledBinary):
 
 
 class CompiledDivide(CompiledBinary):
+    __slots__ = ()
+
     def evaluate(self, env):
         return self._left.evaluate_number(env) / self._right.evaluate_number(env)
 
@@ -374,6 +739,8 @@ class CompiledDivide(CompiledBinary):
 
 
 class CompiledModulo(CompiledBinary):
+    __slots__ = ()
+
     def evaluate(self, env):
         return self._left.evaluate_number(env) % self._right.evaluate_number(env)
 
@@ -381,6 +748,8 @@ class CompiledModulo(CompiledBinary):
 
 
 class CompiledAnd(CompiledBinary):
+    __slots__ = ()
+
     def evaluate(self, env):
         return self._left.evaluate_bool(env) and self._right.evaluate_bool(env)
 
@@ -388,6 +757,8 @@ class CompiledAnd(CompiledBinary):
 
 
 class CompiledOr(CompiledBinary):
+    __slots__ = ()
+
     def evaluate(self, env):
         return self._left.evaluate_bool(env) or self._right.evaluate_bool(env)
 
@@ -395,31 +766,45 @@ class CompiledOr(CompiledBinary):
 
 
 class CompiledNamed(CompiledExpr):
+    __slots__ = ('_name',)
+
     def __init__(self, name):
         self._name = name
 
 
 class CompiledEntryAccess(CompiledNamed):
+    __slots__ = ('_entries',)
+
     def __init__(self, entries, name):
         super(CompiledEntryAccess, self).__init__(name)
         self._entries = entries
 
     def evaluate(self, env):
         try:
-            return self._entries[self._name].bind(env.parent)
+            return env.parent.bind(self._entries[self._name])
         except KeyError:
             raise NameError('Entry "{0}" is not defined'.format(self._name))
 
+    def collect_dependencies(self, collector):
+        collector.add_entry(self._entries, self._name)
+
 
 class CompiledVariableAccess(CompiledNamed):
+    __slots__ = ()
+
     def evaluate(self, env):
         try:
             return env.parent.vars[self._name]
         except KeyError:
             raise NameError('Variable "{0}" is not defined'.format(self._name))
 
+    def collect_dependencies(self, collector):
+        collector.add_variable(self._name)
+
 
 class CompiledLocalAccess(CompiledExpr):
+    __slots__ = ('_index',)
+
     def __init__(self, index):
         self._index = index
 
@@ -428,6 +813,8 @@ class CompiledLocalAccess(CompiledExpr):
 
 
 class CompiledGlobalAccess(CompiledNamed):
+    __slots__ = ()
+
     def evaluate(self, env):
         try:
             return env.parent.accessed_globals[self._name]
@@ -440,8 +827,13 @@ class CompiledGlobalAccess(CompiledNamed):
             env.parent.accessed_globals[self._name] = glob
             return glob
 
+    def collect_dependencies(self, collector):
+        collector.add_global(self._name)
+
 
 class CompiledComplexString(CompiledExpr):
+    __slots__ = ('_content', '_source')
+
     def __init__(self, content, source):
         self._content = content
         self._source = source
@@ -468,13 +860,51 @@ class CompiledComplexString(CompiledExpr):
         for item in self._content:
             item.evaluate_placeable(env, buf)
 
+    def get_template(self):
+        # If all placeables are variables, return a pair of tuples: literal parts of the string
+        # and names of the variables placed between them
+        literals = ['']
+        names = []
+        for item in self._content:
+            if item.__class__ is CompiledString:
+                literals[-1] += item._value
+            elif item.__class__ is CompiledNumber:
+                literals[-1] += format_number(item._value)
+            elif item.__class__ is CompiledVariableAccess:
+                names.append(item._name)
+                literals.append('')
+            else:
+                return None
+        return tuple(literals), tuple(names)
+
+    def collect_dependencies(self, collector):
+        for item in self._content:
+            item.collect_dependencies(collector)
+
+
+def make_complex_string(content, source):
+    # Complex string whose placeables are all literals is joined at compile time
+    if all(isinstance(item, (CompiledString, CompiledNumber)) for item in content):
+        buf = []
+        for item in content:
+            item.evaluate_placeable(None, buf)
+        return CompiledString(''.join(buf))
+    return CompiledComplexString(content, source)
+
 
 class CompiledUnary(CompiledExpr):
+    __slots__ = ('_arg',)
+
     def __init__(self, arg):
         self._arg = arg
 
+    def collect_dependencies(self, collector):
+        self._arg.collect_dependencies(collector)
+
 
 class CompiledNot(CompiledUnary):
+    __slots__ = ()
+
     def evaluate(self, env):
         return not self._arg.evaluate_bool(env)
 
@@ -482,6 +912,8 @@ class CompiledNot(CompiledUnary):
 
 
 class CompiledNegative(CompiledUnary):
+    __slots__ = ()
+
     def evaluate(self, env):
         return -self._arg.evaluate_number(env)
 
@@ -489,6 +921,8 @@ class CompiledNegative(CompiledUnary):
 
 
 class CompiledPositive(CompiledUnary):
+    __slots__ = ()
+
     def evaluate(self, env):
         return self._arg.evaluate_number(env)
 
@@ -496,6 +930,8 @@ class CompiledPositive(CompiledUnary):
 
 
 class CompiledCall(CompiledExpr):
+    __slots__ = ('_callee', '_args')
+
     def __init__(self, callee, args):
         self._callee = callee
         self._args = args
@@ -507,8 +943,15 @@ class CompiledCall(CompiledExpr):
         args = [arg.evaluate(env) for arg in self._args]
         return callee_val.invoke(args)
 
+    def collect_dependencies(self, collector):
+        self._callee.collect_dependencies(collector)
+        for arg in self._args:
+            arg.collect_dependencies(collector)
+
 
 class CompiledTailCall(CompiledExpr):
+    __slots__ = ('_args',)
+
     def __init__(self, args):
         self._args = args
 
@@ -516,8 +959,14 @@ class CompiledTailCall(CompiledExpr):
         env.locals = [arg.evaluate(env) for arg in self._args]
         return Tail
 
+    def collect_dependencies(self, collector):
+        for arg in self._args:
+            arg.collect_dependencies(collector)
+
 
 class CompiledPropertyAccess(CompiledExpr):
+    __slots__ = ('_expr', '_prop')
+
     def __init__(self, expr, prop):
         self._expr = expr
         self._prop = prop
@@ -528,8 +977,14 @@ class CompiledPropertyAccess(CompiledExpr):
 
         return expr_val[prop_val]
 
+    def collect_dependencies(self, collector):
+        self._expr.collect_dependencies(collector)
+        self._prop.collect_dependencies(collector)
+
 
 class CompiledAttributeAccess(CompiledExpr):
+    __slots__ = ('_expr', '_attr')
+
     def __init__(self, expr, attr):
         self._expr = expr
         self._attr = attr
@@ -542,6 +997,10 @@ class CompiledAttributeAccess(CompiledExpr):
             raise TypeError('Required entity, got {0}'.format(type(expr_val)))
         return expr_val.get_attribute(attr_val)
 
+    def collect_dependencies(self, collector):
+        self._expr.collect_dependencies(collector)
+        self._attr.collect_dependencies(collector)
+
 
 class HashError(KeyError):
     def __init__(self, message):
@@ -553,8 +1012,12 @@ class HashError(KeyError):
 
 
 class LazyHash(Resolvable):
+    __slots__ = ('_env', '_items', '_index_item', '_default')
+
     def __init__(self, env, items, index_item, default):
-        self._env = ExprEnv(env.parent, env.locals)
+        # Tail calls replace locals of macro environments, so they have to be captured. Environments
+        # without locals may be shared.
+        self._env = ExprEnv(env.parent, env.locals) if env.locals else env
         self._items = items
         self._index_item = index_item
         self._default = default
@@ -563,35 +1026,36 @@ class LazyHash(Resolvable):
         try:
             value = self._items[key]
         except KeyError:
-            return self._get_default([key])
+            return select_hash_item(self._env, self._items, self._index_item, self._default, [key]).evaluate(self._env)
         return value.evaluate(self._env)
 
     def resolve_once(self):
-        return self._get_default([])
+        return select_hash_item(self._env, self._items, self._index_item, self._default, []).evaluate(self._env)
 
-    def _get_default(self, tried):
-        if self._index_item is not None:
-            try:
-                key = self._index_item.evaluate_string(self._env)
-            except ErrorWithSource as e:
-                raise e.cause, None, sys.exc_info()[2]
-            try:
-                value = self._items[key]
-            except KeyError:
-                tried.append(key)
-            else:
-                return value.evaluate(self._env)
 
-        if self._default is not None:
-            return self._default.evaluate(self._env)
+def select_hash_item(env, items, index_item, default, tried):
+    if index_item is not None:
+        try:
+            key = index_item.evaluate_string(env)
+        except ErrorWithSource as e:
+            raise e.cause, None, sys.exc_info()[2]
+        try:
+            return items[key]
+        except KeyError:
+            tried.append(key)
 
-        if tried:
-            raise HashError('Hash key lookup failed. Tried: {0}'.format(', '.join(tried)))
-        else:
-            raise HashError('Hash has no default item assigned')
+    if default is not None:
+        return default
+
+    if tried:
+        raise HashError('Hash key lookup failed. Tried: {0}'.format(', '.join(tried)))
+    else:
+        raise HashError('Hash has no default item assigned')
 
 
 class CompiledHash(CompiledExpr):
+    __slots__ = ('_items', '_index_item', '_default')
+
     def __init__(self, items, index_item, default):
         self._items = items
         self._index_item = index_item
@@ -600,6 +1064,26 @@ class CompiledHash(CompiledExpr):
     def evaluate(self, env):
         return LazyHash(env, self._items, self._index_item, self._default)
 
+    def evaluate_resolved(self, env):
+        # Hash is resolved right away, so there is no need to create LazyHash
+        return select_hash_item(env, self._items, self._index_item, self._default, []).evaluate_resolved(env)
+
+    def get_direct_string(self):
+        if self._index_item is None:
+            value = self._default
+        elif isinstance(self._index_item, CompiledString):
+            value = self._items.get(self._index_item._value, self._default)
+        else:
+            return None
+        return None if value is None else value.get_direct_string()
+
+    def collect_dependencies(self, collector):
+        if self._index_item is not None:
+            self._index_item.collect_dependencies(collector)
+        # Default item is one of the items as well
+        for item in self._items.itervalues():
+            item.collect_dependencies(collector)
+
 
 class CompilerError(BuildError):
     pass
@@ -609,11 +1093,20 @@ class CircularDependencyError(CompilerError):
     pass
 
 
+class LazySyntaxError(CompilerError):
+    # Syntax error of an entry parsed on first use (see compile_lazily). Unlike parser.ParserError,
+    # it is a StandardError, so it is reported like other errors raised while resolving queries.
+    def __init__(self, msg, pos):
+        super(LazySyntaxError, self).__init__(msg)
+        self.pos = pos
+
+
 class CompilerState(object):
     def __init__(self):
         self.entries = {}
         self.collected_entries = {}
         self.direct_queries = {}
+        self.template_queries = {}
         self.import_uris = []
         self.import_cstates = []
         self._collecting = False
@@ -635,29 +1128,84 @@ class CompilerState(object):
 
             for entry in self.collected_entries.itervalues():
                 entry.populate_direct_queries(self.direct_queries)
+                entry.populate_template_queries(self.template_queries)
 
             self._collected = True
         finally:
             self._collecting = False
 
 
-def compile_syntax(l20n, debug=False):
+def make_compiler(debug=False):
     if debug:
         from .debug.compiler import DebugCompiler
-        compiler = DebugCompiler()
+        return DebugCompiler()
     else:
-        compiler = Compiler()
+        return Compiler()
+
+
+def compile_syntax(l20n, debug=False, closures=False):
+    """
+    Compile the given syntax tree.
+    """
+    return compile_entries(l20n.body, debug=debug, closures=closures)
+
 
-    for entry in l20n.body:
+def compile_entries(entries, debug=False, closures=False):
+    """
+    Compile the given top-level syntax nodes, which may be produced by an iterator (see
+    parser.iter_parse_source). Nodes are not kept, so they are compiled in a bounded amount of memory.
+    """
+    compiler = make_compiler(debug)
+    for entry in entries:
         compiler.compile_entry(entry)
 
+    cstate = compiler.cstate
+    # Closure compilation is not available in debug mode, since debug hooks are attached
+    # to individual nodes of the expression tree
+    if closures and not debug:
+        from .closures import compile_closures
+        compile_closures(cstate)
+    return cstate, cstate.import_uris, cstate.import_cstates
+
+
+def compile_lazily(entry_parser, debug=False, closures=False):
+    """
+    Compile the source of the given parser.EntryParser lazily. The source is only skimmed to find its entries,
+    and entities and macros are parsed and compiled on first use. Imports and entities consisting of a single
+    string without placeables are compiled right away. Syntax errors inside of entries are found only then,
+    and are raised as LazySyntaxError on every use of the entry.
+    """
+    from .parser import ParserError
+
+    compiler = make_compiler(debug)
+    closures = closures and not debug
+    if closures:
+        from .closures import compile_closure_entry
+
+    def compile_entry(offset):
+        try:
+            node = entry_parser.parse(offset)
+        except ParserError as e:
+            raise LazySyntaxError(e.args[0], e.pos)
+        entry = compiler.compile_lazy_entry(node)
+        if closures:
+            entry = compile_closure_entry(entry, compiler.collected_entries)
+        return entry
+
+    for skimmed in entry_parser.skim():
+        # Values of simple entities are needed for direct queries anyway
+        if skimmed.value is not None or skimmed.type == 'import':
+            compiler.compile_entry(entry_parser.parse_skimmed(skimmed))
+        else:
+            compiler.add_lazy_entry(skimmed.type, skimmed.name, skimmed.start, compile_entry)
+
     cstate = compiler.cstate
     return cstate, cstate.import_uris, cstate.import_cstates
 
 
 def link(cstate):
     cstate.collect()
-    return CompiledL20n(cstate.collected_entries, cstate.direct_queries)
+    return CompiledL20n(cstate.collected_entries, cstate.direct_queries, cstate.template_queries)
 
 
 class Handlers(object):
@@ -720,6 +1268,21 @@ class Compiler(object):
         self.entries[self.entry_name] = compiled_entry
         self.entry_name = None
         self.local_names = None
+        return compiled_entry
+
+    def add_lazy_entry(self, type, name, offset, compile_entry):
+        # Entities and macros are added as placeholders calling compile_entry with their offsets on first use
+        cls = LazyMacro if type == 'macro' else LazyEntity
+        self.entries[name] = cls(name, offset, compile_entry)
+
+    def compile_lazy_entry(self, node):
+        # Placeholder stays in the entries, so that the entries of a compiler state never change
+        # after it is collected
+        placeholder = self.entries[node.id.name]
+        try:
+            return self.compile_entry(node)
+        finally:
+            self.entries[node.id.name] = placeholder
 
     # Entry handlers
 
@@ -737,7 +1300,7 @@ class Compiler(object):
         content = self.compile_value_with_index(node.value, node.index)
         entity = CompiledEntity(node.id.name, content, attrs)
 
-        self.finish_entry(entity)
+        return self.finish_entry(entity)
 
     @entry_handlers.register(syntax.ImportStatement)
     def compile_import_statement(self, node):
@@ -752,7 +1315,7 @@ class Compiler(object):
         cls = CompiledTailMacro if has_tail else CompiledMacro
         macro = cls(node.id.name, arg_names, expr)
 
-        self.finish_entry(macro)
+        return self.finish_entry(macro)
 
     def compile_entry(self, node):
         handler = self.entry_handlers.select(node)
@@ -767,10 +1330,7 @@ class Compiler(object):
 
     @value_handlers.register(syntax.ComplexString)
     def compile_complex_string(self, node, index, depth):
-        return CompiledComplexString(
-            [self.compile_expression(item) for item in node.content],
-            node.source
-        )
+        return make_complex_string([self.compile_expression(item) for item in node.content], node.source)
 
     @value_handlers.register(syntax.Hash)
     def compile_hash(self, node, index, depth):
@@ -827,10 +1387,9 @@ class Compiler(object):
 
     @expression_handlers.register(syntax.BinaryExpression)
     def compile_binary_expression(self, node):
-        return self.binary_operator_classes[node.operator.token](
-            self.compile_expression(node.left),
-            self.compile_expression(node.right)
-        )
+        left = self.compile_expression(node.left)
+        right = self.compile_expression(node.right)
+        return self.fold(self.binary_operator_classes[node.operator.token](left, right), left, right)
 
     @expression_handlers.register(syntax.CallExpression)
     def compile_call_expression(self, node):
@@ -841,8 +1400,16 @@ class Compiler(object):
 
     @expression_handlers.register(syntax.ConditionalExpression)
     def compile_conditional_expression(self, node):
+        test = self.compile_expression(node.test)
+        if isinstance(test, CompiledLiteral):
+            try:
+                branch = node.consequent if test.evaluate_bool(None) else node.alternate
+            except StandardError as e:
+                return CompiledError(type(e), e.args)
+            return self.compile_expression(branch)
+
         return CompiledConditional(
-            self.compile_expression(node.test),
+            test,
             self.compile_expression(node.consequent),
             self.compile_expression(node.alternate)
         )
@@ -862,10 +1429,19 @@ class Compiler(object):
 
     @expression_handlers.register(syntax.LogicalExpression)
     def compile_logical_expression(self, node):
-        return self.logical_operator_classes[node.operator.token](
-            self.compile_expression(node.left),
-            self.compile_expression(node.right)
-        )
+        cls = self.logical_operator_classes[node.operator.token]
+        left = self.compile_expression(node.left)
+        if isinstance(left, CompiledLiteral):
+            try:
+                left_val = left.evaluate_bool(None)
+            except StandardError as e:
+                return CompiledError(type(e), e.args)
+            # Right operand is not evaluated at all, e.g. in "1 != 1 && x"
+            if left_val == (cls is CompiledOr):
+                return CompiledBoolean(left_val)
+
+        right = self.compile_expression(node.right)
+        return self.fold(cls(left, right), left, right)
 
     @expression_handlers.register(syntax.Number)
     def compile_number(self, node):
@@ -896,9 +1472,8 @@ class Compiler(object):
 
     @expression_handlers.register(syntax.UnaryExpression)
     def compile_unary_expression(self, node):
-        return self.unary_operator_classes[node.operator.token](
-            self.compile_expression(node.argument)
-        )
+        arg = self.compile_expression(node.argument)
+        return self.fold(self.unary_operator_classes[node.operator.token](arg), arg)
 
     @expression_handlers.register(syntax.Variable)
     def compile_variable(self, node):
@@ -933,7 +1508,7 @@ class Compiler(object):
 
     @is_this_access_handlers.register(syntax.ParenthesisExpression)
     def is_this_access_parenthesis_expression(self, node):
-        return self.is_this_access(node)
+        return self.is_this_access(node.expression)
 
     def is_this_access(self, node):
         handler = self.is_this_access_handlers.select(node)
@@ -956,6 +1531,13 @@ class Compiler(object):
     @tail_expression_handlers.register(syntax.ConditionalExpression)
     def compile_tail_conditional_expression(self, node):
         test = self.compile_expression(node.test)
+        if isinstance(test, CompiledLiteral):
+            try:
+                branch = node.consequent if test.evaluate_bool(None) else node.alternate
+            except StandardError as e:
+                return False, CompiledError(type(e), e.args)
+            return self.compile_tail_expression(branch)
+
         consequent_has_tail, consequent = self.compile_tail_expression(node.consequent)
         alternate_has_tail, alternate = self.compile_tail_expression(node.alternate)
         return consequent_has_tail or alternate_has_tail, CompiledConditional(test, consequent, alternate)
@@ -973,6 +1555,14 @@ class Compiler(object):
 
     # Helper methods
 
+    def fold(self, expr, *operands):
+        # Replaces expr with its value if all operands are known at compile time. Note that
+        # in debug mode operands are wrapped, so expressions are never folded there.
+        for operand in operands:
+            if not isinstance(operand, CompiledLiteral):
+                return expr
+        return evaluate_constant(expr)
+
     def compile_value_with_index(self, node, index_nodes):
         index = [self.compile_expression(index_item_node) for index_item_node in index_nodes or ()]
         return self.compile_value(node, index, 0)
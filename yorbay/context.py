@@ -1,11 +1,21 @@
 from __future__ import unicode_literals
 
 import sys
+import weakref
 
 from .builder import build_from_path, build_from_source
-from .compiler import ErrorWithSource, CompiledL20n
+from .cache import LRUCache
+from .codegen import load_generated_module
+from .columns import analyze_query, fill_template, group_rows, make_marker, split_template, to_list
+from .compiler import ErrorWithSource, CompiledEntity, CompiledL20n, format_number
 from .discovery import build_from_module_lazy
-from .globals import default_globals
+from .globals import CONSTANT, GlobalCache, default_globals, get_volatility
+from .specializer import specialize
+
+# Only results depending on variables of these types are cached. Other values may be mutable
+# or unhashable.
+_cacheable_classes = frozenset((int, long, float, str, unicode, bool, type(None)))
+_missing = object()
 
 
 class Context(object):
@@ -14,7 +24,8 @@ class Context(object):
         from .debug.stacktrace import print_exc_info
         print_exc_info(exc_type, exc_value, exc_tb)
 
-    def __init__(self, obj, globals=None, extra_globals=None, error_hook=None, debug=False):
+    def __init__(self, obj, globals=None, extra_globals=None, error_hook=None, debug=False, cache_size=None,
+                 cache_ttl=60):
         if isinstance(obj, CompiledL20n):
             get_l20n = lambda: obj
         elif callable(obj):
@@ -27,30 +38,54 @@ class Context(object):
 
         self._vars = {}
         self._get_l20n = get_l20n
-        self._globals = default_globals if globals is None else globals
+        globals = default_globals if globals is None else globals
         if extra_globals:
-            self._globals = dict(self._globals)
-            self._globals.update(extra_globals)
+            globals = dict(globals)
+            globals.update(extra_globals)
+        # Values of globals are shared between calls according to their volatility
+        self._global_cache = GlobalCache()
+        self._globals = self._global_cache.wrap(globals)
         self._error_hook = error_hook
 
+        # Results of queries are cached only if cache_size is given. Results depending on globals are
+        # cached only as long as values of the globals may be reused (see _make_cache_spec).
+        self._result_cache = None if cache_size is None else LRUCache(cache_size)
+        self._cache_ttl = cache_ttl
+        # Cache specs of queries by translations. Translations are referenced weakly, as a new one is
+        # specialized whenever a constant variable changes.
+        self._cache_specs = weakref.WeakKeyDictionary()
+
+        # Names of variables declared constant with specialize() and translations specialized
+        # against them, as a (l20n, specialized l20n) pair
+        self._constant_vars = None
+        self._specialized = None
+
     @classmethod
-    def from_string(cls, string, loader=None, debug=False, **kwargs):
-        return cls(build_from_source(string, '', loader, debug=debug), debug=debug, **kwargs)
+    def from_string(cls, string, loader=None, debug=False, closures=False, lazy=False, cache_dir=None, **kwargs):
+        return cls(build_from_source(string, '', loader, debug=debug, closures=closures, lazy=lazy,
+                                     cache_dir=cache_dir), debug=debug, **kwargs)
 
     @classmethod
-    def from_file(cls, file, loader=None, debug=False, **kwargs):
+    def from_file(cls, file, loader=None, debug=False, closures=False, lazy=False, cache_dir=None, **kwargs):
         if isinstance(file, basestring):
-                return cls(build_from_path(file, loader, debug=debug), debug=debug, **kwargs)
+                return cls(build_from_path(file, loader, debug=debug, closures=closures, lazy=lazy,
+                                           cache_dir=cache_dir), debug=debug, **kwargs)
         else:
             return cls(
-                build_from_source(file.read(), getattr(file, 'name', ''), loader, debug=debug),
+                build_from_source(file.read(), getattr(file, 'name', ''), loader, debug=debug, closures=closures,
+                                  lazy=lazy, cache_dir=cache_dir),
                 debug=debug,
                 **kwargs
             )
 
     @classmethod
-    def from_module(cls, name, lang=None, debug=False, **kwargs):
-        return cls(build_from_module_lazy(name, lang, debug=debug), debug=debug, **kwargs)
+    def from_module(cls, name, lang=None, debug=False, closures=False, lazy=False, cache_dir=None, **kwargs):
+        return cls(build_from_module_lazy(name, lang, debug=debug, closures=closures, lazy=lazy,
+                                          cache_dir=cache_dir), debug=debug, **kwargs)
+
+    @classmethod
+    def from_generated_module(cls, module, **kwargs):
+        return cls(load_generated_module(module), **kwargs)
 
     def __contains__(self, key):
         return key in self._vars
@@ -65,12 +100,118 @@ class Context(object):
         if not isinstance(key, basestring):
             raise TypeError('Key must be a string, not {0}'.format(type(key)))
         self._vars[key] = value
+        self._invalidate_specialized(key)
 
     def __delitem__(self, key):
         del self._vars[key]
+        self._invalidate_specialized(key)
 
-    def __call__(self, query, **local_vars):
+    def request(self):
+        """
+        Return a context manager marking a request, e.g. a request of a web application. Values
+        of PER_REQUEST globals are fetched at most once per request in the current thread.
+        """
+        return self._global_cache.request()
+
+    def specialize(self, *names):
+        """
+        Declare variables with the given names constant and specialize translations against them
+        and against constant globals (like @os). Expressions depending only on constant values are
+        evaluated in advance, and entities whose values become simple strings are resolved directly.
+
+        Translations are specialized again whenever one of the variables is set or deleted. Queries
+        overriding any of the variables with keyword arguments use unspecialized translations.
+        """
+        self._constant_vars = frozenset(names)
+        self._specialized = None
+
+    def _invalidate_specialized(self, key):
+        if self._constant_vars is not None and key in self._constant_vars:
+            self._specialized = None
+
+    def _select_l20n(self, local_vars):
         l20n = self._get_l20n()
+        if self._constant_vars is None:
+            return l20n
+        for name in self._constant_vars:
+            if name in local_vars:
+                return l20n
+
+        specialized = self._specialized
+        if specialized is None or specialized[0] is not l20n:
+            vars = dict((name, self._vars[name]) for name in self._constant_vars if name in self._vars)
+            specialized = self._specialized = l20n, specialize(l20n, vars, self._globals)
+        return specialized[1]
+
+    def cache_info(self):
+        """
+        Return statistics of the result cache as a CacheInfo named tuple, or None if results
+        are not cached.
+        """
+        return None if self._result_cache is None else self._result_cache.info()
+
+    def cache_clear(self):
+        if self._result_cache is not None:
+            self._result_cache.clear()
+            self._cache_specs.clear()
+
+    def _get_cache_spec(self, l20n, query):
+        specs = self._cache_specs.get(l20n)
+        if specs is None:
+            specs = self._cache_specs[l20n] = {}
+        try:
+            return specs[query]
+        except KeyError:
+            pass
+
+        try:
+            deps = l20n.dependencies(query)
+        except NameError:
+            spec = None
+        else:
+            spec = self._make_cache_spec(deps)
+        specs[query] = spec
+        return spec
+
+    def _make_cache_spec(self, deps):
+        # Return names of variables the result depends on and the shortest period of globals it depends on
+        # (None if it never expires), or None if the result may not be cached. Results depending on globals
+        # fetched once per call or request are never cached, as they could be served to other requests.
+        period = None
+        for name in deps.globals:
+            volatility = get_volatility(self._globals.get(name))
+            if volatility is CONSTANT:
+                continue
+            if volatility.period is None:
+                return None
+            period = volatility.period if period is None else min(period, volatility.period)
+        return tuple(sorted(deps.variables)), period
+
+    def _get_cache_ttl(self, period):
+        if period is None:
+            return None
+        # Periods are aligned to the epoch (see GlobalCache.get_period), so results expire when the current one ends
+        return min(self._cache_ttl, period - self._result_cache._clock() % period)
+
+    def _get_cache_key(self, l20n, query, vars):
+        spec = self._get_cache_spec(l20n, query)
+        if spec is None:
+            return None
+
+        # Value classes are a part of the key, since e.g. 1 and True are equal, but may
+        # produce different results
+        key = [l20n, query]
+        for name in spec[0]:
+            value = vars.get(name, _missing)
+            if value is not _missing:
+                if value.__class__ not in _cacheable_classes:
+                    return None
+                key.append(value.__class__)
+            key.append(value)
+        return tuple(key), spec[1]
+
+    def __call__(self, query, **local_vars):
+        l20n = self._select_l20n(local_vars)
 
         # Fast path: if the content of an entity or an attribute is a simple string, then
         # we do not have to create execution environment - we can use direct_queries mapping
@@ -79,31 +220,234 @@ class Context(object):
         if value is not None:
             return value
 
-        # Fast path is not available. Construct variable mapping, trying to avoid unnecessary
-        # dict merging.
+        # Second fast path: complex strings with only variables as placeables are rendered
+        # directly from their templates
+        template = l20n.template_queries.get(query)
+        if template is not None:
+            value = self._render_template(template, local_vars)
+            if value is not None:
+                return value
+
+        return self._evaluate(l20n, query, local_vars)
+
+    def prepare(self, query):
+        """
+        Return a callable resolving the given query with variables passed as keyword arguments,
+        just like __call__. Lookups which do not depend on variables are done only once, as long
+        as translations do not change (e.g. language of translations loaded by from_module).
+        """
+        return PreparedMessage(self, query)
+
+    def _evaluate(self, l20n, query, local_vars, entity=None):
+        vars = self._merge_vars(local_vars)
+
+        cache_key = None
+        if self._result_cache is not None:
+            cache_key = self._get_cache_key(l20n, query, vars)
+            if cache_key is not None:
+                value = self._result_cache.get(cache_key[0])
+                if value is not None:
+                    return value
+
+        value, succeeded = self._resolve(l20n.make_env(vars, self._globals), query, entity)
+
+        # Failed resolutions are not cached, so that the error hook is called every time
+        if succeeded and cache_key is not None:
+            self._result_cache.set(cache_key[0], value, self._get_cache_ttl(cache_key[1]))
+        return value
+
+    def resolve_many(self, queries, **local_vars):
+        """
+        Resolve all queries using the same variables and return a dict mapping queries to their values.
+
+        All queries share a single execution environment, so globals are fetched and entities
+        and macro calls are evaluated at most once per batch. Errors are handled separately for
+        each query, just like in __call__.
+        """
+        l20n = self._select_l20n(local_vars)
+        direct_queries = l20n.direct_queries
+        env = None
+        values = {}
+        for query in queries:
+            value = direct_queries.get(query)
+            if value is None:
+                template = l20n.template_queries.get(query)
+                if template is not None:
+                    value = self._render_template(template, local_vars)
+            if value is None:
+                if env is None:
+                    env = l20n.make_env(self._merge_vars(local_vars), self._globals)
+                value = self._resolve(env, query)[0]
+            values[query] = value
+        return values
+
+    def render_column(self, query, **columns):
+        """
+        Resolve the query for many sets of variables at once. Each keyword argument is a sequence
+        (or a NumPy array) of values of one variable; the result is a list of values, one for each row.
+
+        Rows are grouped by values of the variables which control the evaluation (e.g. used
+        as hash indexes or in conditions), and the query is evaluated once per group. Variables
+        which are only inserted into the output are substituted afterwards. Rows for which
+        the evaluation fails are resolved separately with __call__, so the results are always
+        the same as for __call__ invoked for each row.
+        """
+        lengths = set(len(column) for column in columns.itervalues())
+        if len(lengths) > 1:
+            raise ValueError('All columns must have the same length')
+        row_count = lengths.pop() if lengths else 1
+
+        l20n = self._select_l20n(columns)
+        value = l20n.direct_queries.get(query)
+        if value is not None:
+            return [value] * row_count
+
+        lists = dict((name, to_list(column)) for name, column in columns.iteritems())
+
+        def resolve_row(index):
+            return self(query, **dict((name, values[index]) for name, values in lists.iteritems()))
+
+        analysis = analyze_query(l20n, query)
+        if analysis is None:
+            return [resolve_row(index) for index in xrange(row_count)]
+
+        control_names = sorted(name for name in analysis[0] if name in columns)
+        text_names = sorted(name for name in analysis[1] if name in columns)
+        text_columns = [lists[name] for name in text_names]
+        markers = dict((name, make_marker(i)) for i, name in enumerate(text_names))
+
+        results = [None] * row_count
+        for values, indexes in group_rows([columns[name] for name in control_names], row_count):
+            parts = None
+            if values is not None:
+                group_vars = dict(zip(control_names, values))
+                group_vars.update(markers)
+                env = l20n.make_env(self._merge_vars(group_vars), self._globals)
+                pos = query.find('::')
+                try:
+                    if pos == -1:
+                        template = env.resolve_entity(query) or ''
+                    else:
+                        template = env.resolve_attribute(query[:pos], query[pos + 2:])
+                except (ErrorWithSource, StandardError):
+                    # Errors are reported by __call__ for each row separately
+                    pass
+                else:
+                    parts = split_template(template, len(text_names))
+
+            for index in indexes:
+                value = None
+                if parts is not None:
+                    value = fill_template(parts, [column[index] for column in text_columns])
+                results[index] = resolve_row(index) if value is None else value
+
+        return results
+
+    def _render_template(self, template, local_vars):
+        # Returns None if any of the variables is missing or is not a string or a number. In such
+        # case the query is resolved in the regular way, which takes care of error reporting.
+        literals, names = template
+        buf = [literals[0]]
+        for i, name in enumerate(names):
+            if name in local_vars:
+                value = local_vars[name]
+            elif name in self._vars:
+                value = self._vars[name]
+            else:
+                return None
+
+            value_class = value.__class__
+            if value_class is unicode or value_class is str:
+                buf.append(value)
+            elif value_class is int or value_class is long or value_class is float:
+                buf.append(format_number(value))
+            else:
+                return None
+            buf.append(literals[i + 1])
+        try:
+            return ''.join(buf)
+        except UnicodeDecodeError:
+            # Byte string which is not ASCII
+            return None
+
+    def _merge_vars(self, local_vars):
+        # Construct variable mapping, trying to avoid unnecessary dict merging
         if not local_vars:
-            vars = self._vars
+            return self._vars
         elif not self._vars:
-            vars = local_vars
+            return local_vars
         else:
             vars = {}
             vars.update(self._vars)
             vars.update(local_vars)
+            return vars
 
-        env = l20n.make_env(vars, self._globals)
+    def _resolve(self, env, query, entity=None):
+        # Returns the value of the query and a flag telling whether resolution succeeded. Entity
+        # of the query may be given if it is already known, so that it is not looked up by name.
         pos = query.find('::')
         try:
             if pos == -1:
                 # Entities without content resolve to None, but this function is supposed
                 # to always return strings, so None should be replaced with ''
-                return env.resolve_entity(query) or ''
+                if entity is None:
+                    return env.resolve_entity(query) or '', True
+                return env.bind(entity).resolve() or '', True
             else:
-                return env.resolve_attribute(query[:pos], query[pos + 2:])
+                if entity is None:
+                    return env.resolve_attribute(query[:pos], query[pos + 2:]), True
+                return env.bind(entity).resolve_attribute(query[pos + 2:]), True
         except ErrorWithSource as e:
             if self._error_hook is not None:
                 self._error_hook(type(e.cause), e.cause, sys.exc_info()[2])
-            return e.source
+            return e.source, False
         except StandardError:
             if self._error_hook is not None:
                 self._error_hook(*sys.exc_info())
-            return query
+            return query, False
+
+
+class PreparedMessage(object):
+    """
+    Query prepared by Context.prepare. Results of lookups are kept together with translations
+    they were made in, and are repeated when Context returns other translations.
+    """
+
+    __slots__ = ('_context', '_query', '_entity_name', '_plan')
+
+    def __init__(self, context, query):
+        self._context = context
+        self._query = query
+        self._entity_name = query.partition('::')[0]
+        self._plan = None
+
+    def _make_plan(self, l20n):
+        # Plan is a single tuple, so that threads never see it half-updated
+        entity = l20n._entries.get(self._entity_name)
+        if not isinstance(entity, CompiledEntity):
+            # Errors are reported when the entity is looked up by name
+            entity = None
+        plan = self._plan = (
+            l20n, l20n.direct_queries.get(self._query), l20n.template_queries.get(self._query), entity)
+        return plan
+
+    def __call__(self, **local_vars):
+        context = self._context
+        l20n = context._select_l20n(local_vars)
+        plan = self._plan
+        if plan is None or plan[0] is not l20n:
+            plan = self._make_plan(l20n)
+
+        _, value, template, entity = plan
+        if value is not None:
+            return value
+
+        if template is not None:
+            value = context._render_template(template, local_vars)
+            if value is not None:
+                return value
+
+        return context._evaluate(l20n, self._query, local_vars, entity)
+
+    def __repr__(self):
+        return '<PreparedMessage {0!r}>'.format(self._query)
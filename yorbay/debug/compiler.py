@@ -10,6 +10,8 @@ from .stacktrace import attach_stack, Frame
 
 
 class DebugBoundEntity(BoundEntity):
+    __slots__ = ('_debug_hook',)
+
     def __init__(self, entity, lenv):
         super(DebugBoundEntity, self).__init__(entity, lenv)
         self._debug_hook = entity._debug_hook.with_barrier(True)
@@ -37,6 +39,8 @@ class DebugBoundEntity(BoundEntity):
 
 
 class DebugCompiledEntity(CompiledEntity):
+    __slots__ = ('_debug_hook',)
+
     def __init__(self, name, content, attrs, debug_hook):
         super(DebugCompiledEntity, self).__init__(name, content, attrs)
         self._debug_hook = debug_hook
@@ -46,6 +50,8 @@ class DebugCompiledEntity(CompiledEntity):
 
 
 class DebugBoundMacro(BoundMacro):
+    __slots__ = ('_debug_hook',)
+
     def __init__(self, macro, lenv):
         super(DebugBoundMacro, self).__init__(macro, lenv)
         self._debug_hook = macro._debug_hook.with_barrier(True)
@@ -56,6 +62,8 @@ class DebugBoundMacro(BoundMacro):
 
 
 class DebugCompiledMacro(CompiledMacro):
+    __slots__ = ('_debug_hook',)
+
     def __init__(self, name, arg_names, expr, debug_hook):
         super(DebugCompiledMacro, self).__init__(name, arg_names, expr)
         self._debug_hook = debug_hook
@@ -65,6 +73,8 @@ class DebugCompiledMacro(CompiledMacro):
 
 
 class DebugLazyHash(Resolvable):
+    __slots__ = ('_lazy_hash', '_debug_hook')
+
     def __init__(self, lazy_hash, debug_hook):
         self._lazy_hash = lazy_hash
         self._debug_hook = debug_hook.with_barrier(True)
@@ -79,6 +89,8 @@ class DebugLazyHash(Resolvable):
 
 
 class DebugCompiledEntryAccess(CompiledEntryAccess):
+    __slots__ = ()
+
     def evaluate(self, env):
         try:
             return super(DebugCompiledEntryAccess, self).evaluate(env)
@@ -91,6 +103,8 @@ class DebugCompiledEntryAccess(CompiledEntryAccess):
 
 
 class DebugCompiledGlobalAccess(CompiledGlobalAccess):
+    __slots__ = ()
+
     def evaluate(self, env):
         try:
             return super(DebugCompiledGlobalAccess, self).evaluate(env)
@@ -103,6 +117,8 @@ class DebugCompiledGlobalAccess(CompiledGlobalAccess):
 
 
 class DebugCompiledVariableAccess(CompiledVariableAccess):
+    __slots__ = ('_local_names',)
+
     def __init__(self, name, local_names):
         super(DebugCompiledVariableAccess, self).__init__(name)
         self._local_names = local_names
@@ -119,6 +135,8 @@ class DebugCompiledVariableAccess(CompiledVariableAccess):
 
 
 class DebugCompiledExpr(CompiledExpr):
+    __slots__ = ('_expr', '_debug_hook')
+
     def __init__(self, expr, debug_hook):
         self._expr = expr
         self._debug_hook = debug_hook
@@ -132,6 +150,9 @@ class DebugCompiledExpr(CompiledExpr):
 
         return ret
 
+    def collect_dependencies(self, collector):
+        self._expr.collect_dependencies(collector)
+
     # evaluate_* methods are wrappers for evaluate that perform resolution and type checking - if
     # wrapped expression may be successfully evaluated, but resolution / type checking fails, then
     # the error is related to the outer expression (e.g. "1 && 2" should report a failure for "&&"
@@ -139,6 +160,8 @@ class DebugCompiledExpr(CompiledExpr):
 
 
 class DebugHook(object):
+    __slots__ = ('entry_type', 'entry_name', 'pos', '_barrier')
+
     def __init__(self, entry_type, entry_name, pos, barrier=False):
         self.entry_type = entry_type
         self.entry_name = entry_name
@@ -183,7 +206,7 @@ class DebugCompiler(Compiler):
         content = self.compile_value_with_index(node.value, node.index)
         entry = DebugCompiledEntity(node.id.name, content, attrs, self.make_debug_hook(node))
 
-        self.finish_entry(entry)
+        return self.finish_entry(entry)
 
     def compile_macro(self, node):
         arg_names = [arg.id.name for arg in node.args]
@@ -192,7 +215,7 @@ class DebugCompiler(Compiler):
         expr = self.compile_expression(node.expression)
         macro = DebugCompiledMacro(node.id.name, arg_names, expr, self.make_debug_hook(node))
 
-        self.finish_entry(macro)
+        return self.finish_entry(macro)
 
     def compile_globals_expression(self, node):
         return DebugCompiledGlobalAccess(node.id.name)
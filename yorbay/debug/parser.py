@@ -1,18 +1,12 @@
 from __future__ import unicode_literals
 
 from ..parser import Tokenizer, Parser
-from .. import syntax
-
-
-class Origin(object):
-    def __init__(self, s, path):
-        self.lines = s.splitlines()
-        self.path = path
+from ..syntax import Origin
 
 
 class DebugTokenizer(Tokenizer):
-    def __init__(self, s, path):
-        super(DebugTokenizer, self).__init__(s, Origin(s, path))
+    def __init__(self, s, path, origin=None, names=None):
+        super(DebugTokenizer, self).__init__(s, Origin(s, path) if origin is None else origin, names)
 
 
 class DebugParser(Parser):
@@ -20,18 +14,17 @@ class DebugParser(Parser):
         self._pos_stack = []
         super(DebugParser, self).__init__(tokenizer)
 
+    # Offsets are kept on the stack, positions are created only for nodes
+
     def push_pos(self):
-        self._pos_stack.append(self.pos)
+        self._pos_stack.append(self.offset)
 
     def put_pos(self, node, shift=0):
-        pos = self._pos_stack[-1]
-        if shift:
-            pos = syntax.Position(pos.line, pos.column + shift, pos.origin)
-        node.pos = pos
+        node.pos = self._tokenizer.get_position(self._pos_stack[-1] + shift)
         return node
 
     def pop_pos(self, node):
-        node.pos = self._pos_stack.pop()
+        node.pos = self._tokenizer.get_position(self._pos_stack.pop())
         return node
 
     def next_token_pp(self):
@@ -54,10 +47,10 @@ class DebugParser(Parser):
         return ret
 
     def pp_try_skip_token_pp(self, type, allow_ws_before=True):
-        pos = self.pos
+        offset = self.offset
         ret = self.try_skip_token(type, allow_ws_before)
         if ret:
-            self._pos_stack.append(pos)
+            self._pos_stack.append(offset)
             self.push_pos()
         return ret
 
@@ -55,7 +55,7 @@ def get_path(loader, langs):
     return None
 
 
-def build_from_module(name, lang=None):
+def build_from_module(name, lang=None, cache_dir=None):
     langs = get_lang_chain(prepare_lang_lazy(lang)())
 
     loader = get_discovery_loader(name)
@@ -66,15 +66,18 @@ def build_from_module(name, lang=None):
     if path is None:
         raise DiscoveryError('Could not find translations for module {0}, tried languages: {1}'.format(name, langs))
 
-    return build_from_path(path, loader, cache=loader.cache)
+    return build_from_path(path, loader, cache=loader.cache, cache_dir=cache_dir)
 
 
 class LazyBuilder(object):
-    def __init__(self, loader, lang, debug):
+    def __init__(self, loader, lang, debug, closures=False, lazy=False, cache_dir=None):
         self._loader = loader
         self._get_lang = prepare_lang_lazy(lang)
         self._cache = {}
         self._debug = debug
+        self._closures = closures
+        self._lazy = lazy
+        self._cache_dir = cache_dir
 
     def __call__(self):
         lang = self._get_lang()
@@ -84,17 +87,18 @@ class LazyBuilder(object):
             path = get_path(self._loader, langs)
             if path is None:
                 raise DiscoveryError('Could not find translations, tried languages: {0}'.format(langs))
-            l20n = build_from_path(path, self._loader, cache=self._loader.cache, debug=self._debug)
+            l20n = build_from_path(path, self._loader, cache=self._loader.cache, debug=self._debug,
+                                   closures=self._closures, lazy=self._lazy, cache_dir=self._cache_dir)
             self._cache[lang] = l20n
         return l20n
 
 
-def build_from_module_lazy(name, lang=None, debug=False):
+def build_from_module_lazy(name, lang=None, debug=False, closures=False, lazy=False, cache_dir=None):
     loader = get_discovery_loader(name)
     if loader is None:
         raise DiscoveryError('Could not find suitable discovery loader for {0}'.format(name))
 
-    return LazyBuilder(loader, lang, debug=debug)
+    return LazyBuilder(loader, lang, debug=debug, closures=closures, lazy=lazy, cache_dir=cache_dir)
 
 
 class PkgResourcesDiscoverer(object):
@@ -0,0 +1,177 @@
+from __future__ import unicode_literals
+
+from .compiler import (
+    Compiler, CompiledAttributeAccess, CompiledBoolean, CompiledCall, CompiledConditional, CompiledEntity,
+    CompiledEntryAccess, CompiledError, CompiledGlobalAccess, CompiledHash, CompiledLiteral, CompiledLocalAccess,
+    CompiledMacro, CompiledNull, CompiledNumber, CompiledOr, CompiledPropertyAccess, CompiledString,
+    CompiledTailCall, CompiledTailMacro, CompiledVariableAccess, make_complex_string
+)
+from .parser import Parser, Tokenizer
+
+
+class FusedCompiler(Parser):
+    """
+    Parser which compiles entries as they are parsed, without building their syntax trees. Node factories
+    of the parser return compiled expressions, names instead of identifiers and (name, value) pairs instead
+    of attributes and hash items. The result is the same as compiling the syntax tree with compiler.Compiler.
+    """
+
+    def __init__(self, tokenizer):
+        self._compiler = Compiler()
+        self.cstate = self._compiler.cstate
+        super(FusedCompiler, self).__init__(tokenizer)
+
+    def compile(self):
+        while self.token.type != 'eof':
+            self.parse_entry()
+        return self.cstate
+
+    # Entries
+
+    def begin_entity(self, name):
+        self._compiler.begin_entity(name)
+
+    def begin_macro(self, name, arg_names):
+        self._compiler.begin_macro(name, arg_names)
+
+    def parse_macro_argument(self):
+        return self.parse_variable_name()
+
+    def make_identifier(self, name):
+        return name
+
+    def make_comment(self, content):
+        return None
+
+    def make_import_statement(self, uri):
+        self.cstate.import_uris.append(uri._value)
+
+    def make_entity(self, name, value, index, attrs):
+        content = CompiledNull() if value is None else self._index_value(value, index or (), 0)
+        return self._compiler.finish_entry(CompiledEntity(name, content, dict(attrs or ())))
+
+    def make_attribute(self, name, value, index):
+        return name, self._index_value(value, index or (), 0)
+
+    def make_macro(self, name, arg_names, expr):
+        has_tail, expr = self._make_tail(expr)
+        cls = CompiledTailMacro if has_tail else CompiledMacro
+        return self._compiler.finish_entry(cls(name, arg_names, expr))
+
+    # Values
+
+    def make_hash_item(self, name, value, default):
+        return name, value, default
+
+    def make_hash(self, content):
+        # Index item is known only when the depth of the hash is, see _index_value
+        default = None
+        items = {}
+        for name, value, is_default in content:
+            if is_default:
+                default = value
+            items[name] = value
+        return CompiledHash(items, None, default)
+
+    make_string = CompiledString
+
+    def make_complex_string(self, content, excerpt):
+        return make_complex_string(content, excerpt.text)
+
+    # Expressions
+
+    def make_conditional_expression(self, test, consequent, alternate):
+        if isinstance(test, CompiledLiteral):
+            try:
+                return consequent if test.evaluate_bool(None) else alternate
+            except StandardError as e:
+                return CompiledError(type(e), e.args)
+        return CompiledConditional(test, consequent, alternate)
+
+    def make_logical_operator(self, token):
+        return token
+
+    def make_logical_expression(self, token, left, right):
+        cls = Compiler.logical_operator_classes[token]
+        if isinstance(left, CompiledLiteral):
+            try:
+                left_val = left.evaluate_bool(None)
+            except StandardError as e:
+                return CompiledError(type(e), e.args)
+            if left_val == (cls is CompiledOr):
+                return CompiledBoolean(left_val)
+        return self._compiler.fold(cls(left, right), left, right)
+
+    make_binary_operator = make_logical_operator
+
+    def make_binary_expression(self, token, left, right):
+        return self._compiler.fold(Compiler.binary_operator_classes[token](left, right), left, right)
+
+    make_unary_operator = make_logical_operator
+
+    def make_unary_expression(self, token, arg):
+        return self._compiler.fold(Compiler.unary_operator_classes[token](arg), arg)
+
+    def make_parenthesis_expression(self, expr):
+        return expr
+
+    def make_property_expression(self, expr, prop, computed):
+        return CompiledPropertyAccess(expr, prop if computed else CompiledString(prop))
+
+    def make_attribute_expression(self, expr, attr, computed):
+        return CompiledAttributeAccess(expr, attr if computed else CompiledString(attr))
+
+    make_call_expression = CompiledCall
+
+    make_number = CompiledNumber
+
+    def make_entry_reference(self, name):
+        return CompiledEntryAccess(self.cstate.collected_entries, name)
+
+    def make_this_expression(self):
+        return CompiledEntryAccess(self.cstate.collected_entries, self._compiler.entry_name)
+
+    make_globals_expression = CompiledGlobalAccess
+
+    def make_variable(self, name):
+        try:
+            return CompiledLocalAccess(self._compiler.local_names.index(name))
+        except ValueError:
+            return CompiledVariableAccess(name)
+
+    # Helper methods
+
+    def _index_value(self, value, index, depth):
+        # Set index items of the given value and the hashes nested in it, as Compiler.compile_hash does
+        if isinstance(value, CompiledHash):
+            if depth < len(index):
+                value._index_item = index[depth]
+            for item in value._items.itervalues():
+                self._index_value(item, index, depth + 1)
+        return value
+
+    def _make_tail(self, expr):
+        # Replace recursive calls of the current macro in tail positions, see Compiler.compile_tail_expression
+        if isinstance(expr, CompiledCall):
+            callee = expr._callee
+            if (isinstance(callee, CompiledEntryAccess) and callee._name == self._compiler.entry_name and
+                    len(expr._args) == len(self._compiler.local_names)):
+                return True, CompiledTailCall(expr._args)
+        elif isinstance(expr, CompiledConditional):
+            consequent_has_tail, consequent = self._make_tail(expr._consequent)
+            alternate_has_tail, alternate = self._make_tail(expr._alternate)
+            return consequent_has_tail or alternate_has_tail, CompiledConditional(expr._test, consequent, alternate)
+        return False, expr
+
+
+def compile_fused(source, closures=False, names=None):
+    """
+    Parse and compile the given source in a single pass. Equivalent to compile_syntax(parse_source(source)),
+    but faster and without keeping the whole syntax tree in memory. Not available in debug mode, which needs
+    positions of syntax nodes. Names are interned in the given dict (see parser.Tokenizer).
+    """
+    cstate = FusedCompiler(Tokenizer(source, names=names)).compile()
+    if closures:
+        from .closures import compile_closures
+        compile_closures(cstate)
+    return cstate, cstate.import_uris, cstate.import_cstates
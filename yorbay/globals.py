@@ -1,15 +1,55 @@
 from __future__ import unicode_literals
 
+from contextlib import contextmanager
 from datetime import datetime
 import platform
+import threading
+import time
+
+
+class Volatility(object):
+    """
+    Declares for how long a value of a global may be reused. Values are reused only while
+    a given period lasts, e.g. for the whole lifetime of the process (CONSTANT) or until
+    a wall-clock period of the given length ends (every(seconds)).
+    """
+
+    def __init__(self, name, period=None):
+        self.name = name
+        self.period = period
+
+    def __repr__(self):
+        return '<Volatility {0}>'.format(self.name)
+
+
+# Value never changes, so it may be substituted into translations in advance (see Context.specialize)
+CONSTANT = Volatility('constant')
+# Value is fetched once per request (see Context.request), or once per call outside of requests
+PER_REQUEST = Volatility('per request')
+# Value is fetched once per call of Context
+PER_CALL = Volatility('per call')
+
+
+def every(seconds):
+    """
+    Return volatility of globals whose values change at most once per period of the given length.
+    Periods are aligned to the epoch, so e.g. every(60) periods start at full minutes.
+    """
+    if seconds <= 0:
+        raise ValueError('Period must be positive, got {0!r}'.format(seconds))
+    return Volatility('every {0}s'.format(seconds), seconds)
 
 
 class Global(object):
+    volatility = PER_CALL
+
     def get(self):
         raise NotImplementedError
 
 
-class OsGlobal(object):
+class OsGlobal(Global):
+    volatility = CONSTANT
+
     def get(self):
         system = platform.system()
         if system == 'Linux':
@@ -21,7 +61,10 @@ class OsGlobal(object):
         return 'unknown'
 
 
-class HourGlobal(object):
+class HourGlobal(Global):
+    # Hours start at full minutes in all time zones, so values cached for a minute are always accurate
+    volatility = every(60)
+
     def get(self):
         return datetime.now().hour
 
@@ -30,3 +73,85 @@ default_globals = dict(
     os=OsGlobal(),
     hour=HourGlobal(),
 )
+
+
+def get_volatility(glob):
+    return getattr(glob, 'volatility', PER_CALL)
+
+
+class GlobalCache(object):
+    """
+    Shares values of globals between calls of a Context, according to their volatility.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._local = threading.local()
+
+    def wrap(self, globals):
+        """
+        Return a mapping of globals whose values are cached by this cache. Globals fetched once
+        per call are returned as they are.
+        """
+        wrapped = {}
+        for name, glob in globals.iteritems():
+            volatility = get_volatility(glob)
+            if volatility is PER_REQUEST:
+                glob = RequestCachedGlobal(glob, self)
+            elif volatility is CONSTANT or volatility.period is not None:
+                glob = TimeCachedGlobal(glob, self)
+            wrapped[name] = glob
+        return wrapped
+
+    @contextmanager
+    def request(self):
+        outer = getattr(self._local, 'values', None)
+        self._local.values = {}
+        try:
+            yield
+        finally:
+            self._local.values = outer
+
+    def get_request_values(self):
+        return getattr(self._local, 'values', None)
+
+    def get_period(self, volatility):
+        if volatility is CONSTANT:
+            return 0
+        return int(self._clock() // volatility.period)
+
+
+class TimeCachedGlobal(Global):
+    def __init__(self, glob, cache):
+        self.volatility = get_volatility(glob)
+        self._glob = glob
+        self._cache = cache
+        self._cached = None
+
+    def get(self):
+        period = self._cache.get_period(self.volatility)
+        # Tuple is replaced as a whole, so it is never seen half-updated by other threads
+        cached = self._cached
+        if cached is not None and cached[0] == period:
+            return cached[1]
+        value = self._glob.get()
+        self._cached = period, value
+        return value
+
+
+class RequestCachedGlobal(Global):
+    volatility = PER_REQUEST
+
+    def __init__(self, glob, cache):
+        self._glob = glob
+        self._cache = cache
+
+    def get(self):
+        values = self._cache.get_request_values()
+        if values is None:
+            return self._glob.get()
+        try:
+            return values[id(self)]
+        except KeyError:
+            value = values[id(self)] = self._glob.get()
+            return value
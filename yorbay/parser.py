@@ -2,19 +2,77 @@ from __future__ import unicode_literals
 
 from . import syntax
 
+from collections import namedtuple
 import re
 
 
+# White space preceding a token is matched together with it. Tokenizer.next_token dispatches on the index
+# of the matched group.
 _token_re = re.compile(r'''
-    ([ \n\r\t]+)|  # group 1: whitespace
-    (/\*)|  # group 2: comment start
-    ([@$]?[a-zA-Z_][a-zA-Z0-9_]*)|  # group 3: identifiers
-    (::\[|::|==|!=|<=|>=|&&|\|\||[?!:<>(){}[\]+\-*/%~,\.])|  # group 4: symbols
-    ("(?:"")?|'(?:'')?)|  # group 5: string start
-    (\d+)  # group 6: number
+    [ \n\r\t]*
+    (?:
+        (/\*)|  # group 1: comment start
+        (::\[|::|==|!=|<=|>=|&&|\|\||[?!:<>(){}[\]+\-*/%~,\.])|  # group 2: symbols
+        ([a-zA-Z_][a-zA-Z0-9_]*)|  # group 3: identifier
+        ("(?:"")?|'(?:'')?)|  # group 4: string start
+        \$([a-zA-Z_][a-zA-Z0-9_]*)|  # group 5: variable
+        (\d+)|  # group 6: number
+        @([a-zA-Z_][a-zA-Z0-9_]*)|  # group 7: global
+        (\Z)  # group 8: end of input
+    )
 ''', re.VERBOSE)
-
-_safe_str_chars_re = re.compile(r'''[^{'"\\]+''')
+_ws_re = re.compile(r'[ \n\r\t]*')
+
+
+def _make_text_re(delim):
+    # Matches a whole segment of a string, up to its end or a placeable. Escapes and single braces are
+    # included, as well as quotes not forming the delimiter of a triple-quoted string.
+    quote = delim[0]
+    special = r'\\.|\{(?!\{)'
+    if len(delim) == 3:
+        special += '|{0}(?!{0}{0})'.format(quote)
+    return re.compile(r'[^{0}\\{{]*(?:(?:{1})[^{0}\\{{]*)*'.format(quote, special), re.DOTALL)
+
+
+_text_res = dict((delim, _make_text_re(delim)) for delim in ('"', "'", '"""', "'''"))
+
+# Regular expressions used by EntryParser.skim. Entries are usually matched as a whole by _skim_entry_re,
+# which handles strings without triple quotes, with placeables holding no braces, nested in at most two
+# levels of braces. Other entries are scanned by EntryParser._skim_body. Loops are unrolled (runs of ordinary
+# characters alternate with special constructs), so that failed matches do not backtrack excessively.
+_skim_ws_re = re.compile(r'[ \n\r\t]*')
+_skim_head_re = re.compile(r'<[a-zA-Z_][a-zA-Z0-9_]*(?=[(\[ \n\r\t])')
+_skim_str = r'''(?:"(?!"")[^"\\{]*(?:(?:\\.|\{(?!\{))[^"\\{]*)*"|'(?!'')[^'\\{]*(?:(?:\\.|\{(?!\{))[^'\\{]*)*')'''
+_skim_placeable = r'''\{\{[^"'{}]*(?:%s[^"'{}]*)*\}\}''' % _skim_str
+_skim_complex_str = r'''(?:
+    "(?!"")[^"\\{]*(?:(?:\\.|\{(?!\{)|%(p)s)[^"\\{]*)*"|
+    '(?!'')[^'\\{]*(?:(?:\\.|\{(?!\{)|%(p)s)[^'\\{]*)*'
+)''' % dict(p=_skim_placeable)
+_skim_entry_re = re.compile(r'''
+    <([a-zA-Z_][a-zA-Z0-9_]*)(?=[(\[ \n\r\t])
+    (?:
+        [ \n\r\t]+(?:"(?!"")([^"\\{]*)"|'(?!'')([^'\\{]*)')[ \n\r\t]*>|  # groups 2, 3: single string without escapes
+        [^"'(){}\[\]<>/]*
+        (?:
+            (?:
+                %(complex_str)s|
+                \{[^"'{}]*(?:(?:%(complex_str)s|\{[^"'{}]*(?:%(complex_str)s[^"'{}]*)*\})[^"'{}]*)*\}|
+                \[[^"'\[\]]*(?:%(complex_str)s[^"'\[\]]*)*\]|
+                \([^"'()]*(?:%(complex_str)s[^"'()]*)*\)
+            )
+            [^"'(){}\[\]<>/]*
+        )*>
+    )
+''' % dict(complex_str=_skim_complex_str), re.VERBOSE | re.DOTALL)
+_skim_body_re = re.compile(r'''
+    (>)|  # group 1: end of entry (or an operator, if inside of brackets)
+    ([(\[{])|  # group 2: opening brackets
+    ([)\]}])|  # group 3: closing brackets
+    ("""|\'\'\'|"|')|  # group 4: string start
+    (/\*)  # group 5: comment start
+''', re.VERBOSE)
+_skim_text_res = dict((delim, re.compile(r'\\.|\{\{|' + delim, re.DOTALL))
+                      for delim in ('"', "'", '"""', "'''"))
 
 
 class ParserError(Exception):
@@ -25,103 +83,131 @@ class ParserError(Exception):
 
 # Token types:
 #   ? : < > ( ) { } + - * / % == != < > <= >= ! :: ~ && || , .
-#   eof ident var str_start num glob ws comment
+#   eof ident var str_start num glob comment
 # Text token types:
 #   eof {{ expr_start str_end str
 class Token(object):
+    # Tokens without values (and string starts) are shared, so they must not be modified
+    __slots__ = ('type', 'value')
+
     def __init__(self, type, value):
         self.type = type
         self.value = value
 
 
+_eof_token = Token('eof', None)
+_symbol_tokens = dict((symbol, Token(symbol, None)) for symbol in (
+    '::[', '::', '==', '!=', '<=', '>=', '&&', '||', '?', '!', ':', '<', '>', '(', ')', '{', '}', '[', ']',
+    '+', '-', '*', '/', '%', '~', ',', '.'))
+_str_start_tokens = dict((delim, Token('str_start', delim)) for delim in ('"', "'", '"""', "'''"))
+_expr_start_token = Token('expr_start', None)
+_str_end_token = Token('str_end', None)
+
+
 class Tokenizer(object):
-    def __init__(self, source, origin=None):
+    # Names of identifiers, variables and globals are interned in the names dict, which may be shared by
+    # tokenizers of a whole build, so that all references to an entry share a single string
+    def __init__(self, source, origin=None, names=None):
         self._s = source
         self._origin = origin
+        self._names = {} if names is None else names
         self._pos = 0  # current position in input string
-        self._line = 0  # current line (counting from zero)
-        self._line_start = 0  # position where current line starts
         self._size = len(source)
 
     def get_offset(self):
         return self._pos
 
-    def get_position(self):
-        return syntax.Position(self._line, self._pos - self._line_start, self._origin)
+    def seek(self, offset):
+        self._pos = offset
 
-    def get_source(self, start, end):
-        return self._s[start:end]
+    def get_position(self, offset=None):
+        if self._origin is None:
+            # Outside of debug mode positions are needed only for errors, so the origin is created for the first one
+            self._origin = syntax.Origin(self._s, '')
+        return syntax.Position.at_offset(self._pos if offset is None else offset, self._origin)
 
-    def _linescan(self):
-        pos = self._s.rfind('\n', self._line_start, self._pos)
-        if pos != -1:
-            self._line += self._s.count('\n', self._line_start, pos) + 1
-            self._line_start = pos + 1
+    def get_excerpt(self, start, end):
+        return syntax.Excerpt(self._s, start, end)
 
     def next_token(self):
-        if self._pos == self._size:
-            return Token('eof', None)
-
-        match = _token_re.match(self._s, self._pos)
-        if not match:
+        # Return the next token, its offset and whether it is preceded by white space
+        pos = self._pos
+        match = _token_re.match(self._s, pos)
+        if match is None:
+            self._pos = _ws_re.match(self._s, pos).end()
             raise ParserError('Unrecognized character: "{0}"'.format(self._s[self._pos]), pos=self.get_position())
 
+        # Groups are checked starting from the most frequent tokens
+        group = match.lastindex
+        start = match.start(group)
         self._pos = match.end()
-        if match.start(1) != -1:
-            type, value = 'ws', None
-            self._linescan()
-        elif match.start(2) != -1:
+        if group == 2:
+            token = _symbol_tokens[match.group(2)]
+        elif group == 3:
+            name = match.group(3)
+            token = Token('ident', self._names.setdefault(name, name))
+        elif group == 4:
+            token = _str_start_tokens[match.group(4)]
+        elif group == 5:
+            name = match.group(5)
+            token = Token('var', self._names.setdefault(name, name))
+            start -= 1  # "$" is not a part of the group
+        elif group == 1:
             comment_end = self._s.find('*/', self._pos)
             if comment_end == -1:
                 self._pos = self._size
-                self._linescan()
                 raise ParserError('Unclosed comment', pos=self.get_position())
-            type, value = 'comment', self._s[self._pos: comment_end]
+            token = Token('comment', self._s[self._pos:comment_end])
             self._pos = comment_end + 2  # skip '*/'
-            self._linescan()
-        elif match.start(3) != -1:
-            ident = match.group(3)
-            if ident[0] == '@':
-                type, value = 'glob', ident[1:]
-            elif ident[0] == '$':
-                type, value = 'var', ident[1:]
-            else:
-                type, value = 'ident', ident
-        elif match.start(4) != -1:
-            type, value = match.group(4), None
-        elif match.start(5) != -1:
-            type, value = 'str_start', match.group(5)
+        elif group == 6:
+            token = Token('num', int(match.group(6)))
+        elif group == 7:
+            name = match.group(7)
+            token = Token('glob', self._names.setdefault(name, name))
+            start -= 1
         else:
-            type, value = 'num', int(match.group(6))
-
-        return Token(type, value)
+            token = _eof_token
+        return token, start, start != pos
 
     def next_text_token(self, delim):
-        if self._pos == self._size:
-            return Token('eof', None)
+        # Text is returned in whole segments, so str tokens are always followed by other tokens
+        start = self._pos
+        end = _text_res[delim].match(self._s, start).end()
+        if end != start:
+            value = self._s[start:end]
+            if '\\' in value:
+                value = self._decode_escapes(start, end)
+            else:
+                value = unicode(value)  # source may be a byte string
+            self._pos = end
+            return Token('str', value)
 
-        if self._s[self._pos: self._pos + len(delim)] == delim:
-            type, value = 'str_end', None
+        if start == self._size:
+            return _eof_token
+        elif self._s.startswith(delim, start):
             self._pos += len(delim)
-        elif self._s[self._pos: self._pos + 2] == '{{':
-            type, value = 'expr_start', None
+            return _str_end_token
+        elif self._s.startswith('{{', start):
             self._pos += 2
-        elif self._s[self._pos] == '\\':
-            type = 'str'
-            value, size = self._parse_escape()
-            self._pos += size
-            self._linescan()
+            return _expr_start_token
         else:
-            type, value = 'str', self._s[self._pos]
-            match = _safe_str_chars_re.match(self._s, self._pos + 1)
-            if match:
-                value += match.group()
-                self._pos = match.end()
-            else:
-                self._pos += 1
-            self._linescan()
+            # Only a backslash ending the input is not matched by segments
+            self._parse_escape()
+            raise AssertionError('Escape at the end of input not detected')
 
-        return Token(type, value)
+    def _decode_escapes(self, start, end):
+        buf = []
+        while True:
+            escape = self._s.find('\\', start, end)
+            if escape == -1:
+                break
+            buf.append(self._s[start:escape])
+            self._pos = escape
+            value, size = self._parse_escape()
+            buf.append(value)
+            start = escape + size
+        buf.append(self._s[start:end])
+        return ''.join(buf)
 
     def _parse_escape(self):
         if self._size - self._pos < 2:
@@ -136,10 +222,7 @@ class Tokenizer(object):
                 if 0xdc00 <= uarg2 <= 0xdfff:  # low surrogate
                     return unichr(0x10000 + (((uarg - 0xd800) << 10) | (uarg2 - 0xdc00))), 12
                 else:
-                    raise ParserError(
-                        'Invalid escape - not a low surrogate',
-                        pos=syntax.Position(self._line, self._pos + 6 - self._line_start, self._origin)
-                    )
+                    raise ParserError('Invalid escape - not a low surrogate', pos=self.get_position(self._pos + 6))
             elif 0xdc00 <= uarg <= 0xdfff:  # low surrogate
                 raise ParserError('Invalid escape - low surrogate', pos=self.get_position())
             else:
@@ -187,29 +270,24 @@ class Parser(object):
     def __init__(self, tokenizer):
         self._tokenizer = tokenizer
         self.token = None
-        self.pos = self._tokenizer.get_position()
+        self.offset = self._tokenizer.get_offset()
         self.push_pos()
         self.ws_before = False
         self.next_token()
 
+    @property
+    def pos(self):
+        # Position of the current token
+        return self._tokenizer.get_position(self.offset)
+
     def next_token(self):
-        pos = self._tokenizer.get_position()
-        token = self._tokenizer.next_token()
-        if token.type == 'ws':
-            ws_before = True
-            pos = self._tokenizer.get_position()
-            token = self._tokenizer.next_token()
-        else:
-            ws_before = False
-        self.pos = pos
-        self.token = token
-        self.ws_before = ws_before
+        self.token, self.offset, self.ws_before = self._tokenizer.next_token()
 
     next_token_pp = next_token
     pp_next_token_pp = next_token
 
     def next_text_token(self, delim):
-        self.pos = self._tokenizer.get_position()
+        self.offset = self._tokenizer.get_offset()
         self.token = self._tokenizer.next_text_token(delim)
         self.ws_before = False
 
@@ -246,6 +324,42 @@ class Parser(object):
     try_skip_token_pp = try_skip_token
     pp_try_skip_token_pp = try_skip_token
 
+    # Nodes are created by these factories, so that subclasses may create other objects instead (see
+    # fused.FusedCompiler). Identifiers created by make_identifier are passed to other factories.
+    make_identifier = syntax.Identifier
+    make_entry_reference = syntax.Identifier  # identifier used as an expression
+    make_comment = syntax.Comment
+    make_import_statement = syntax.ImportStatement
+    make_entity = syntax.Entity
+    make_attribute = syntax.Attribute
+    make_macro = syntax.Macro
+    make_hash = syntax.Hash
+    make_hash_item = syntax.HashItem
+    make_string = syntax.String
+    make_complex_string = syntax.ComplexString
+    make_conditional_expression = syntax.ConditionalExpression
+    make_logical_expression = syntax.LogicalExpression
+    make_logical_operator = syntax.LogicalOperator
+    make_binary_expression = syntax.BinaryExpression
+    make_binary_operator = syntax.BinaryOperator
+    make_unary_expression = syntax.UnaryExpression
+    make_unary_operator = syntax.UnaryOperator
+    make_parenthesis_expression = syntax.ParenthesisExpression
+    make_property_expression = syntax.PropertyExpression
+    make_attribute_expression = syntax.AttributeExpression
+    make_call_expression = syntax.CallExpression
+    make_number = syntax.Number
+    make_this_expression = syntax.ThisExpression
+    make_globals_expression = syntax.GlobalsExpression
+    make_variable = syntax.Variable
+
+    # Called when the name of an entity, or the name and arguments of a macro are parsed
+    def begin_entity(self, ident):
+        pass
+
+    def begin_macro(self, ident, args):
+        pass
+
     def push_pos(self):
         pass
 
@@ -260,25 +374,33 @@ class Parser(object):
 
     def parse_l20n(self):
         entries = []
+        offsets = []
 
         while self.token.type != 'eof':
             self.push_pos()
+            offsets.append(self.offset)
             entries.append(self.parse_entry())
 
-        return self.pop_pos(syntax.L20n(entries))
+        l20n = syntax.L20n(entries)
+        l20n.offsets = offsets
+        return self.pop_pos(l20n)
 
     def parse_entry(self):
         if self.token.type == '<':
             self.next_token_pp()
             if self.token.type == 'ident' and self.ws_before:
                 raise self.error('Unexpected white space between "<" and entity/macro name')
+            name = self.token.value
             ident = self.parse_identifier()
             if self.token.type == '(':
                 if self.ws_before:
                     raise self.error('Unexpected white space between macro name and "("')
                 self.next_token_pp()
+                if name[0] == '_':
+                    raise self.error('Macro identifier cannot start with "_"')
                 return self.parse_macro_tail(ident)
             else:
+                self.begin_entity(ident)
                 if self.token.type == '[':
                     if self.ws_before:
                         raise self.error('Unexpected white space between entity name and "["')
@@ -292,7 +414,7 @@ class Parser(object):
         if self.token.type == 'comment':
             content = self.token.value
             self.next_token()
-            return self.pop_pos(syntax.Comment(content))
+            return self.pop_pos(self.make_comment(content))
 
         if self.token.type == 'ident' and self.token.value == 'import':
             self.next_token()
@@ -305,17 +427,16 @@ class Parser(object):
             raise self.error_expected('identifier')
         name = self.token.value
         self.next_token()
-        return self.pop_pos(syntax.Identifier(name))
+        return self.pop_pos(self.make_identifier(name))
 
     def parse_macro_tail(self, ident):
-        if ident.name[0] == '_':
-            raise self.error('Macro identifier cannot start with "_"')
-        args = self.parse_item_list(self.parse_variable, ')')
+        args = self.parse_item_list(self.parse_macro_argument, ')')
+        self.begin_macro(ident, args)
         self.skip_token_pp('{')
         exp = self.parse_expression()
         self.skip_token('}')
         self.skip_token('>')
-        return self.pop_pos(syntax.Macro(ident, args, exp))
+        return self.pop_pos(self.make_macro(ident, args, exp))
 
     def parse_expression(self):
         exp = self.parse_or_expression()
@@ -325,50 +446,52 @@ class Parser(object):
         consequent = self.parse_expression()
         self.skip_token_pp(':')
         alternate = self.parse_expression()
-        return self.pop_pos(syntax.ConditionalExpression(exp, consequent, alternate))
+        return self.pop_pos(self.make_conditional_expression(exp, consequent, alternate))
 
     def parse_or_expression(self):
-        return self.parse_prefix_expression(('||', ), syntax.LogicalExpression,
-                                            syntax.LogicalOperator, self.parse_and_expression)
+        return self.parse_prefix_expression(('||', ), self.make_logical_expression,
+                                            self.make_logical_operator, self.parse_and_expression)
 
     def parse_and_expression(self):
-        return self.parse_prefix_expression(('&&', ), syntax.LogicalExpression,
-                                            syntax.LogicalOperator, self.parse_equality_expression)
+        return self.parse_prefix_expression(('&&', ), self.make_logical_expression,
+                                            self.make_logical_operator, self.parse_equality_expression)
 
     def parse_equality_expression(self):
-        return self.parse_prefix_expression(('==', '!='), syntax.BinaryExpression,
-                                            syntax.BinaryOperator, self.parse_relational_expression)
+        return self.parse_prefix_expression(('==', '!='), self.make_binary_expression,
+                                            self.make_binary_operator, self.parse_relational_expression)
 
     def parse_relational_expression(self):
-        return self.parse_prefix_expression(('<', '<=', '>', '>='), syntax.BinaryExpression,
-                                            syntax.BinaryOperator, self.parse_additive_expression)
+        return self.parse_prefix_expression(('<', '<=', '>', '>='), self.make_binary_expression,
+                                            self.make_binary_operator, self.parse_additive_expression)
 
     def parse_additive_expression(self):
-        return self.parse_prefix_expression(('+', '-'), syntax.BinaryExpression,
-                                            syntax.BinaryOperator, self.parse_modulo_expression)
+        return self.parse_prefix_expression(('+', '-'), self.make_binary_expression,
+                                            self.make_binary_operator, self.parse_modulo_expression)
 
     def parse_modulo_expression(self):
-        return self.parse_prefix_expression(('%', ), syntax.BinaryExpression,
-                                            syntax.BinaryOperator, self.parse_multiplicative_expression)
+        return self.parse_prefix_expression(('%', ), self.make_binary_expression,
+                                            self.make_binary_operator, self.parse_multiplicative_expression)
 
     def parse_multiplicative_expression(self):
-        return self.parse_prefix_expression(('*', ), syntax.BinaryExpression,
-                                            syntax.BinaryOperator, self.parse_dividive_expression)
+        return self.parse_prefix_expression(('*', ), self.make_binary_expression,
+                                            self.make_binary_operator, self.parse_dividive_expression)
 
     def parse_dividive_expression(self):
-        return self.parse_prefix_expression(('/', ), syntax.BinaryExpression,
-                                            syntax.BinaryOperator, self.parse_unary_expression)
+        return self.parse_prefix_expression(('/', ), self.make_binary_expression,
+                                            self.make_binary_operator, self.parse_unary_expression)
 
     def parse_unary_expression(self):
         if self.token.type in ('+', '-', '!'):
             type = self.token.type
             self.next_token_pp()
             exp = self.parse_unary_expression()
-            return self.pop_pos(syntax.UnaryExpression(self.put_pos(syntax.UnaryOperator(type)), exp))
+            return self.pop_pos(self.make_unary_expression(self.put_pos(self.make_unary_operator(type)), exp))
         else:
             return self.parse_member_expression()
 
     def parse_member_expression(self):
+        # Attributes may be accessed only on entity names, this ("~") and expressions in parentheses
+        attributes_allowed = self.token.type in ('ident', '~', '(')
         exp = self.parse_parenthesis_expression()
         while True:
             if self.pp_try_skip_token_pp('.', allow_ws_before=False):
@@ -376,19 +499,20 @@ class Parser(object):
             elif self.pp_try_skip_token_pp('[', allow_ws_before=False):
                 exp = self.parse_property_expression_tail(exp, True)
             elif self.pp_try_skip_token_pp('::', allow_ws_before=False):
-                exp = self.parse_attribute_expression_tail(exp, False)
+                exp = self.parse_attribute_expression_tail(exp, False, attributes_allowed)
             elif self.pp_try_skip_token_pp('::[', allow_ws_before=False):
-                exp = self.parse_attribute_expression_tail(exp, True)
+                exp = self.parse_attribute_expression_tail(exp, True, attributes_allowed)
             elif self.pp_try_skip_token_pp('(', allow_ws_before=False):
                 exp = self.parse_call_expression_tail(exp)
             else:
                 return exp
+            attributes_allowed = False
 
     def parse_parenthesis_expression(self):
         if self.try_skip_token_pp('('):
             exp = self.parse_expression()
             self.skip_token(')')
-            return self.pop_pos(syntax.ParenthesisExpression(exp))
+            return self.pop_pos(self.make_parenthesis_expression(exp))
         else:
             return self.parse_primary_expression()
 
@@ -400,10 +524,10 @@ class Parser(object):
             if self.token.type == 'ident' and self.ws_before:
                 raise self.error('Unexpected white space between "." and property name')
             property = self.parse_identifier()
-        return self.pop_pos(syntax.PropertyExpression(expression, property, computed))
+        return self.pop_pos(self.make_property_expression(expression, property, computed))
 
-    def parse_attribute_expression_tail(self, expression, computed):
-        if not isinstance(expression, (syntax.ParenthesisExpression, syntax.Identifier, syntax.ThisExpression)):
+    def parse_attribute_expression_tail(self, expression, computed, allowed):
+        if not allowed:
             raise self.error('The left expression of attribute access must be entity name, this ("~") or parentheses')
         if computed:
             attribute = self.parse_expression()
@@ -412,25 +536,27 @@ class Parser(object):
             if self.token.type == 'ident' and self.ws_before:
                 raise self.error('Unexpected white space between "::" and attribute name')
             attribute = self.parse_identifier()
-        return self.pop_pos(syntax.AttributeExpression(expression, attribute, computed))
+        return self.pop_pos(self.make_attribute_expression(expression, attribute, computed))
 
     def parse_call_expression_tail(self, callee):
         args = self.parse_item_list(self.parse_expression, ')')
-        return self.pop_pos(syntax.CallExpression(callee, args))
+        return self.pop_pos(self.make_call_expression(callee, args))
 
     def parse_primary_expression(self):
         if self.token.type == 'num':
             value = self.token.value
             self.next_token()
-            return self.pop_pos(syntax.Number(value))
+            return self.pop_pos(self.make_number(value))
         elif self.token.type == 'ident':
-            return self.parse_identifier()
+            name = self.token.value
+            self.next_token()
+            return self.pop_pos(self.make_entry_reference(name))
         elif self.try_skip_token('~'):
-            return self.pop_pos(syntax.ThisExpression())
+            return self.pop_pos(self.make_this_expression())
         elif self.token.type == 'glob':
             name = self.token.value
             self.next_token()
-            return self.pop_pos(syntax.GlobalsExpression(self.put_pos(syntax.Identifier(name), shift=1)))
+            return self.pop_pos(self.make_globals_expression(self.put_pos(self.make_identifier(name), shift=1)))
         elif self.token.type == 'var':
             return self.parse_variable()
         else:
@@ -439,7 +565,7 @@ class Parser(object):
                 raise self.error_expected('expression')
             return value
 
-    def parse_prefix_expression(self, types, exp_cls, op_cls, callback):
+    def parse_prefix_expression(self, types, make_exp, make_op, callback):
         exp = callback()
         while True:
             if self.token.type not in types:
@@ -447,14 +573,21 @@ class Parser(object):
             type = self.token.type
             self.pp_next_token_pp()
             right = callback()
-            exp = self.pop_pos(exp_cls(self.put_pos(op_cls(type)), exp, right))
+            exp = self.pop_pos(make_exp(self.put_pos(make_op(type)), exp, right))
 
-    def parse_variable(self):
+    def parse_variable_name(self):
         if self.token.type != 'var':
             raise self.error_expected('variable')
         name = self.token.value
         self.next_token()
-        return self.pop_pos(syntax.Variable(self.put_pos(syntax.Identifier(name), 1)))
+        return name
+
+    def parse_variable(self):
+        name = self.parse_variable_name()
+        return self.pop_pos(self.make_variable(self.put_pos(self.make_identifier(name), 1)))
+
+    # Arguments of macros are variables, but subclasses may represent them in other ways
+    parse_macro_argument = parse_variable
 
     def parse_entity_tail(self, ident, index):
         if not self.ws_before:
@@ -474,7 +607,7 @@ class Parser(object):
             self.push_pos()
             attrs = self.parse_attributes()
 
-        return self.pop_pos(syntax.Entity(ident, value, index, attrs))
+        return self.pop_pos(self.make_entity(ident, value, index, attrs))
 
     def parse_optional_value(self):
         if self.token.type == 'str_start':
@@ -505,11 +638,11 @@ class Parser(object):
             self.push_pos()
             self.push_pos()
             key, value = self.parse_kvp()
-            content.append(self.pop_pos(syntax.HashItem(key, value, def_item)))
+            content.append(self.pop_pos(self.make_hash_item(key, value, def_item)))
             if self.try_skip_token(','):
                 pass
             elif self.try_skip_token('}'):
-                return self.pop_pos(syntax.Hash(content))
+                return self.pop_pos(self.make_hash(content))
             else:
                 raise self.error_expected('"," or "}"')
 
@@ -525,7 +658,7 @@ class Parser(object):
         while True:
             self.push_pos()
             key, value, index = self.parse_kvp_with_index()
-            attrs.append(self.pop_pos(syntax.Attribute(key, value, index)))
+            attrs.append(self.pop_pos(self.make_attribute(key, value, index)))
             if self.try_skip_token('>'):
                 return attrs
             elif not self.ws_before:
@@ -548,31 +681,29 @@ class Parser(object):
         if self.ws_before:
             raise self.error('Unexpected white space between "import" and "("')
         self.next_token_pp()
-        uri = self.parse_string()
-        if not isinstance(uri, syntax.String):
-            raise self.error('Import URI must not contain placeables')
+        uri = self.parse_string(placeables_error='Import URI must not contain placeables')
         self.skip_token(')')
-        return self.pop_pos(syntax.ImportStatement(uri))
+        return self.pop_pos(self.make_import_statement(uri))
 
-    def parse_string(self):
+    def parse_string(self, placeables_error=None):
         if self.token.type != 'str_start':
             raise self.error_expected('string')
         delim = self.token.value
         start = self._tokenizer.get_offset()  # past string start
         self.next_text_token(delim)
 
-        buf = []
         body = []
         while True:
             if self.token.type == 'str':
-                if not buf:
-                    self.push_pos()
-                buf.append(self.token.value)
+                self.push_pos()
+                value = self.token.value
                 self.next_text_token(delim)
+                if self.token.type == 'str_end' and not body:
+                    self.next_token()
+                    self.drop_pos()
+                    return self.pop_pos(self.make_string(value))
+                body.append(self.pop_pos(self.make_string(value)))
             elif self.token.type == 'expr_start':
-                if buf:
-                    body.append(self.pop_pos(syntax.String(''.join(buf))))
-                    buf = []
                 self.next_token_pp()
                 body.append(self.parse_expression())
                 if self.token.type != '}':
@@ -585,12 +716,10 @@ class Parser(object):
                 end = self._tokenizer.get_offset() - len(delim)
                 self.next_token()
                 if not body:
-                    if buf:
-                        self.drop_pos()
-                    return self.pop_pos(syntax.String(''.join(buf)))
-                if buf:
-                    body.append(self.pop_pos(syntax.String(''.join(buf))))
-                return self.pop_pos(syntax.ComplexString(body, self._tokenizer.get_source(start, end)))
+                    return self.pop_pos(self.make_string(''))
+                if placeables_error is not None:
+                    raise self.error(placeables_error)
+                return self.pop_pos(self.make_complex_string(body, self._tokenizer.get_excerpt(start, end)))
             elif self.token.type == 'eof':
                 raise self.error('Unclosed string')
             else:
@@ -612,11 +741,224 @@ class Parser(object):
                 raise self.error_expected('"," or "' + close_type + '"')
 
 
-def parse_source(source, path='', debug=False):
+def parse_source(source, path='', debug=False, names=None):
     if debug:
         from .debug.parser import DebugTokenizer, DebugParser
 
-        parser = DebugParser(DebugTokenizer(source, path))
+        parser = DebugParser(DebugTokenizer(source, path, names=names))
     else:
-        parser = Parser(Tokenizer(source))
+        parser = Parser(Tokenizer(source, names=names))
     return parser.parse_l20n()
+
+
+class _PartOrigin(syntax.Origin):
+    # Origin of a part of a source, starting at the given line and column of the whole source. Only locate
+    # is adjusted, so lines of the whole source are not available.
+    def __init__(self, s, path, line, column):
+        super(_PartOrigin, self).__init__(s, path)
+        self._start_line = line
+        self._start_column = column
+
+    def locate(self, offset):
+        line, column = super(_PartOrigin, self).locate(offset)
+        if line == 0:
+            column += self._start_column
+        return line + self._start_line, column
+
+
+# Parts of the source shorter than this may be prefixes of valid tokens, e.g. "\ud83d\ude0" of a surrogate pair
+_MAX_TOKEN_PREFIX = 12
+
+
+def iter_parse_source(source_or_file, path='', chunk_size=65536):
+    """
+    Parse the given source, or the source read from the given file object, and yield its top-level entries
+    (including comments) one by one. Files are read in chunks of the given size, and only the part of the
+    source holding the current entry is kept in memory, so sources of any size may be parsed, e.g. by
+    compile_entries. Entries have no positions, as in debug mode, but errors have correct lines.
+    """
+    if hasattr(source_or_file, 'read'):
+        read = source_or_file.read
+        buf = read(chunk_size)
+        at_end = not buf
+    else:
+        buf = source_or_file
+        at_end = True
+    line = column = 0
+    names = {}
+
+    while True:
+        start = 0
+        tokenizer = Tokenizer(buf, _PartOrigin(buf, path, line, column), names)
+        try:
+            parser = Parser(tokenizer)
+            while True:
+                start = parser.offset
+                if parser.token.type == 'eof':
+                    if at_end:
+                        return
+                    break
+                entry = parser.parse_entry()
+                # Last token of the entry might be a part of a longer token, unless something follows it
+                if not at_end and parser.offset >= len(buf):
+                    break
+                yield entry
+        except ParserError as e:
+            # Only errors at the end of the buffer may be caused by the source being cut, others are final
+            if at_end or (tokenizer.get_offset() < len(buf) and len(buf) - e.pos.offset >= _MAX_TOKEN_PREFIX):
+                raise
+
+        # Entry at start may continue past the end of the buffer, so it is parsed again with more of the source.
+        # Reads grow with the buffer, so that long entries are not parsed too many times.
+        newlines = buf.count('\n', 0, start)
+        if newlines:
+            line += newlines
+            column = start - buf.rindex('\n', 0, start) - 1
+        else:
+            column += start
+        chunk = read(max(chunk_size, len(buf) - start))
+        at_end = not chunk
+        buf = buf[start:] + chunk
+
+
+# Entry found by EntryParser.skim. Type is one of "entity", "macro" or "import", name is None for imports.
+# Value is set for entities consisting of a single string without escapes and placeables.
+SkimmedEntry = namedtuple('SkimmedEntry', ('type', 'name', 'start', 'end', 'value'))
+
+
+class EntryParser(object):
+    """
+    Parses single entries of the given source, starting at offsets recorded by parse_source
+    (see L20n.offsets) or found by skim. Used to compile entries lazily without keeping their syntax trees.
+    """
+
+    def __init__(self, source, path='', debug=False):
+        self._source = source
+        self._path = path
+        self._debug = debug
+        # Positions of all entries share a single origin, and their names a single dict of interned names
+        self._origin = syntax.Origin(source, path)
+        self._names = {}
+
+    def parse(self, offset):
+        return self._make_parser(offset).parse_entry()
+
+    def parse_skimmed(self, entry):
+        if entry.value is not None and not self._debug:
+            return syntax.Entity(syntax.Identifier(entry.name), syntax.String(entry.value), None, None)
+        return self.parse(entry.start)
+
+    def _make_parser(self, offset):
+        if self._debug:
+            from .debug.parser import DebugTokenizer, DebugParser
+
+            tokenizer = DebugTokenizer(self._source, self._path, self._origin, self._names)
+            tokenizer.seek(offset)
+            return DebugParser(tokenizer)
+        else:
+            tokenizer = Tokenizer(self._source, self._origin, self._names)
+            tokenizer.seek(offset)
+            return Parser(tokenizer)
+
+    def skim(self):
+        """
+        Return a list of SkimmedEntry for the entries of the source, without parsing them. Comments are skipped.
+
+        Only the boundaries of entries are found, by scanning for brackets and strings, so syntax errors
+        inside of entries are not detected. Entries whose boundaries cannot be found this way are parsed,
+        which raises ParserError for invalid source.
+        """
+        s = self._source
+        size = len(s)
+        pos = 0
+        entries = []
+        while True:
+            pos = _skim_ws_re.match(s, pos).end()
+            if pos == size:
+                return entries
+
+            if s.startswith('/*', pos):
+                end = s.find('*/', pos + 2)
+                if end != -1:
+                    pos = end + 2
+                    continue
+            else:
+                match = _skim_entry_re.match(s, pos)
+                if match is not None:
+                    type = 'macro' if s[match.end(1)] == '(' else 'entity'
+                    value = match.group(2) if match.group(3) is None else match.group(3)
+                    if value is not None:
+                        value = unicode(value)  # source may be a byte string
+                    entries.append(SkimmedEntry(type, match.group(1), pos, match.end(), value))
+                    pos = match.end()
+                    continue
+
+                match = _skim_head_re.match(s, pos)
+                if match is not None:
+                    end = self._skim_body(match.end())
+                    if end is not None:
+                        type = 'macro' if s[match.end()] == '(' else 'entity'
+                        entries.append(SkimmedEntry(type, match.group()[1:], pos, end, None))
+                        pos = end
+                        continue
+
+            entry = self._skim_parsed(pos)
+            entries.append(entry)
+            pos = entry.end
+
+    def _skim_body(self, pos):
+        # Return the offset past the end of entry whose body starts at pos, or None if it is not found
+        s = self._source
+        # Open brackets and, for placeables, delimiters of strings they are placed in
+        stack = []
+        while True:
+            match = _skim_body_re.search(s, pos)
+            if match is None:
+                return None
+            pos = match.end()
+            group = match.lastindex
+            if group == 1:
+                if not stack:
+                    return pos
+                continue
+            elif group == 2:
+                stack.append(match.group())
+                continue
+            elif group == 3:
+                if not stack:
+                    return None
+                delim = stack.pop()
+                if delim in '([{':
+                    continue
+                # Placeable ends with "}}", after which the string it is placed in continues
+                if s[pos - 1: pos + 1] != '}}':
+                    return None
+                pos += 1
+            elif group == 4:
+                delim = match.group()
+            else:
+                return None
+
+            text_re = _skim_text_res[delim]
+            while True:
+                match = text_re.search(s, pos)
+                if match is None:
+                    return None
+                pos = match.end()
+                text = match.group()
+                if text == delim:
+                    break
+                if text == '{{':
+                    stack.append(delim)
+                    break
+
+    def _skim_parsed(self, offset):
+        # Used where skimming fails. Raises ParserError, unless the source is valid after all.
+        parser = self._make_parser(offset)
+        node = parser.parse_entry()
+        if isinstance(node, syntax.ImportStatement):
+            return SkimmedEntry('import', None, offset, parser.offset, None)
+        elif isinstance(node, syntax.Macro):
+            return SkimmedEntry('macro', node.id.name, offset, parser.offset, None)
+        else:
+            return SkimmedEntry('entity', node.id.name, offset, parser.offset, None)
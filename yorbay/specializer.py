@@ -0,0 +1,291 @@
+from __future__ import unicode_literals
+
+from .compiler import (
+    Handlers, CompiledL20n, CompiledEntity, CompiledMacro, CompiledTailMacro, CompiledConditional, CompiledLiteral,
+    CompiledString, CompiledNumber, CompiledBoolean, CompiledError, CompiledEquals, CompiledNotEqual,
+    CompiledLessThan, CompiledLessEqual, CompiledGreaterThan, CompiledGreaterEqual, CompiledAdd, CompiledSubtract,
+    CompiledMultiply, CompiledDivide, CompiledModulo, CompiledAnd, CompiledOr, CompiledEntryAccess,
+    CompiledVariableAccess, CompiledGlobalAccess, CompiledComplexString, CompiledNot, CompiledNegative,
+    CompiledPositive, CompiledCall, CompiledTailCall, CompiledPropertyAccess, CompiledAttributeAccess,
+    CompiledHash, evaluate_constant, make_literal
+)
+from .globals import CONSTANT, get_volatility
+
+# Only values of these types are substituted into expressions. Other values may be mutable.
+_literal_classes = frozenset((int, long, float, str, unicode, bool))
+
+_in_progress = object()
+
+
+class LayeredQueries(object):
+    """
+    Read-only mapping of direct queries added by specialization, layered over the direct queries of
+    the original translations. Used when the original queries are not a plain dict (e.g. a string table),
+    so that they are neither copied nor decoded.
+    """
+
+    __slots__ = ('_added', '_base')
+
+    def __init__(self, added, base):
+        self._added = added
+        self._base = base
+
+    def get(self, key, default=None):
+        value = self._added.get(key)
+        if value is None:
+            return self._base.get(key, default)
+        return value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self._added or key in self._base
+
+    def __len__(self):
+        return len(self._base) + sum(1 for key in self._added if key not in self._base)
+
+    def iteritems(self):
+        for item in self._added.iteritems():
+            yield item
+        for key, value in self._base.iteritems():
+            if key not in self._added:
+                yield key, value
+
+    def __iter__(self):
+        return (key for key, _ in self.iteritems())
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self)
+
+
+class Specializer(object):
+    """
+    Rewrites compiled entries, replacing accesses to variables and globals known to be constant with
+    their values and folding expressions which become constant as a result.
+
+    Entries are rewritten together with the scopes they belong to, so that references between them
+    lead to rewritten entries as well. Nodes without a dedicated handler (e.g. closures or debug nodes)
+    are left as they are - they keep referring to the original entries, which evaluate to the same values.
+    """
+
+    def __init__(self, vars, globals):
+        self._vars = vars
+        self._globals = globals
+        self._scopes = {}
+        self._entries = {}
+
+    def specialize_scope(self, entries):
+        try:
+            return self._scopes[id(entries)]
+        except KeyError:
+            pass
+
+        # Registered before entries are rewritten, since they may refer to their own scope
+        scope = self._scopes[id(entries)] = {}
+        for name, entry in entries.iteritems():
+            scope[name] = self.specialize_entry(entry)
+        return scope
+
+    def specialize_entry(self, entry):
+        # Returns None for entries which are being rewritten, i.e. for recursive references
+        specialized = self._entries.get(id(entry))
+        if specialized is None:
+            self._entries[id(entry)] = _in_progress
+            handler = self.entry_handlers.select(entry)
+            specialized = self._entries[id(entry)] = entry if handler is None else handler(entry)
+        return None if specialized is _in_progress else specialized
+
+    def specialize(self, node):
+        handler = self.handlers.select(node)
+        return node if handler is None else handler(node)
+
+    def fold(self, expr, *operands):
+        for operand in operands:
+            if not isinstance(operand, CompiledLiteral):
+                return expr
+        return evaluate_constant(expr)
+
+    # Entry handlers
+
+    entry_handlers = Handlers()
+
+    @entry_handlers.register(CompiledEntity)
+    def specialize_entity(self, entity):
+        attrs = dict((name, self.specialize(attr)) for name, attr in entity._attrs.iteritems())
+        return CompiledEntity(entity._name, self.specialize(entity._content), attrs)
+
+    @entry_handlers.register(CompiledMacro)
+    @entry_handlers.register(CompiledTailMacro)
+    def specialize_macro(self, macro):
+        return type(macro)(macro._name, macro._arg_names, self.specialize(macro._expr))
+
+    # Expression handlers
+
+    handlers = Handlers()
+
+    @handlers.register(CompiledVariableAccess)
+    def specialize_variable_access(self, node):
+        value = self._vars.get(node._name)
+        if value is None or value.__class__ not in _literal_classes:
+            return node
+        return make_literal(value)
+
+    @handlers.register(CompiledGlobalAccess)
+    def specialize_global_access(self, node):
+        glob = self._globals.get(node._name)
+        if glob is None:
+            return node
+        value = glob.get()
+        if value is None or value.__class__ not in _literal_classes:
+            return node
+        return make_literal(value)
+
+    @handlers.register(CompiledEntryAccess)
+    def specialize_entry_access(self, node):
+        return CompiledEntryAccess(self.specialize_scope(node._entries), node._name)
+
+    @handlers.register(CompiledConditional)
+    def specialize_conditional(self, node):
+        test = self.specialize(node._test)
+        if isinstance(test, CompiledLiteral):
+            try:
+                branch = node._consequent if test.evaluate_bool(None) else node._alternate
+            except StandardError as e:
+                return CompiledError(type(e), e.args)
+            return self.specialize(branch)
+        return CompiledConditional(test, self.specialize(node._consequent), self.specialize(node._alternate))
+
+    @handlers.register(CompiledEquals)
+    @handlers.register(CompiledNotEqual)
+    @handlers.register(CompiledLessThan)
+    @handlers.register(CompiledLessEqual)
+    @handlers.register(CompiledGreaterThan)
+    @handlers.register(CompiledGreaterEqual)
+    @handlers.register(CompiledAdd)
+    @handlers.register(CompiledSubtract)
+    @handlers.register(CompiledMultiply)
+    @handlers.register(CompiledDivide)
+    @handlers.register(CompiledModulo)
+    def specialize_binary(self, node):
+        left = self.specialize(node._left)
+        right = self.specialize(node._right)
+        return self.fold(type(node)(left, right), left, right)
+
+    @handlers.register(CompiledAnd)
+    @handlers.register(CompiledOr)
+    def specialize_logical(self, node):
+        cls = type(node)
+        left = self.specialize(node._left)
+        if isinstance(left, CompiledLiteral):
+            try:
+                left_val = left.evaluate_bool(None)
+            except StandardError as e:
+                return CompiledError(type(e), e.args)
+            if left_val == (cls is CompiledOr):
+                return CompiledBoolean(left_val)
+
+        right = self.specialize(node._right)
+        return self.fold(cls(left, right), left, right)
+
+    @handlers.register(CompiledNot)
+    @handlers.register(CompiledNegative)
+    @handlers.register(CompiledPositive)
+    def specialize_unary(self, node):
+        arg = self.specialize(node._arg)
+        return self.fold(type(node)(arg), arg)
+
+    @handlers.register(CompiledComplexString)
+    def specialize_complex_string(self, node):
+        content = [self.specialize_placeable(item) for item in node._content]
+        if all(isinstance(item, (CompiledString, CompiledNumber)) for item in content):
+            buf = []
+            for item in content:
+                item.evaluate_placeable(None, buf)
+            return CompiledString(''.join(buf))
+        return CompiledComplexString(content, node._source)
+
+    def specialize_placeable(self, node):
+        if node.__class__ is CompiledEntryAccess and node._name in node._entries:
+            # Entity placed in a string is replaced with its value, if the value became constant
+            entity = self.specialize_entry(node._entries[node._name])
+            if isinstance(entity, CompiledEntity):
+                value = entity._content.get_direct_string()
+                if value is not None:
+                    return CompiledString(value)
+        return self.specialize(node)
+
+    @handlers.register(CompiledHash)
+    def specialize_hash(self, node):
+        items = {}
+        default = None
+        for key, item in node._items.iteritems():
+            items[key] = self.specialize(item)
+            if item is node._default:
+                default = items[key]
+        index_item = None if node._index_item is None else self.specialize(node._index_item)
+        return CompiledHash(items, index_item, default)
+
+    @handlers.register(CompiledCall)
+    def specialize_call(self, node):
+        return CompiledCall(self.specialize(node._callee), [self.specialize(arg) for arg in node._args])
+
+    @handlers.register(CompiledTailCall)
+    def specialize_tail_call(self, node):
+        return CompiledTailCall([self.specialize(arg) for arg in node._args])
+
+    @handlers.register(CompiledPropertyAccess)
+    def specialize_property_access(self, node):
+        prop = self.specialize(node._prop)
+        if (node._expr.__class__ is CompiledEntryAccess and node._expr._name in node._expr._entries and
+                prop.__class__ is CompiledString):
+            # Item of an entity hash, e.g. brand["short"], is replaced with its value, if it is constant
+            entity = self.specialize_entry(node._expr._entries[node._expr._name])
+            if isinstance(entity, CompiledEntity) and entity._content.__class__ is CompiledHash:
+                item = entity._content._items.get(prop._value)
+                if item is None and entity._content._index_item is None:
+                    item = entity._content._default
+                value = None if item is None else item.get_direct_string()
+                if value is not None:
+                    return CompiledString(value)
+        return CompiledPropertyAccess(self.specialize(node._expr), prop)
+
+    @handlers.register(CompiledAttributeAccess)
+    def specialize_attribute_access(self, node):
+        return CompiledAttributeAccess(self.specialize(node._expr), self.specialize(node._attr))
+
+
+def specialize(l20n, vars=None, globals=None):
+    """
+    Return a copy of compiled translations specialized against the given variables and globals,
+    which must not change during the lifetime of the copy. Entities whose values become simple
+    strings are added to direct_queries.
+
+    Only globals declaring themselves constant are taken into account.
+    """
+    constant_globals = dict((name, glob) for name, glob in (globals or {}).iteritems()
+                            if get_volatility(glob) is CONSTANT)
+    specializer = Specializer(vars or {}, constant_globals)
+    entries = specializer.specialize_scope(l20n._entries)
+
+    added_queries = {}
+    template_queries = {}
+    for entry in entries.itervalues():
+        entry.populate_direct_queries(added_queries)
+        entry.populate_template_queries(template_queries)
+    # Queries that became direct are resolved without templates. Original direct queries have none.
+    for query in added_queries:
+        template_queries.pop(query, None)
+
+    if isinstance(l20n.direct_queries, dict):
+        direct_queries = dict(l20n.direct_queries)
+        direct_queries.update(added_queries)
+    else:
+        direct_queries = LayeredQueries(added_queries, l20n.direct_queries)
+
+    return CompiledL20n(entries, direct_queries, template_queries)
@@ -0,0 +1,220 @@
+from __future__ import unicode_literals
+
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+
+from .builder import build_from_path
+from .compiler import CompiledEntity, CompiledString
+from .exceptions import BuildError
+
+# File format (integers are little-endian and unsigned):
+#   header: magic, format version, number of slots (a power of two), number of strings
+#   slots: key hash, key offset, key length, value offset and value length of each slot
+#   data: UTF-8 encoded keys and values
+# Keys are placed in slots by hashes (CRC-32 of their UTF-8 encodings), using linear probing. Offsets
+# are counted from the start of the file, so empty slots are recognized by zero key offsets.
+_MAGIC = b'YSTB'
+FORMAT_VERSION = 1
+_header_struct = struct.Struct(b'<4sIII')
+_slot_struct = struct.Struct(b'<IIIII')
+
+
+class StringTableError(BuildError):
+    pass
+
+
+def _hash(data):
+    return zlib.crc32(data) & 0xffffffff
+
+
+def write_string_table(path, strings):
+    """
+    Write a string table mapping keys of the given mapping to their values. The file is replaced
+    atomically, so processes reading the previous version are not affected.
+    """
+    items = [(key.encode('UTF-8'), value.encode('UTF-8')) for key, value in strings.iteritems()]
+    slot_count = 1
+    while slot_count < 2 * len(items):
+        slot_count *= 2
+
+    slots = [None] * slot_count
+    data = []
+    offset = _header_struct.size + slot_count * _slot_struct.size
+    for key, value in items:
+        key_hash = _hash(key)
+        index = key_hash & (slot_count - 1)
+        while slots[index] is not None:
+            index = (index + 1) & (slot_count - 1)
+        slots[index] = (key_hash, offset, len(key), offset + len(key), len(value))
+        data.extend((key, value))
+        offset += len(key) + len(value)
+
+    chunks = [_header_struct.pack(_MAGIC, FORMAT_VERSION, slot_count, len(items))]
+    chunks.extend(_slot_struct.pack(*(slot or (0, 0, 0, 0, 0))) for slot in slots)
+    chunks.extend(data)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b''.join(chunks))
+        if sys.platform == 'win32' and os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+    except EnvironmentError:
+        os.remove(tmp_path)
+        raise
+
+
+class StringTable(object):
+    """
+    Read-only mapping of strings stored in a file written by write_string_table. The file is
+    memory-mapped, so its pages are shared by all processes using it, and values are decoded
+    only when they are looked up.
+    """
+
+    __slots__ = ('_map', '_slot_mask', '_size')
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (mmap.error, ValueError) as e:  # ValueError: empty file
+                raise StringTableError('Could not map {0}: {1}'.format(path, e))
+
+        try:
+            self._slot_mask = self._check_header(path)
+        except StringTableError:
+            self._map.close()
+            raise
+
+    def _check_header(self, path):
+        # Return the slot mask of a valid table, raise StringTableError otherwise
+        if len(self._map) < _header_struct.size:
+            raise StringTableError('{0} is not a string table'.format(path))
+        magic, version, slot_count, self._size = _header_struct.unpack_from(self._map)
+        if magic != _MAGIC:
+            raise StringTableError('{0} is not a string table'.format(path))
+        if version != FORMAT_VERSION:
+            raise StringTableError('String table {0} has format version {1}, but version {2} is required'.format(
+                path, version, FORMAT_VERSION))
+        if slot_count == 0 or slot_count & (slot_count - 1):
+            raise StringTableError('String table {0} has invalid slot count {1}'.format(path, slot_count))
+        if len(self._map) < _header_struct.size + slot_count * _slot_struct.size:
+            raise StringTableError('String table {0} is truncated'.format(path))
+        return slot_count - 1
+
+    def _read_slot(self, index):
+        slot = _slot_struct.unpack_from(self._map, _header_struct.size + index * _slot_struct.size)
+        if slot[1] != 0 and (slot[1] + slot[2] > len(self._map) or slot[3] + slot[4] > len(self._map)):
+            raise StringTableError('String table is corrupted, slot {0} points past its end'.format(index))
+        return slot
+
+    def _find(self, key):
+        # Return the slot of the given key, or None if it is missing
+        key = key.encode('UTF-8')
+        key_hash = _hash(key)
+        index = key_hash & self._slot_mask
+        # Tables written by write_string_table always have empty slots, corrupted ones may have none
+        for _ in xrange(self._slot_mask + 1):
+            slot = self._read_slot(index)
+            if slot[1] == 0:
+                return None
+            if slot[0] == key_hash and self._map[slot[1]:slot[1] + slot[2]] == key:
+                return slot
+            index = (index + 1) & self._slot_mask
+        return None
+
+    def get(self, key, default=None):
+        slot = self._find(key)
+        if slot is None:
+            return default
+        return self._map[slot[3]:slot[3] + slot[4]].decode('UTF-8')
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __len__(self):
+        return self._size
+
+    def iteritems(self):
+        for index in xrange(self._slot_mask + 1):
+            slot = self._read_slot(index)
+            if slot[1] != 0:
+                key = self._map[slot[1]:slot[1] + slot[2]].decode('UTF-8')
+                yield key, self._map[slot[3]:slot[3] + slot[4]].decode('UTF-8')
+
+    def __iter__(self):
+        return (key for key, _ in self.iteritems())
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self)
+
+    def close(self):
+        self._map.close()
+
+
+class TableEntity(CompiledEntity):
+    """
+    Entity consisting of a single string, which is read from a string table whenever it is needed.
+    """
+
+    __slots__ = ('_table',)
+
+    def __init__(self, name, table):
+        self._name = name
+        self._attrs = {}
+        self._table = table
+
+    _content = property(lambda self: CompiledString(self._table[self._name]))
+
+    def populate_direct_queries(self, queries):
+        pass
+
+
+def use_string_table(l20n, table):
+    """
+    Serve direct queries of the given compiled translations from the given StringTable, which has to
+    hold their values (see write_string_table). Entities consisting only of strings are replaced with
+    entities reading them from the table, so that translations no longer keep the strings in memory.
+
+    Translations are modified in place, since entities refer to each other through the mapping of
+    entries. They are returned for convenience.
+    """
+    if len(table) != len(l20n.direct_queries):
+        raise StringTableError('String table does not match translations: it holds {0} strings instead of {1}'.format(
+            len(table), len(l20n.direct_queries)))
+    for query, value in l20n.direct_queries.iteritems():
+        if table.get(query) != value:
+            raise StringTableError('String table does not match translations: value of {0} differs'.format(query))
+
+    entries = l20n._entries
+    for name, entry in entries.items():
+        # Other entities may be accessed in other ways than resolving them, e.g. by items of their hashes
+        if type(entry) is CompiledEntity and not entry._attrs and entry._content.__class__ is CompiledString:
+            entries[name] = TableEntity(name, table)
+    l20n.direct_queries = table
+    return l20n
+
+
+def main():
+    if len(sys.argv) != 3:
+        sys.stderr.write('Usage: python -m yorbay.stringtable INPUT.l20n OUTPUT\n')
+        sys.exit(2)
+    write_string_table(sys.argv[2], build_from_path(sys.argv[1]).direct_queries)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,140 @@
 from __future__ import unicode_literals
 
-from collections import namedtuple
+import bisect
+import re
 
-Position = namedtuple('Position', ('line', 'column', 'origin'))
 
+class Origin(object):
+    """
+    Source which positions refer to. Its lines are found only when they are needed, e.g. to format an error.
+    """
+
+    def __init__(self, s, path):
+        self.source = s
+        self.path = path
+        self._lines = None
+        self._line_starts = None
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            self._lines = self.source.splitlines()
+        return self._lines
+
+    def locate(self, offset):
+        # Return line and column (both counting from zero) of the given offset
+        if self._line_starts is None:
+            self._line_starts = [0]
+            self._line_starts.extend(match.end() for match in re.finditer('\n', self.source))
+        line = bisect.bisect_right(self._line_starts, offset) - 1
+        return line, offset - self._line_starts[line]
+
+
+class Position(object):
+    """
+    Position in a source, with line and column counting from zero. Positions found by the parser
+    (see at_offset) hold only offsets, and their lines and columns are computed when they are accessed.
+    """
+
+    __slots__ = ('offset', 'origin', '_line', '_column')
+
+    def __init__(self, line, column, origin):
+        self.offset = None
+        self.origin = origin
+        self._line = line
+        self._column = column
+
+    @classmethod
+    def at_offset(cls, offset, origin):
+        pos = cls.__new__(cls)
+        pos.offset = offset
+        pos.origin = origin
+        pos._line = pos._column = None
+        return pos
+
+    def _locate(self):
+        self._line, self._column = self.origin.locate(self.offset)
+
+    @property
+    def line(self):
+        if self._line is None:
+            self._locate()
+        return self._line
+
+    @property
+    def column(self):
+        if self._column is None:
+            self._locate()
+        return self._column
+
+    # Positions used to be (line, column, origin) tuples, so they still behave like them
+
+    def _as_tuple(self):
+        return self.line, self.column, self.origin
+
+    def __len__(self):
+        return 3
+
+    def __iter__(self):
+        return iter(self._as_tuple())
+
+    def __getitem__(self, index):
+        return self._as_tuple()[index]
+
+    def __eq__(self, other):
+        if not isinstance(other, Position):
+            return NotImplemented
+        return self._as_tuple() == other._as_tuple()
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    def __hash__(self):
+        return hash(self._as_tuple())
+
+    def __repr__(self):
+        return 'Position(line={0!r}, column={1!r}, origin={2!r})'.format(*self._as_tuple())
+
+
+class Excerpt(object):
+    """
+    Part of a source kept as offsets into it, so that excerpts share the source instead of copying their text.
+    """
+
+    __slots__ = ('source', 'start', 'end')
+
+    def __init__(self, source, start, end):
+        self.source = source
+        self.start = start
+        self.end = end
+
+    @property
+    def text(self):
+        return self.source[self.start:self.end]
+
+
+# Nodes of the syntax tree. Their positions (pos) are set only by the debug parser.
 
 class L20n(object):
+    __slots__ = ('body', 'offsets', 'pos')
+
     def __init__(self, body):
         self.body = body
+        # Offsets of entries of the body in the parsed source, if known
+        self.offsets = None
 
 
 class Identifier(object):
+    __slots__ = ('name', 'pos')
+
     def __init__(self, name):
         self.name = name
 
 
 class Macro(object):
+    __slots__ = ('id', 'args', 'expression', 'pos')
+
     def __init__(self, id, args, expression):
         self.id = id
         self.args = args
@@ -23,26 +142,36 @@ class Macro(object):
 
 
 class Variable(object):
+    __slots__ = ('id', 'pos')
+
     def __init__(self, id):
         self.id = id
 
 
 class GlobalsExpression(object):
+    __slots__ = ('id', 'pos')
+
     def __init__(self, id):
         self.id = id
 
 
 class Comment(object):
+    __slots__ = ('content', 'pos')
+
     def __init__(self, content):
         self.content = content
 
 
 class ImportStatement(object):
+    __slots__ = ('uri', 'pos')
+
     def __init__(self, uri):
         self.uri = uri
 
 
 class Entity(object):
+    __slots__ = ('id', 'value', 'index', 'attrs', 'local', 'pos')
+
     def __init__(self, id, value, index, attrs, local=None):
         self.id = id
         self.value = value
@@ -52,6 +181,8 @@ class Entity(object):
 
 
 class Attribute(object):
+    __slots__ = ('key', 'value', 'index', 'local', 'pos')
+
     def __init__(self, key, value, index, local=None):
         self.key = key
         self.value = value
@@ -60,6 +191,8 @@ class Attribute(object):
 
 
 class HashItem(object):
+    __slots__ = ('key', 'value', 'default', 'pos')
+
     def __init__(self, key, value, default):
         self.key = key
         self.value = value
@@ -67,11 +200,15 @@ class HashItem(object):
 
 
 class Hash(object):
+    __slots__ = ('content', 'pos')
+
     def __init__(self, content):
         self.content = content
 
 
 class ConditionalExpression(object):
+    __slots__ = ('test', 'consequent', 'alternate', 'pos')
+
     def __init__(self, test, consequent, alternate):
         self.test = test
         self.consequent = consequent
@@ -79,6 +216,8 @@ class ConditionalExpression(object):
 
 
 class LogicalExpression(object):
+    __slots__ = ('operator', 'left', 'right', 'pos')
+
     def __init__(self, operator, left, right):
         self.operator = operator
         self.left = left
@@ -86,6 +225,8 @@ class LogicalExpression(object):
 
 
 class BinaryExpression(object):
+    __slots__ = ('operator', 'left', 'right', 'pos')
+
     def __init__(self, operator, left, right):
         self.operator = operator
         self.left = left
@@ -93,32 +234,44 @@ class BinaryExpression(object):
 
 
 class LogicalOperator(object):
+    __slots__ = ('token', 'pos')
+
     def __init__(self, token):
         self.token = token
 
 
 class BinaryOperator(object):
+    __slots__ = ('token', 'pos')
+
     def __init__(self, token):
         self.token = token
 
 
 class UnaryExpression(object):
+    __slots__ = ('operator', 'argument', 'pos')
+
     def __init__(self, operator, argument):
         self.operator = operator
         self.argument = argument
 
 
 class UnaryOperator(object):
+    __slots__ = ('token', 'pos')
+
     def __init__(self, token):
         self.token = token
 
 
 class ParenthesisExpression(object):
+    __slots__ = ('expression', 'pos')
+
     def __init__(self, expression):
         self.expression = expression
 
 
 class PropertyExpression(object):
+    __slots__ = ('expression', 'property', 'computed', 'pos')
+
     def __init__(self, expression, property, computed):
         self.expression = expression
         self.property = property
@@ -126,6 +279,8 @@ class PropertyExpression(object):
 
 
 class AttributeExpression(object):
+    __slots__ = ('expression', 'attribute', 'computed', 'pos')
+
     def __init__(self, expression, attribute, computed):
         self.expression = expression
         self.attribute = attribute
@@ -133,27 +288,41 @@ class AttributeExpression(object):
 
 
 class ThisExpression(object):
+    __slots__ = ('pos',)
+
     def __init__(self):
         pass
 
 
 class CallExpression(object):
+    __slots__ = ('callee', 'arguments', 'pos')
+
     def __init__(self, callee, arguments):
         self.callee = callee
         self.arguments = arguments
 
 
 class Number(object):
+    __slots__ = ('value', 'pos')
+
     def __init__(self, value):
         self.value = value
 
 
 class String(object):
+    __slots__ = ('content', 'pos')
+
     def __init__(self, content):
         self.content = content
 
 
 class ComplexString(object):
+    __slots__ = ('content', 'excerpt', 'pos')
+
     def __init__(self, content, source):
         self.content = content
-        self.source = source
+        self.excerpt = source if isinstance(source, Excerpt) else Excerpt(source, 0, len(source))
+
+    @property
+    def source(self):
+        return self.excerpt.text